@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+import threading
+
+
+class AdmissionController:
+    """
+    Bounds how many messages are being analysed at the same time.
+    A request is let in only if all of its messages fit, otherwise the
+    caller should spill it or answer 429 with a Retry-After.
+    """
+
+    def __init__(self, max_in_flight: int = 2000):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.admitted = 0
+
+    def has_room(self, count: int = 1) -> bool:
+        # A request bigger than the limit still gets in when nothing else
+        # is running, or it could never be sent at all
+        return self.in_flight == 0 or self.in_flight + count <= self.max_in_flight
+
+    def try_acquire(self, count: int = 1) -> bool:
+        if not self.has_room(count):
+            return False
+        self.in_flight += count
+        self.admitted += count
+        return True
+
+    def release(self, count: int = 1):
+        self.in_flight = max(0, self.in_flight - count)
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+        }
+
+
+class SpillQueue:
+    """
+    Messages that came in while the server was busy, in a SQLite file,
+    oldest first. They are read back with peek() and only deleted with
+    ack() once they were analysed, so a crash or restart doesn't lose them.
+    """
+
+    def __init__(self, path: str, max_messages: int = 1_000_000):
+        self.path = path
+        self.max_messages = max_messages
+        self.spilled = 0
+        self.full = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS spill (id INTEGER PRIMARY KEY, stream_id TEXT, message TEXT)")
+        self._conn.commit()
+        # Left over from the last run, if it stopped before draining
+        self.size = self._conn.execute("SELECT COUNT(*) FROM spill").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def push(self, items: list) -> bool:
+        """
+        Stores [(stream_id, message dict)]. False (and nothing stored)
+        if they don't all fit.
+        """
+        with self._lock:
+            if self.size + len(items) > self.max_messages:
+                self.full += len(items)
+                return False
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO spill (stream_id, message) VALUES (?, ?)",
+                    [(stream_id, json.dumps(message)) for stream_id, message in items],
+                )
+            self.size += len(items)
+            self.spilled += len(items)
+            return True
+
+    def peek(self, limit: int) -> list:
+        """
+        The oldest [(id, stream_id, message dict)], without removing them.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, stream_id, message FROM spill ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, stream_id, json.loads(message)) for row_id, stream_id, message in rows]
+
+    def ack(self, last_id: int):
+        """
+        Removes everything up to and including `last_id`.
+        """
+        with self._lock:
+            with self._conn:
+                removed = self._conn.execute("DELETE FROM spill WHERE id <= ?", (last_id,)).rowcount
+            self.size = max(0, self.size - removed)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "max_messages": self.max_messages,
+            "spilled": self.spilled,
+            "full": self.full,
+        }
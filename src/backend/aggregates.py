@@ -0,0 +1,226 @@
+import heapq
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from backend.sampling import WeightedMean, weighted_summary
+
+# name -> (bucket length in seconds, number of buckets kept)
+SERIES_RESOLUTIONS = {
+    "10s": (10, 360),  # last hour
+    "1m": (60, 360),   # last 6 hours
+    "5m": (300, 288),  # last 24 hours
+}
+TOP_TOXIC_AUTHORS = 10
+# A near-duplicate cluster with this many messages is a spam wave
+SPAM_WAVE_MIN_SIZE = 5
+TOP_SPAM_WAVES = 5
+
+
+class TimeSeries:
+    """
+    Fixed-size ring buffer of time buckets.
+    Adding a message touches one bucket, old buckets are overwritten.
+    """
+
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        self.bucket_ids = [-1] * size
+        self.counts = [0] * size
+        self.sentiment_sums = [0.0] * size
+        self.sentiment_counts = [0] * size
+        self.toxic_counts = [0] * size
+
+    def add(self, when: float, sentiment_score, is_toxic: bool, weight: float = 1):
+        # Counts are exact, sentiment and toxic counts are weighted
+        # estimates when messages were sampled (see backend/sampling.py)
+        bucket_id = int(when // self.resolution)
+        i = bucket_id % self.size
+        if self.bucket_ids[i] != bucket_id:
+            # This slot still holds a bucket from one lap ago
+            self.bucket_ids[i] = bucket_id
+            self.counts[i] = 0
+            self.sentiment_sums[i] = 0.0
+            self.sentiment_counts[i] = 0
+            self.toxic_counts[i] = 0
+
+        self.counts[i] += 1
+        self.toxic_counts[i] += weight * is_toxic
+        if sentiment_score is not None:
+            self.sentiment_sums[i] += weight * sentiment_score
+            self.sentiment_counts[i] += weight
+
+    def points(self, now: float = None) -> list: # type: ignore
+        """
+        The buckets still inside the window, oldest first.
+        """
+        newest = int((now or time.time()) // self.resolution)
+        oldest = newest - self.size + 1
+        points = []
+        for i in sorted(range(self.size), key=lambda i: self.bucket_ids[i]):
+            bucket_id = self.bucket_ids[i]
+            if bucket_id < oldest or bucket_id > newest:
+                continue
+            points.append({
+                "timestamp": datetime.fromtimestamp(bucket_id * self.resolution, tz=timezone.utc).isoformat(),
+                "count": self.counts[i],
+                "sentiment_score": (
+                    self.sentiment_sums[i] / self.sentiment_counts[i] if self.sentiment_counts[i] else None
+                ),
+                "toxic_count": self.toxic_counts[i],
+            })
+        return points
+
+
+class TopK:
+    """
+    Space-Saving heavy hitters: keeps at most `capacity` counters, so memory
+    stays bounded however many authors there are. Counts of the top entries
+    are exact unless the capacity is much smaller than the number of authors.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key, count: int = 1):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + count
+            return
+
+        # Replace the smallest counter, the new key inherits its count
+        smallest = min(self.counts, key=self.counts.get) # type: ignore
+        self.counts[key] = self.counts.pop(smallest) + count
+
+    def top(self, k: int) -> list:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class SpamWaves:
+    """
+    Near-duplicate clusters of one stream (see backend/dedup.py), counted
+    from the cluster_id of each row. A cluster is a spam wave once it has
+    `min_size` messages. At most `capacity` clusters are kept, the ones
+    nobody posted to for the longest go first.
+    """
+
+    def __init__(self, min_size: int = SPAM_WAVE_MIN_SIZE, capacity: int = 5000):
+        self.min_size = min_size
+        self.capacity = capacity
+        # cluster_id -> [size, first seen, last seen, first message, toxic count]
+        self.clusters = OrderedDict()
+        self.waves = 0
+        self.messages = 0 # in waves, including the ones before it became one
+
+    def add(self, row: dict, when: float, is_toxic: bool):
+        cluster_id = row.get("cluster_id")
+        if not cluster_id:
+            return
+
+        entry = self.clusters.get(cluster_id)
+        if entry is None:
+            entry = self.clusters[cluster_id] = [0, when, when, row.get("original_message"), 0]
+            if len(self.clusters) > self.capacity:
+                self.clusters.popitem(last=False)
+        else:
+            self.clusters.move_to_end(cluster_id)
+
+        entry[0] += 1
+        entry[2] = when
+        entry[4] += is_toxic
+        if entry[0] == self.min_size:
+            self.waves += 1
+            self.messages += self.min_size
+        elif entry[0] > self.min_size:
+            self.messages += 1
+
+    def snapshot(self) -> dict:
+        waves = [(cluster_id, entry) for cluster_id, entry in self.clusters.items() if entry[0] >= self.min_size]
+        top = heapq.nlargest(TOP_SPAM_WAVES, waves, key=lambda item: item[1][0])
+        return {
+            "min_size": self.min_size,
+            "waves": self.waves,
+            "messages": self.messages,
+            "top": [
+                {
+                    "cluster_id": cluster_id,
+                    "message": message,
+                    "size": size,
+                    "toxic": toxic,
+                    "first_seen": datetime.fromtimestamp(first_seen, tz=timezone.utc).isoformat(),
+                    "last_seen": datetime.fromtimestamp(last_seen, tz=timezone.utc).isoformat(),
+                }
+                for cluster_id, (size, first_seen, last_seen, message, toxic) in top
+            ],
+        }
+
+
+class StreamAggregates:
+    """
+    Running totals for one stream, updated as each message is analysed,
+    so /stats never has to look at the raw rows.
+
+    Under load shedding only a sample of the messages has scores, each
+    with its sample_weight. Average sentiment and toxicity are then
+    weighted estimates, with 95% confidence intervals.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.total_messages = 0
+        self.sentiment = WeightedMean()
+        self.toxicity = WeightedMean() # 1 per toxic message, 0 otherwise
+        self.skipped = 0 # left out of the sample, no scores
+        self.errors = 0
+        self.series = {name: TimeSeries(*spec) for name, spec in SERIES_RESOLUTIONS.items()}
+        self.toxic_authors = TopK()
+        self.spam_waves = SpamWaves()
+
+    def add(self, row: dict, when: float = None): # type: ignore
+        when = when or time.time()
+        sentiment_score = row.get("sentiment_score")
+        if not isinstance(sentiment_score, (int, float)) or math.isnan(sentiment_score):
+            sentiment_score = None
+        # Same rule as the dashboard always used
+        is_toxic = row.get("toxicity_label") == "TOXIC"
+        weight = row.get("sample_weight")
+        if weight is None or math.isnan(weight):
+            weight = 1
+
+        self.total_messages += 1
+        if weight == 0:
+            self.skipped += 1
+        else:
+            if sentiment_score is not None:
+                self.sentiment.add(sentiment_score, weight)
+            if row.get("toxicity_label") is not None:
+                self.toxicity.add(is_toxic, weight)
+        if is_toxic:
+            self.toxic_authors.add(row.get("author"))
+        if row.get("error") and row.get("error") != "Empty message":
+            self.errors += 1
+
+        for series in self.series.values():
+            series.add(when, sentiment_score, is_toxic, weight)
+        self.spam_waves.add(row, when, is_toxic)
+
+    def snapshot(self, max_points: int = None) -> dict: # type: ignore
+        """
+        All the running numbers. With `max_points` only the newest buckets
+        of each time series are included (enough for a live update).
+        """
+        now = time.time()
+        return {
+            "total_messages": self.total_messages,
+            **weighted_summary(self.sentiment, self.toxicity, self.skipped, self.total_messages),
+            "errors": self.errors,
+            "started_at": datetime.fromtimestamp(self.started_at, tz=timezone.utc).isoformat(),
+            "series": {
+                name: series.points(now)[-max_points:] if max_points else series.points(now)
+                for name, series in self.series.items()
+            },
+            "top_toxic_authors": self.toxic_authors.top(TOP_TOXIC_AUTHORS),
+            "spam_waves": self.spam_waves.snapshot(),
+        }
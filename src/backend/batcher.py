@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from backend.model import analyse_messages
+
+log = logging.getLogger(__name__)
+
+
+async def _analyse_in_thread(texts: list, prepared=None) -> list:
+    # The pipelines are blocking, so keep them off the event loop
+    return await asyncio.to_thread(analyse_messages, texts, None, prepared)
+
+
+class FairQueue:
+    """
+    One FIFO per key (a stream), served round robin: every key with
+    waiting messages gets one taken before any key gets a second.
+    A busy stream can't starve the quiet ones.
+
+    Priority items have a lane of their own (also round robin), and
+    every one of them is taken before any normal item.
+    """
+
+    def __init__(self):
+        self._lanes = (OrderedDict(), OrderedDict()) # high, normal
+        self._size = 0
+        self._priority_size = 0
+        self._not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def priority_qsize(self) -> int:
+        return self._priority_size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def sizes(self) -> dict:
+        sizes = {}
+        for queues in self._lanes:
+            for key, queue in queues.items():
+                sizes[key] = sizes.get(key, 0) + len(queue)
+        return sizes
+
+    def put_nowait(self, key, item, priority: bool = False):
+        queues = self._lanes[0 if priority else 1]
+        queue = queues.get(key)
+        if queue is None:
+            queue = queues[key] = deque()
+        queue.append(item)
+        self._size += 1
+        self._priority_size += priority
+        self._not_empty.set()
+
+    def get_nowait(self):
+        if not self._size:
+            raise asyncio.QueueEmpty
+        queues = self._lanes[0] if self._priority_size else self._lanes[1]
+        key, queue = next(iter(queues.items()))
+        item = queue.popleft()
+        self._size -= 1
+        self._priority_size -= queues is self._lanes[0]
+        if queue:
+            # Its next message waits until every other key had a turn
+            queues.move_to_end(key)
+        else:
+            del queues[key]
+        return item
+
+    async def get(self):
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+
+class InferenceBatcher:
+    """
+    Collects messages from many callers and analyses them together.
+
+    A batch is sent to the models as soon as it has `max_batch_size`
+    messages, or `max_wait_ms` after its first message arrived,
+    whichever comes first. Every caller gets its own result back.
+    Up to `concurrency` batches can be analysed at the same time.
+    Messages of different streams share the batches fairly (see FairQueue).
+
+    Priority messages go into the next batch before any other message,
+    and a batch holding one waits at most `priority_max_wait_ms` for more.
+    A forward pass that already started is not interrupted for them.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 50.0, runner=None, concurrency: int = 1,
+                 priority_max_wait_ms: float = 5.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.priority_max_wait = min(priority_max_wait_ms, max_wait_ms) / 1000.0
+        # runner(texts, prepared) -> awaitable list of analysis dicts,
+        # `prepared` is what each caller passed to submit() (or None)
+        self.runner = runner or _analyse_in_thread
+        self.concurrency = concurrency
+        self._queue = FairQueue()
+        self._task = None
+        self._slots = None
+        self._running = set()
+
+    def start(self):
+        if self._task is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._worker())
+            log.info(f"🧠 Inference batcher started (max {self.max_batch_size} msgs / {self.max_wait * 1000:.0f} ms).")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+        # Nobody is going to answer these any more
+        while not self._queue.empty():
+            _, future, *_ = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    def pending(self) -> dict:
+        """
+        Messages waiting for a batch, per stream.
+        """
+        return self._queue.sizes()
+
+    def pending_priority(self) -> int:
+        """
+        Priority messages waiting for a batch.
+        """
+        return self._queue.priority_qsize()
+
+    async def submit(self, text: str, stream=None, priority: bool = False, prepared=None) -> dict:
+        """
+        Queues one message of `stream` and waits for its analysis.
+        `prepared` goes to the runner with the text, e.g. its cleaned
+        version if the caller already has it.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(stream, (text, future, priority, prepared), priority)
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + (self.priority_max_wait if batch[0][2] else self.max_wait)
+
+        while len(batch) < self.max_batch_size:
+            # Take everything that is already waiting first
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            if batch[-1][2]:
+                # Don't keep a priority message waiting for the rest of the batch
+                deadline = min(deadline, loop.time() + self.priority_max_wait)
+
+        return batch
+
+    async def _worker(self):
+        while True:
+            # Wait for a free slot first, so the queue keeps
+            # filling up into a bigger batch while all slots are busy
+            await self._slots.acquire() # type: ignore
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release() # type: ignore
+                raise
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: list):
+        try:
+            # Callers that gave up don't need a forward pass
+            batch = [(text, future, prepared) for text, future, _, prepared in batch if not future.done()]
+            if not batch:
+                return
+
+            try:
+                results = await self.runner([text for text, _, _ in batch], [prepared for _, _, prepared in batch])
+            except Exception as e:
+                log.error(f"❌ Error during batch analysis: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # Only left over if we were cancelled half way
+            for _, future, *_ in batch:
+                if not future.done():
+                    future.cancel()
+            self._slots.release() # type: ignore
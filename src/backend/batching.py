@@ -0,0 +1,98 @@
+import bisect
+import threading
+
+
+# Texts are only batched with others of the same bucket (upper bounds, in
+# tokens), so a batch is padded to at most about twice its shortest
+# text. Most chat messages land in the first two.
+LENGTH_BUCKETS = (8, 16, 32, 64, 128, 256)
+
+
+def length_bucket(length: int, buckets=LENGTH_BUCKETS) -> int:
+    return bisect.bisect_left(buckets, length)
+
+def token_budget_batches(lengths: list, token_budget: int, buckets=LENGTH_BUCKETS) -> list:
+    """
+    Groups texts into forward passes by their token counts.
+
+    Texts are sorted by length and split at the length buckets, so each
+    batch holds texts of about the same size and little of it is padding.
+    A batch costs rows x longest text tokens, and grows until the next text
+    would take it over `token_budget` (a single text longer than the budget
+    still gets a batch of its own).
+    Returns lists of indices into `lengths`, shortest texts first.
+    """
+    batches = []
+    batch = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Sorted, so the newest text is the longest one in the batch
+        if batch and (
+            (len(batch) + 1) * lengths[i] > token_budget
+            or length_bucket(lengths[i], buckets) != length_bucket(lengths[batch[0]], buckets)
+        ):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class PaddingStats:
+    """
+    Real vs padded tokens per model: how much of each forward pass was
+    actual text. An efficiency of 1.0 means no padding at all.
+
+    Worker processes keep their own, drain() hands their counts to the
+    server's copy through merge().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models = {} # model -> [texts, batches, real tokens, padded tokens]
+
+    def add(self, model: str, lengths: list):
+        """
+        Counts one forward pass over texts of these token lengths.
+        """
+        padded = len(lengths) * max(lengths)
+        self.merge({model: [len(lengths), 1, sum(lengths), padded]})
+
+    def merge(self, counts: dict):
+        with self._lock:
+            for model, values in counts.items():
+                totals = self.models.setdefault(model, [0, 0, 0, 0])
+                for j, value in enumerate(values):
+                    totals[j] += value
+
+    def drain(self) -> dict:
+        """
+        Returns the counts so far and starts again from zero.
+        """
+        with self._lock:
+            counts, self.models = self.models, {}
+        return counts
+
+    def clear(self):
+        self.drain()
+
+    def efficiency(self) -> float:
+        with self._lock:
+            real = sum(values[2] for values in self.models.values())
+            padded = sum(values[3] for values in self.models.values())
+        return real / padded if padded else 1.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {model: list(values) for model, values in self.models.items()}
+        return {
+            model: {
+                "texts": texts,
+                "batches": batches,
+                "avg_batch_size": texts / batches if batches else 0.0,
+                "real_tokens": real,
+                "padded_tokens": padded,
+                "padding_efficiency": real / padded if padded else 1.0,
+            }
+            for model, (texts, batches, real, padded) in models.items()
+        }
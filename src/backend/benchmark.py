@@ -0,0 +1,373 @@
+"""
+Benchmarks the analysis hot path over the fixed chat corpus.
+
+Measures per-message latency of each stage, analysis throughput at
+different batch sizes and torch thread counts, saving and dashboard
+loading speed against the file size, and peak memory. Results are
+written as JSON and can be compared against a stored baseline.
+
+Run from the src/ folder:
+    python -m backend.benchmark --json bench.json
+    python -m backend.benchmark --save-baseline benchmark_baseline.json
+    python -m backend.benchmark --baseline benchmark_baseline.json
+
+Every metric is the best of --runs full runs. With --baseline the
+exit code is 1 if any metric got worse by more than --tolerance and by
+more than its own noise (how far its runs were apart), so it can gate a
+deployment. Only compare runs made on the same machine with the same
+settings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from backend.corpus import CHAT_CORPUS
+from backend.dedup import NearDuplicateIndex
+from backend.negative_word import detect_negative_words
+from backend import model
+from backend.records import RecordBatch, RecordBuffer
+from backend.storage import IncrementalReader, open_store
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+BATCH_SIZES = (1, 8, 32, 64)
+THREAD_COUNTS = (1, 2, 4)
+FILE_SIZES = (1000, 10000, 100000)
+SAVE_BATCH_ROWS = 500
+# Full runs per report, each metric is the best of them
+RUNS = 3
+# Relative change that counts as a regression (if it is also bigger than
+# the metric's run-to-run noise). Separate runs of the same code on one
+# machine differ by up to ~50% on short stages, a 2x slowdown never does.
+TOLERANCE = 0.5
+# A dashboard load is timed this many times per run, the fastest counts
+LOAD_REPEATS = 3
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "p50": samples[n // 2],
+        "p95": samples[min(n - 1, int(n * 0.95))],
+        "p99": samples[min(n - 1, int(n * 0.99))],
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name: str, value, unit: str, better: str = "lower"):
+        if value is not None:
+            self.metrics[name] = {"value": value, "unit": unit, "better": better}
+
+    def add_latencies(self, name: str, samples_ns: list):
+        for key, value in percentiles(samples_ns).items():
+            self.add(f"{name}.{key}_us", value / 1000, "us")
+
+    def add_rss(self, section: str):
+        self.add(f"peak_rss.after_{section}", peak_rss_mb(), "MB")
+
+
+def best_metrics(runs: list) -> dict:
+    """
+    One metric dict out of the `metrics` of several runs: the best value
+    of each (noise only ever makes a run slower), with every run's value
+    kept under "runs".
+    """
+    merged = {}
+    for name, metric in runs[0].items():
+        values = [run[name]["value"] for run in runs if name in run]
+        best = max(values) if metric["better"] == "higher" else min(values)
+        merged[name] = {**metric, "value": best, "runs": values}
+    return merged
+
+
+def time_each(fn, inputs: list, repeat: int, before=None) -> list:
+    """
+    Nanoseconds per call of fn(x), for every x in inputs, `repeat` times.
+    """
+    for x in inputs: # warm-up
+        fn(x)
+    samples = []
+    for _ in range(repeat):
+        for x in inputs:
+            if before is not None:
+                before()
+            started = time.perf_counter_ns()
+            fn(x)
+            samples.append(time.perf_counter_ns() - started)
+    return samples
+
+
+def _clear_caches():
+    # Both would answer repeats of the corpus without the models
+    model.result_cache.clear()
+    model.near_duplicates.clear()
+
+
+def bench_text_stages(results: Results, repeat: int):
+    cleaned = [model.clean_text(text) for text in CHAT_CORPUS]
+    results.add_latencies("clean_text", time_each(model.clean_text, CHAT_CORPUS, repeat))
+    # The lexicon is matched on the raw message
+    results.add_latencies("detect_negative_words", time_each(detect_negative_words, CHAT_CORPUS, repeat))
+    index = NearDuplicateIndex()
+    results.add_latencies("near_duplicates.assign", time_each(index.assign, cleaned, repeat))
+    results.add_rss("text_stages")
+
+
+def bench_models(results: Results, repeat: int, batch_sizes, thread_counts):
+    import torch
+
+    # Cold: every message goes through the models, as on a new stream.
+    # Warm: repeated messages come from the result cache, as in a busy chat.
+    results.add_latencies(
+        "analyse_message.cold",
+        time_each(model.analyse_message, CHAT_CORPUS, repeat, before=_clear_caches),
+    )
+    results.add_latencies("analyse_message.warm", time_each(model.analyse_message, CHAT_CORPUS, repeat))
+
+    default_threads = torch.get_num_threads()
+    texts = CHAT_CORPUS * repeat
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+                model.analyse_messages(batches[0]) # warm-up
+                model.padding_stats.clear()
+                seconds = 0.0
+                for batch in batches:
+                    _clear_caches()
+                    started = time.perf_counter()
+                    model.analyse_messages(batch)
+                    seconds += time.perf_counter() - started
+                results.add(
+                    f"analyse_messages.batch{batch_size}.threads{threads}.msgs_per_s",
+                    len(texts) / seconds, "msgs/s", better="higher",
+                )
+                results.add(
+                    f"analyse_messages.batch{batch_size}.threads{threads}.padding_efficiency",
+                    model.padding_stats.efficiency(), "ratio", better="higher",
+                )
+    finally:
+        torch.set_num_threads(default_threads)
+        _clear_caches()
+    results.add_rss("models")
+
+
+def _rows(n: int) -> list:
+    # Saved rows as chat.py writes them, without needing the models
+    now = time.time()
+    rows = []
+    for i in range(n):
+        text = CHAT_CORPUS[i % len(CHAT_CORPUS)]
+        rows.append({
+            "timestamp": datetime.fromtimestamp(now + i / 100, tz=timezone.utc).isoformat(),
+            "author": f"viewer{i % 500}",
+            "original_message": text,
+            "cleaned_message": model.clean_text(text),
+            "sentiment_label": "POSITIVE" if i % 3 else "NEGATIVE",
+            "sentiment_score": 0.5 if i % 3 else -0.5,
+            "toxicity_label": "TOXIC" if i % 7 == 0 else "NOT_TOXIC",
+            "toxicity_score": 0.9 if i % 7 == 0 else 0.1,
+            "error": None,
+            "message_id": f"m{i}",
+            "published_at": None,
+        })
+    return rows
+
+
+def bench_storage(results: Results, workdir: str, file_sizes, extensions=(".csv", ".db")):
+    for extension in extensions:
+        backend = extension.lstrip(".")
+
+        # batch_saver: one append per save interval
+        path = os.path.join(workdir, f"save{extension}")
+        store = open_store(path)
+        batches = [RecordBatch.from_rows(_rows(SAVE_BATCH_ROWS)) for _ in range(20)]
+        samples = []
+        for batch in batches:
+            started = time.perf_counter_ns()
+            asyncio.run(store.append(batch))
+            samples.append(time.perf_counter_ns() - started)
+        results.add(f"batch_saver.{backend}.rows_per_s", SAVE_BATCH_ROWS * len(batches) / (sum(samples) / 1e9), "rows/s", better="higher")
+        results.add(f"batch_saver.{backend}.append_{SAVE_BATCH_ROWS}.p50_ms", percentiles(samples)["p50"] / 1e6, "ms")
+
+        # Memory of one save interval: rows buffered as they are analysed, then saved
+        rows = _rows(SAVE_BATCH_ROWS * 10)
+        buffer = RecordBuffer(capacity=len(rows))
+        tracemalloc.start()
+        for row in rows:
+            buffer.append(dict(row))
+        asyncio.run(store.append(buffer.drain()))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        store.close()
+        results.add(f"batch_saver.{backend}.buffer_{len(rows)}.peak_mb", peak / (1024 * 1024), "MB")
+
+        # load_data: the dashboard's first load, then one refresh after new rows
+        for size in file_sizes:
+            path = os.path.join(workdir, f"load_{size}{extension}")
+            store = open_store(path)
+            asyncio.run(store.append(RecordBatch.from_rows(_rows(size))))
+
+            cold = None
+            for _ in range(LOAD_REPEATS):
+                reader = IncrementalReader(path)
+                started = time.perf_counter()
+                frame = reader.read()
+                elapsed = time.perf_counter() - started
+                cold = elapsed if cold is None else min(cold, elapsed)
+                assert len(frame) == size
+
+            asyncio.run(store.append(RecordBatch.from_rows(_rows(100))))
+            started = time.perf_counter()
+            reader.read()
+            incremental = time.perf_counter() - started
+            store.close()
+
+            results.add(f"load_data.{backend}.{size}_rows.cold_ms", cold * 1000, "ms")
+            results.add(f"load_data.{backend}.{size}_rows.refresh_ms", incremental * 1000, "ms")
+        results.add_rss(f"storage_{backend}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(repeat: int = 20, with_models: bool = True, batch_sizes=BATCH_SIZES,
+        thread_counts=THREAD_COUNTS, file_sizes=FILE_SIZES, runs: int = RUNS) -> dict:
+    meta = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus_messages": len(CHAT_CORPUS),
+        "repeat": repeat,
+        "runs": runs,
+        "optimised_cpu_mode": model.OPTIMISED_CPU_MODE,
+        "inference_token_budget": model.INFERENCE_TOKEN_BUDGET,
+        "torch_num_threads": model.TORCH_NUM_THREADS,
+        "models": False,
+    }
+
+    if with_models:
+        try:
+            model.load_models()
+            meta["models"] = True
+        except Exception as e:
+            print(f"⚠️ Could not load the models, skipping the model benchmarks: {e}")
+
+    all_runs = []
+    for _ in range(max(1, runs)):
+        results = Results()
+        bench_text_stages(results, repeat)
+        if meta["models"]:
+            bench_models(results, max(1, repeat // 4), batch_sizes, thread_counts)
+
+        # Fresh files every run, so later runs don't append to bigger ones
+        workdir = tempfile.mkdtemp(prefix="chat_bench_")
+        try:
+            bench_storage(results, workdir, file_sizes)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        all_runs.append(results.metrics)
+
+    return {"meta": meta, "metrics": best_metrics(all_runs)}
+
+
+def noise(metric: dict) -> float:
+    """
+    How far apart the runs of a metric were: changes smaller than that
+    can't be told apart from noise.
+    """
+    runs = metric.get("runs") or [metric["value"]]
+    return max(runs) - min(runs)
+
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    """
+    (name, baseline value, new value, relative change, verdict) for every
+    metric in both runs. Positive change is always "worse".
+    A change within the run-to-run noise of either report is always "same".
+    """
+    rows = []
+    for name, metric in report["metrics"].items():
+        old = baseline.get("metrics", {}).get(name)
+        if old is None or not old["value"]:
+            continue
+        change = (metric["value"] - old["value"]) / old["value"]
+        if metric["better"] == "higher":
+            change = -change
+        if abs(metric["value"] - old["value"]) <= max(noise(metric), noise(old)):
+            verdict = "same"
+        else:
+            verdict = "regression" if change > tolerance else "improved" if change < -tolerance else "same"
+        rows.append((name, old["value"], metric["value"], change, verdict))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis hot path.")
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the corpus per stage")
+    parser.add_argument("--runs", type=int, default=RUNS, help="Full runs, every metric is the best of them")
+    parser.add_argument("--no-models", action="store_true", help="Skip the benchmarks that need the NLP models")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(BATCH_SIZES))
+    parser.add_argument("--threads", type=int, nargs="+", default=list(THREAD_COUNTS))
+    parser.add_argument("--file-sizes", type=int, nargs="+", default=list(FILE_SIZES), help="Rows in the files loaded like the dashboard does")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--save-baseline", help="Write the results to this file as the new baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.repeat, not args.no_models, args.batch_sizes, args.threads, args.file_sizes, args.runs)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=4)
+
+    for name, metric in report["metrics"].items():
+        print(f"⏱️ {name:<55} {metric['value']:>12.2f} {metric['unit']}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        regressions = [row for row in rows if row[4] == "regression"]
+        print(f"\n📏 Compared with {args.baseline} (commit {baseline.get('meta', {}).get('commit')}), tolerance {args.tolerance:.0%}:")
+        for name, old, new, change, verdict in rows:
+            if verdict == "regression":
+                print(f"   🔴 {name}: {old:.2f} -> {new:.2f} ({change:.0%} worse)")
+            elif verdict == "improved":
+                print(f"   🟢 {name}: {old:.2f} -> {new:.2f} ({-change:.0%} better)")
+        print(f"{'❌' if regressions else '✅'} {len(regressions)} regressions in {len(rows)} metrics.")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    A small thread-safe LRU cache with a time-to-live.
+
+    Used to remember model scores for chat messages we have already seen
+    ("W", "LOL", copypasta...). Keys are cleaned message texts.
+    A capacity of 0 turns the cache off.
+    """
+
+    def __init__(self, capacity: int = 50000, ttl_seconds: float = 3600.0):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict() # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Returns the cached value, or None if it is missing or too old.
+        """
+        if self.capacity <= 0:
+            return None
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "capacity": self.capacity,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,153 @@
+import os
+import threading
+
+import emoji
+
+# --- Cascade settings ---
+# Off by default: every message goes to the transformer models
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "0").lower() in ("1", "true", "yes")
+# A lexical guess below this confidence still goes to the models
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.9))
+# Only messages up to this many words are looked at by the lexical rules
+CASCADE_MAX_WORDS = int(os.getenv("CASCADE_MAX_WORDS", 3))
+
+# Chat tokens we can label without a model: (sentiment_label, sentiment_score, confidence)
+CHAT_TOKENS = {
+    "w": ("POSITIVE", 0.9, 0.95),
+    "dub": ("POSITIVE", 0.9, 0.9),
+    "l": ("NEGATIVE", -0.8, 0.9),
+    "lol": ("POSITIVE", 0.7, 0.9),
+    "lmao": ("POSITIVE", 0.7, 0.9),
+    "lmfao": ("POSITIVE", 0.7, 0.9),
+    "rofl": ("POSITIVE", 0.7, 0.9),
+    "kekw": ("POSITIVE", 0.7, 0.9),
+    "gg": ("POSITIVE", 0.8, 0.9),
+    "ggwp": ("POSITIVE", 0.8, 0.9),
+    "pog": ("POSITIVE", 0.9, 0.95),
+    "poggers": ("POSITIVE", 0.9, 0.95),
+    "pogchamp": ("POSITIVE", 0.9, 0.95),
+    "nice": ("POSITIVE", 0.8, 0.9),
+    "love": ("POSITIVE", 0.9, 0.9),
+    "first": ("NEUTRAL", 0.0, 0.95),
+    "hi": ("NEUTRAL", 0.0, 0.95),
+    "hello": ("NEUTRAL", 0.0, 0.95),
+    "hey": ("NEUTRAL", 0.0, 0.95),
+    "ok": ("NEUTRAL", 0.0, 0.9),
+    "yes": ("NEUTRAL", 0.0, 0.9),
+    "no": ("NEUTRAL", 0.0, 0.9),
+    "f": ("NEUTRAL", 0.0, 0.9),
+}
+
+# Parts of emoji names (as in emoji.demojize) that carry a clear sentiment.
+# Negative parts are checked first, so "broken_heart" is not read as "heart".
+NEGATIVE_EMOJI_PARTS = (
+    "angry", "enraged", "pouting", "cursing", "thumbs_down", "broken_heart",
+    "vomiting", "nauseated", "middle_finger", "pile_of_poo", "unamused",
+    "disappointed", "clown",
+)
+POSITIVE_EMOJI_PARTS = (
+    "heart", "joy", "smil", "grin", "laugh", "thumbs_up", "fire", "clapping",
+    "party", "star", "hundred_points", "kiss", "sparkl", "trophy", "flexed",
+    "ok_hand", "raising_hands", "folded_hands", "rolling_on_the_floor",
+)
+# Sentiment score given to a message where every emoji agrees
+EMOTE_SCORE = 0.9
+# Messages with these emoji are not pre-screened as toxicity needs the model
+TOXIC_EMOJI_PARTS = ("middle_finger", "pile_of_poo", "clown")
+
+
+class CascadeStats:
+    """
+    Counts how many messages each tier of the cascade answered.
+    "cluster" are near-duplicates that got the scores of their cluster's
+    first message.
+    """
+
+    TIERS = ("lexical", "cache", "cluster", "transformer")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.TIERS, 0)
+
+    def add(self, tier: str, count: int = 1):
+        if count:
+            with self._lock:
+                self.counts[tier] += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {
+            "enabled": CASCADE_ENABLED,
+            "min_confidence": CASCADE_MIN_CONFIDENCE,
+            "counts": counts,
+            "shares": {tier: (n / total if total else 0.0) for tier, n in counts.items()},
+        }
+
+cascade_stats = CascadeStats()
+
+
+def _emoji_polarity(name: str) -> int:
+    if any(part in name for part in NEGATIVE_EMOJI_PARTS):
+        return -1
+    if any(part in name for part in POSITIVE_EMOJI_PARTS):
+        return 1
+    return 0
+
+def _screen_emotes(raw_message: str):
+    """
+    Messages that are only emoji get their sentiment from the emoji names.
+    """
+    if raw_message.isascii():
+        return None
+
+    found = emoji.emoji_list(raw_message)
+    if not found or emoji.replace_emoji(raw_message, replace="").strip():
+        return None
+
+    names = [emoji.EMOJI_DATA.get(e["emoji"], {}).get("en", "") for e in found]
+    if any(part in name for name in names for part in TOXIC_EMOJI_PARTS):
+        return None
+
+    polarities = [_emoji_polarity(name) for name in names]
+    positive = polarities.count(1)
+    negative = polarities.count(-1)
+
+    # Confidence is the share of emoji that agree with the overall label
+    if positive > negative:
+        confidence = positive / len(polarities)
+        return ("POSITIVE", EMOTE_SCORE * confidence, 0.0), confidence
+    if negative > positive:
+        confidence = negative / len(polarities)
+        return ("NEGATIVE", -EMOTE_SCORE * confidence, 0.0), confidence
+    return None
+
+def _screen_words(cleaned_text: str, negative_hits: list):
+    # "w w w w" is the same as "w"
+    words = cleaned_text.split()
+    distinct = set(words)
+    if not distinct or len(distinct) > CASCADE_MAX_WORDS:
+        return None
+
+    # Nothing but insults, e.g. "trash" or "idiot noob"
+    if negative_hits and distinct <= set(negative_hits):
+        return ("NEGATIVE", -0.9, 0.85), 0.9
+
+    if len(distinct) == 1 and words[0] in CHAT_TOKENS:
+        sentiment_label, sentiment_score, confidence = CHAT_TOKENS[words[0]]
+        return (sentiment_label, sentiment_score, 0.0), confidence
+    return None
+
+def prescreen(raw_message: str, cleaned_text: str, negative_hits: list):
+    """
+    The cheap first tier of the cascade.
+    Returns (sentiment_label, sentiment_score, toxicity_score), the same as
+    the models would, or None if the message needs the transformer models.
+    """
+    guess = _screen_emotes(raw_message) or _screen_words(cleaned_text, negative_hits)
+    if guess is None:
+        return None
+
+    score, confidence = guess
+    return score if confidence >= CASCADE_MIN_CONFIDENCE else None
@@ -0,0 +1,140 @@
+import json
+import os
+
+# A fixed set of live chat messages, used whenever we need the same
+# input every time: checking clean_text, comparing models, benchmarks.
+# Please only append to this list, other results are measured against it.
+# After appending, run `python -m backend.corpus --update` to add their
+# expected clean_text output.
+CHAT_CORPUS = [
+    "This is awesome!",
+    "I hate this, it's so bad 😠",
+    "POG LULW THATS SO BAD",
+    "you are a stupid idiot, go away",
+    "http://spam-link.com",
+    "Just a normal comment.",
+    "koi bat nahi aap kro live me betha hu",
+    "W",
+    "W W W W",
+    "L",
+    "LOL",
+    "lmaooooo",
+    "first",
+    "FIRST!!!",
+    "gg",
+    "GG WP",
+    "😂😂😂",
+    "🔥🔥🔥🔥",
+    "❤️",
+    "👍",
+    "💀💀",
+    "😡😡 trash stream",
+    "hello from India 🇮🇳",
+    "hi",
+    "Hello everyone!!",
+    "what time does the match start?",
+    "is this live?",
+    "???",
+    "...",
+    "",
+    "   ",
+    "@streamer please say hi to me",
+    "check out my channel www.example.com/mychannel",
+    "free robux at https://totally-legit.example/claim?id=123 !!!",
+    "ur so bad at this game lmao",
+    "this is the worst stream ever",
+    "best streamer ever, love you ❤️❤️",
+    "kill him kill him",
+    "the audience is going crazy",
+    "whatever man",
+    "die die die",
+    "this guy is a clown 🤡",
+    "shut up noob",
+    "you're a loser and a cheater",
+    "that was insane!!! 🔥",
+    "Ich liebe diesen Stream",
+    "me encanta este stream 😍",
+    "これは面白い",
+    "сколько стоит?",
+    "क्या बात है भाई",
+    "bhai kya khel raha hai 🔥🔥",
+    "tabs\tand\nnewlines   everywhere",
+    "MiXeD CaSe MeSsAgE",
+    "numbers 12345 and symbols #$%^&*",
+    "don't you dare",
+    "ok",
+    "no",
+    "yes!!",
+    "Copypasta: I'm not saying this stream is bad, but my cat streams better and she's asleep",
+    "Copypasta: I'm not saying this stream is bad but my cat streams better and she's asleep 😴",
+    "Copypasta: Im not saying this stream is bad, but my cat streams better and shes asleep!!",
+    "hahahahahahahahaha",
+    "KEKW",
+    "Pog",
+    "PogChamp",
+    "sus",
+    "ratio",
+    "nice play",
+    "that's disgusting, report him",
+    "why is chat so toxic today",
+]
+
+# The expected clean_text output of every corpus message (made with the
+# original clean_text). Emoji names come from the `emoji` package, so an
+# upgrade of it can change them.
+CLEANED_FILE = os.path.join(os.path.dirname(__file__), "corpus_cleaned.json")
+
+
+def load_cleaned() -> list:
+    with open(CLEANED_FILE, "r", encoding="utf-8") as f:
+        return [entry["cleaned"] for entry in json.load(f)]
+
+
+def save_cleaned(cleaned: list):
+    entries = [{"message": message, "cleaned": text} for message, text in zip(CHAT_CORPUS, cleaned)]
+    with open(CLEANED_FILE, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=4)
+        f.write("\n")
+
+
+def check_clean_texts() -> list:
+    """
+    (message, expected, actual) for every corpus message that clean_texts
+    doesn't clean exactly like the stored output.
+    """
+    from backend.model import clean_texts
+
+    expected = load_cleaned()
+    actual = clean_texts(CHAT_CORPUS)
+    mismatches = [
+        (message, want, got)
+        for message, want, got in zip(CHAT_CORPUS, expected, actual)
+        if want != got
+    ]
+    # Appended messages without an expected output yet
+    mismatches += [(message, None, got) for message, got in zip(CHAT_CORPUS[len(expected):], actual[len(expected):])]
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Check clean_text against the expected output on the chat corpus.")
+    parser.add_argument("--update", action="store_true", help="Store the current output for messages that have none yet")
+    args = parser.parse_args()
+
+    if args.update:
+        from backend.model import clean_texts
+
+        # Only new messages get an output, the stored ones stay as they are
+        stored = load_cleaned() if os.path.exists(CLEANED_FILE) else []
+        save_cleaned(stored + clean_texts(CHAT_CORPUS[len(stored):]))
+        print(f"💾 {len(CHAT_CORPUS) - len(stored)} new expected outputs saved to {CLEANED_FILE}.")
+        sys.exit(0)
+
+    mismatches = check_clean_texts()
+    for message, expected, actual in mismatches:
+        print(f"   🔴 {message!r}: expected {expected!r}, got {actual!r}")
+    print(f"{'❌' if mismatches else '✅'} {len(CHAT_CORPUS) - len(mismatches)} of {len(CHAT_CORPUS)} corpus messages cleaned as expected.")
+    sys.exit(1 if mismatches else 0)
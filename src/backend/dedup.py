@@ -0,0 +1,210 @@
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# MinHash signature length = bands x rows. With 16 bands of 2 rows, two
+# texts with a Jaccard similarity of 0.5 share a band 99% of the time,
+# at 0.2 ~48%. A shared band only makes a candidate: the whole signature
+# must then agree on at least `threshold` of its values.
+NUM_BANDS = 16
+ROWS_PER_BAND = 2
+SHINGLE_SIZE = 4
+# a * h stays below 2^63 for 32-bit shingle hashes, so uint64 doesn't overflow
+_PRIME = np.uint64((1 << 31) - 1)
+
+# Fixed seed, so signatures don't change between runs
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, (1 << 31) - 1, size=(NUM_BANDS * ROWS_PER_BAND, 1), dtype=np.uint64)
+_B = _rng.integers(0, (1 << 31) - 1, size=(NUM_BANDS * ROWS_PER_BAND, 1), dtype=np.uint64)
+
+# "loooool" and "lool", "fire fire fire" and "fire" are the same message
+REPEATED_CHARS_PATTERN = re.compile(r"(.)\1{2,}")
+REPEATED_WORDS_PATTERN = re.compile(r"\b(\w+)(?: \1\b)+")
+# Variants of one cluster remembered for exact lookups; past that, new
+# variants are still found through the LSH index
+MAX_EXACT_KEYS_PER_CLUSTER = 1000
+
+
+def normalise(cleaned_text: str) -> str:
+    """
+    The form of a clean_text() output two near-duplicates are compared in.
+    """
+    text = " ".join(REPEATED_CHARS_PATTERN.sub(r"\1\1", cleaned_text).split())
+    return REPEATED_WORDS_PATTERN.sub(r"\1", text)
+
+def shingles(text: str) -> set:
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + SHINGLE_SIZE].encode("utf-8")) for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def minhash(text: str) -> tuple:
+    # Every (permutation, shingle) pair at once
+    hashes = np.fromiter(shingles(text), dtype=np.uint64)
+    return tuple(((_A * hashes + _B) % _PRIME).min(axis=1).tolist())
+
+def similarity(signature_a: tuple, signature_b: tuple) -> float:
+    """
+    Estimated Jaccard similarity of the two texts' shingles.
+    """
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+def _band_keys(signature: tuple) -> list:
+    return [
+        (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        for band in range(NUM_BANDS)
+    ]
+
+
+class Cluster:
+    __slots__ = ("cluster_id", "representative", "signature", "size", "first_seen", "last_seen", "exact_keys")
+
+    def __init__(self, cluster_id: str, representative: str, signature, now: float):
+        self.cluster_id = cluster_id
+        # The cleaned text of the first message: the one that goes through the models
+        self.representative = representative
+        self.signature = signature
+        self.size = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.exact_keys = []
+
+
+class NearDuplicateIndex:
+    """
+    Groups messages that are the same up to small edits (copypasta with an
+    extra emote, "loooool" vs "lool"...) with MinHash + LSH over character
+    shingles of the normalised clean_text().
+
+    assign() returns the message's Cluster. Only the cluster's representative
+    needs model scores, the other members reuse them. Clusters nobody posted
+    to for `window_seconds` are forgotten, and at most `max_clusters` are
+    kept (least recently used go first).
+
+    Texts shorter than `min_length` are only matched exactly: a few letters
+    don't have enough shingles to compare.
+    """
+
+    def __init__(self, threshold: float = 0.8, min_length: int = 12,
+                 window_seconds: float = 600.0, max_clusters: int = 20000):
+        self.threshold = threshold
+        self.min_length = min_length
+        self.window_seconds = window_seconds
+        self.max_clusters = max_clusters
+
+        self.clusters = OrderedDict() # cluster_id -> Cluster, least recently used first
+        self.exact = {}               # normalised text -> cluster_id
+        self.bands = {}               # band key -> cluster_id (of representatives only)
+        # Unique across restarts, so ids in an appended file don't collide
+        self._prefix = uuid.uuid4().hex[:6]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.assigned = 0
+        self.exact_matches = 0
+        self.near_matches = 0
+        self.expired = 0
+
+    def assign(self, cleaned_text: str, now: float = None) -> Cluster: # type: ignore
+        now = now or time.time()
+        key = normalise(cleaned_text)
+        with self._lock:
+            self._expire(now)
+            self.assigned += 1
+
+            cluster = self.clusters.get(self.exact.get(key)) # type: ignore
+            if cluster is not None:
+                self.exact_matches += 1
+                return self._join(cluster, now)
+
+            signature = None
+            if len(key) >= self.min_length:
+                signature = minhash(key)
+                cluster = self._find_similar(signature)
+                if cluster is not None:
+                    self.near_matches += 1
+                    if len(cluster.exact_keys) < MAX_EXACT_KEYS_PER_CLUSTER:
+                        cluster.exact_keys.append(key)
+                        self.exact[key] = cluster.cluster_id
+                    return self._join(cluster, now)
+
+            return self._join(self._new_cluster(key, cleaned_text, signature, now), now)
+
+    def _join(self, cluster: Cluster, now: float) -> Cluster:
+        cluster.size += 1
+        cluster.last_seen = now
+        self.clusters.move_to_end(cluster.cluster_id)
+        return cluster
+
+    def _find_similar(self, signature: tuple):
+        best, best_similarity = None, self.threshold
+        seen = set()
+        for band_key in _band_keys(signature):
+            cluster_id = self.bands.get(band_key)
+            if cluster_id is None or cluster_id in seen:
+                continue
+            seen.add(cluster_id)
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                continue
+            # A shared band is only a candidate, check the whole signature
+            estimate = similarity(signature, cluster.signature)
+            if estimate >= best_similarity:
+                best, best_similarity = cluster, estimate
+        return best
+
+    def _new_cluster(self, key: str, cleaned_text: str, signature, now: float) -> Cluster:
+        self._next_id += 1
+        cluster = Cluster(f"{self._prefix}-{self._next_id}", cleaned_text, signature, now)
+        cluster.exact_keys.append(key)
+        self.clusters[cluster.cluster_id] = cluster
+        self.exact[key] = cluster.cluster_id
+        if signature is not None:
+            for band_key in _band_keys(signature):
+                # The newest cluster wins a shared band
+                self.bands[band_key] = cluster.cluster_id
+
+        while len(self.clusters) > self.max_clusters:
+            self._remove(next(iter(self.clusters.values())))
+        return cluster
+
+    def _expire(self, now: float):
+        # Least recently used first, so stop at the first one still alive
+        while self.clusters:
+            oldest = next(iter(self.clusters.values()))
+            if now - oldest.last_seen < self.window_seconds:
+                break
+            self._remove(oldest)
+            self.expired += 1
+
+    def _remove(self, cluster: Cluster):
+        del self.clusters[cluster.cluster_id]
+        for key in cluster.exact_keys:
+            if self.exact.get(key) == cluster.cluster_id:
+                del self.exact[key]
+        if cluster.signature is not None:
+            for band_key in _band_keys(cluster.signature):
+                if self.bands.get(band_key) == cluster.cluster_id:
+                    del self.bands[band_key]
+
+    def clear(self):
+        with self._lock:
+            self.clusters.clear()
+            self.exact.clear()
+            self.bands.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "clusters": len(self.clusters),
+                "assigned": self.assigned,
+                "exact_matches": self.exact_matches,
+                "near_matches": self.near_matches,
+                "expired": self.expired,
+                "threshold": self.threshold,
+                "window_seconds": self.window_seconds,
+            }
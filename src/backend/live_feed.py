@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+def parse_sse(lines):
+    """
+    Turns the lines of a text/event-stream into (event, data) pairs.
+    """
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue # keep-alive comment
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def _merge_points(old: list, new: list) -> list:
+    # Newer points replace older ones with the same bucket timestamp
+    points = {point["timestamp"]: point for point in old}
+    points.update((point["timestamp"], point) for point in new)
+    return [points[key] for key in sorted(points)]
+
+
+class LiveFeed:
+    """
+    Listens to chat.py's /events stream in a background thread and keeps
+    the latest dashboard state in memory. `version` goes up with every
+    change, so the dashboard can tell whether anything needs redrawing.
+    """
+
+    def __init__(self, url: str, max_messages: int = 50, reconnect_seconds: float = 2.0):
+        self.url = url
+        self.reconnect_seconds = reconnect_seconds
+        self.connected = False
+        self.version = 0
+        self.stats = None
+        self.messages = deque(maxlen=max_messages)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=(3, 60)) as response:
+                    response.raise_for_status()
+                    self.connected = True
+                    for event, data in parse_sse(response.iter_lines(decode_unicode=True)):
+                        self._apply(event, data)
+            except Exception:
+                pass
+
+            self.connected = False
+            time.sleep(self.reconnect_seconds)
+
+    def _apply(self, event: str, data):
+        with self._lock:
+            if event == "snapshot":
+                self.messages.clear()
+                self.messages.extend(data.pop("recent_messages", []))
+                self.stats = data
+            elif event == "messages":
+                self.messages.extend(data)
+            elif event == "stats" and self.stats is not None:
+                series = self.stats.get("series", {})
+                for name, points in data.pop("series", {}).items():
+                    series[name] = _merge_points(series.get(name, []), points)
+                self.stats.update(data)
+                self.stats["series"] = series
+            else:
+                return
+            self.version += 1
+
+    def view(self):
+        """
+        (version, stats, latest messages), copied so the caller can't race the thread.
+        """
+        with self._lock:
+            stats = None
+            if self.stats is not None:
+                stats = {**self.stats, "series": {k: list(v) for k, v in self.stats.get("series", {}).items()}}
+            return self.version, stats, list(self.messages)
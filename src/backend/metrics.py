@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cache hit to a slow forward pass or disk write
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    """
+    Only goes up: requests, messages, errors...
+    """
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. With `collect`, the value is read
+    when /metrics is scraped: collect() returns a number, or a dict of
+    label value tuples to numbers.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames=(), collect=None, kind: str = None): # type: ignore
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+        if kind:
+            # Totals kept elsewhere (e.g. cache hits) are counters to Prometheus
+            self.kind = kind
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list:
+        if self.collect is None:
+            return super().samples()
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """
+    Counts observations per bucket (latencies, batch sizes), plus their sum and count.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> list:
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    All the metrics of this process, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=(), collect=None, kind: str = None) -> Gauge: # type: ignore
+        return self._register(Gauge(name, help, labelnames, collect, kind))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Shared by every stage of the pipeline, so they can be compared on one graph
+stage_seconds = REGISTRY.histogram(
+    "chat_stage_seconds",
+    "Time spent in each pipeline stage (clean, infer, analyse, enqueue, flush).",
+    ["stage"],
+)
+errors_total = REGISTRY.counter("chat_errors_total", "Errors, by the stage they happened in.", ["stage"])
@@ -1,143 +1,489 @@
+import os
 import re
+import time
 import emoji
 import warnings
-from transformers import pipeline, logging as hf_logging
+from concurrent.futures import ThreadPoolExecutor
 
+from backend.batching import PaddingStats, token_budget_batches
+from backend.cache import ResultCache
+from backend.cascade import CASCADE_ENABLED, cascade_stats, prescreen
+from backend.corpus import CHAT_CORPUS
+from backend.dedup import NearDuplicateIndex
+from backend.metrics import errors_total, stage_seconds
 from backend.negative_word import detect_negative_words
 
-# Suppress warnings
-hf_logging.set_verbosity_error()
+# torch and transformers take seconds to import, so they are only
+# imported once the models are loaded (see build_pipelines)
 
 # --- Globals to hold the models ---
 sentiment_pipeline = None
 toxicity_pipeline = None
 
-def load_models():
+# --- Cache of model scores, keyed on the cleaned message ---
+CACHE_CAPACITY = int(os.getenv("RESULT_CACHE_CAPACITY", 50000))
+CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", 3600))
+result_cache = ResultCache(capacity=CACHE_CAPACITY, ttl_seconds=CACHE_TTL_SECONDS)
+
+# --- Near-duplicate clusters (copypasta with small edits, opt-in) ---
+# Messages of one cluster share the model scores of its first message,
+# so their scores are approximate. Every row records its cluster id and
+# the cluster's size so far.
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "0").lower() in ("1", "true", "yes")
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", 0.8))
+NEAR_DUP_WINDOW_SECONDS = float(os.getenv("NEAR_DUP_WINDOW_SECONDS", 600))
+near_duplicates = NearDuplicateIndex(threshold=NEAR_DUP_THRESHOLD, window_seconds=NEAR_DUP_WINDOW_SECONDS)
+
+# --- Optimised CPU mode (opt-in) ---
+# int8 dynamic quantisation of the Linear layers and shorter inputs.
+# Run `python -m backend.quant_eval` to see how much the scores move.
+OPTIMISED_CPU_MODE = os.getenv("OPTIMISED_CPU_MODE", "0").lower() in ("1", "true", "yes")
+# torch's intra-op threads, one per core unless set. Worker processes
+# (chat.py's INFERENCE_WORKERS) get their share of the cores instead.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0)) or os.cpu_count() or 1
+# Chat messages are short, so long inputs are cut here in optimised mode
+MAX_SEQUENCE_LENGTH = int(os.getenv("MAX_SEQUENCE_LENGTH", 128))
+# Padded tokens (rows x longest text) per forward pass. Texts are sorted
+# by length first, so short ones aren't padded to the longest of a batch.
+INFERENCE_TOKEN_BUDGET = int(os.getenv("INFERENCE_TOKEN_BUDGET", 4096))
+# Batch sizes run once after loading, so the first real messages
+# don't pay for the first forward passes
+WARMUP_BATCH_SIZES = (1, 8, 32)
+
+optimised_mode = False
+# Real vs padded tokens of every forward pass, see /stats/inference
+padding_stats = PaddingStats()
+
+def _quantise(pipe):
     """
-    Loads the Hugging Face models into the global variables.
+    Swaps the model's Linear layers for dynamic int8 ones (CPU only).
     """
-    global sentiment_pipeline, toxicity_pipeline
-    
-    print("🧠 -> Loading Sentiment Model (twitter-roberta)...")
-    sentiment_pipeline = pipeline(
-        "sentiment-analysis", # type: ignore
-        model="cardiffnlp/twitter-roberta-base-sentiment",
-        device=-1 # -1 for CPU, 0 for GPU
-    ) # type: ignore
-    
-    print("🧠 -> Loading Toxicity Model (toxic-bert)...")
-    toxicity_pipeline = pipeline(
-        "text-classification",
-        model="unitary/toxic-bert",
-        # Use top_k=None to get all scores
-        top_k=None,
-        device=-1 # -1 for CPU, 0 for GPU
+    import torch
+    pipe.model = torch.ao.quantization.quantize_dynamic(
+        pipe.model, {torch.nn.Linear}, dtype=torch.qint8
     )
-    print("🧠 -> Models loaded successfully.")
+    pipe.model.eval()
+    return pipe
+
+def build_pipelines(optimised: bool = False):
+    """
+    Creates the (sentiment, toxicity) pipelines, without touching the globals.
+    Both models load at the same time; most of it is file reads and
+    torch code that doesn't hold the GIL.
+    """
+    from transformers import pipeline, logging as hf_logging
+
+    # Suppress warnings
+    hf_logging.set_verbosity_error()
+
+    def load_sentiment():
+        print("🧠 -> Loading Sentiment Model (twitter-roberta)...")
+        return pipeline(
+            "sentiment-analysis", # type: ignore
+            model="cardiffnlp/twitter-roberta-base-sentiment",
+            device=-1 # -1 for CPU, 0 for GPU
+        ) # type: ignore
+
+    def load_toxicity():
+        print("🧠 -> Loading Toxicity Model (toxic-bert)...")
+        return pipeline(
+            "text-classification",
+            model="unitary/toxic-bert",
+            # Use top_k=None to get all scores
+            top_k=None,
+            device=-1 # -1 for CPU, 0 for GPU
+        )
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sentiment_future = executor.submit(load_sentiment)
+        toxicity_future = executor.submit(load_toxicity)
+        sentiment, toxicity = sentiment_future.result(), toxicity_future.result()
+
+    if optimised:
+        print("🧠 -> Quantising both models to int8...")
+        sentiment, toxicity = _quantise(sentiment), _quantise(toxicity)
+    return sentiment, toxicity
+
+def load_models(optimised=None, num_threads=None):
+    """
+    Loads the Hugging Face models into the global variables.
+    `num_threads` (default TORCH_NUM_THREADS) is pinned before any model work.
+    """
+    global sentiment_pipeline, toxicity_pipeline, optimised_mode
+
+    if optimised is None:
+        optimised = OPTIMISED_CPU_MODE
+    num_threads = num_threads or TORCH_NUM_THREADS
+    import torch
+    torch.set_num_threads(num_threads)
+    print(f"🧠 -> Using {num_threads} torch threads.")
+
+    sentiment_pipeline, toxicity_pipeline = build_pipelines(optimised)
+    optimised_mode = optimised
+    print(f"🧠 -> Models loaded successfully{' (optimised CPU mode)' if optimised else ''}.")
+
+def models_loaded() -> bool:
+    return sentiment_pipeline is not None and toxicity_pipeline is not None
+
+def warm_up(scorer=None, batch_sizes=WARMUP_BATCH_SIZES) -> float:
+    """
+    Runs a few batches of chat through the models (or `scorer`), past the
+    cache and the cascade so their numbers stay untouched (the padding
+    stats too). Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    texts = [cleaned for cleaned in clean_texts(CHAT_CORPUS) if cleaned]
+    for batch_size in batch_sizes:
+        (scorer or _score_texts)((texts * (batch_size // len(texts) + 1))[:batch_size])
+    padding_stats.clear()
+    return time.perf_counter() - started
+
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+NON_ALPHA_PATTERN = re.compile(r'[^a-zA-Z\s?]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# URLs and everything that is not a letter, '?' or whitespace, in one scan.
+# A URL always starts with a letter, so the two never overlap.
+STRIP_PATTERN = re.compile(r'https?://\S+|www\.\S+|[^a-zA-Z\s?]+')
 
 def remove_urls(text):
-    url_pattern = r'https?://\S+|www\.\S+'
-    clean_text = re.sub(url_pattern, '', text)
-    return clean_text
+    return URL_PATTERN.sub('', text)
 
 def remove_non_alpha(text):
-    clean_text = re.sub(r'[^a-zA-Z\s?]', '', text)
-    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    clean_text = NON_ALPHA_PATTERN.sub('', text)
+    clean_text = WHITESPACE_PATTERN.sub(' ', clean_text).strip()
     return clean_text
 
 def clean_text(message:str) -> str: # type: ignore
     if not isinstance(message, str):
         return ""
-    msg = emoji.demojize(message)
-    msg = remove_urls(msg)
-    msg = remove_non_alpha(msg)
-    msg = msg.lower().strip()
-    return msg
+    # There are no ASCII emoji, so plain text can skip the emoji lookup
+    msg = message if message.isascii() else emoji.demojize(message)
+    msg = STRIP_PATTERN.sub('', msg)
+    return WHITESPACE_PATTERN.sub(' ', msg).strip().lower()
 
-# --- (Using your 'analyse' spelling) ---
-def analyse_message(raw_message:str) -> dict:
+def clean_texts(messages: list) -> list:
+    """
+    clean_text for a whole batch. Repeated messages are only cleaned once.
+    """
+    seen = {}
+    cleaned_texts = []
+    for message in messages:
+        if not isinstance(message, str):
+            cleaned_texts.append("")
+            continue
 
-    if not sentiment_pipeline or not toxicity_pipeline:
-        print("❌ ERROR: Models are not loaded. Please call load_models() first.")
-        return {
-            "original_message": raw_message,
-            "error": "Models are not loaded."
-        }
-
-    cleaned_text = clean_text(raw_message)
-
-    negative_hits = detect_negative_words(cleaned_text)
-
-    if not cleaned_text:
-        return {
-            "original_message": raw_message,
-            "cleaned_message": "",
-            "sentiment_label": "NEUTRAL",
-            "sentiment_score": 0.0,
-            "toxicity_label": "NOT_TOXIC",
-            "toxicity_score": 0.0,
-            "error": "Empty message"
-        }
+        cleaned = seen.get(message)
+        if cleaned is None:
+            cleaned = seen[message] = clean_text(message)
+        cleaned_texts.append(cleaned)
+    return cleaned_texts
+
+def prepare_messages(raw_messages: list) -> list:
+    """
+    (cleaned text, negative word hits) of each message. What the server
+    may need before the models (e.g. to pick a lane), handed on to
+    analyse_messages so it isn't done twice.
+    The lexicon is matched on the raw message, not the model input.
+    """
+    return [
+        (cleaned, detect_negative_words(raw_message))
+        for raw_message, cleaned in zip(raw_messages, clean_texts(raw_messages))
+    ]
+
+SENTIMENT_LABELS = {
+    "LABEL_0": "NEGATIVE",
+    "LABEL_1": "NEUTRAL",
+    "LABEL_2": "POSITIVE",
+}
+
+def _sentiment_from_output(sentiment: dict):
+    """
+    Maps a raw twitter-roberta output to our (label, signed score) pair.
+    """
+    sentiment_label = SENTIMENT_LABELS.get(sentiment['label'], "POSITIVE")
+    sentiment_score = sentiment['score']
+
+    if sentiment_label == "NEGATIVE":
+        sentiment_score = -sentiment_score
+    elif sentiment_label == "NEUTRAL":
+        sentiment_score = 0.0
+    return sentiment_label, sentiment_score
+
+def _toxicity_from_output(tox_results_list) -> float:
+    """
+    Picks the 'toxic' score out of the toxic-bert label scores.
+    """
+    # A single label comes back as a dict, top_k=None gives a list of dicts
+    if isinstance(tox_results_list, dict):
+        tox_results_list = [tox_results_list]
+
+    for result in tox_results_list:
+        if result['label'] == 'toxic':
+            return result['score']
+    return 0.0
+
+def _build_result(raw_message, cleaned_text, sentiment_label, sentiment_score,
+                  toxicity_score, negative_hits) -> dict:
+    """
+    Turns the model scores into the per-message dict the API and CSV use.
+    """
+    if toxicity_score > 0.5:
+        toxicity_label = "TOXIC"
+    else:
+        toxicity_label = "NOT_TOXIC"
 
+    if negative_hits and toxicity_score < 0.8:
+        toxicity_score += 0.2
+        toxicity_score = min(toxicity_score, 1.0)
+        toxicity_label = "toxic" if toxicity_score >= 0.5 else "non-toxic"
+
+    return {
+        "original_message": raw_message,
+        "cleaned_message": cleaned_text,
+        "sentiment_label": sentiment_label,
+        "sentiment_score": sentiment_score,
+        "toxicity_label": toxicity_label,
+        "toxicity_score": toxicity_score,
+        "contains_negative_word": len(negative_hits) > 0,
+        "error": None
+    }
+
+def skipped_result(raw_message, cleaned_text) -> dict:
+    """
+    The row of a message left out of the sample under load: no model
+    scores, and a sampling weight of 0 (see backend/sampling.py).
+    """
+    return {
+        "original_message": raw_message,
+        "cleaned_message": cleaned_text,
+        "sentiment_label": None,
+        "sentiment_score": None,
+        "toxicity_label": None,
+        "toxicity_score": None,
+        "contains_negative_word": False, # those are always analysed
+        "error": None,
+        "sample_weight": 0.0,
+    }
+
+def _empty_result(raw_message) -> dict:
+    return {
+        "original_message": raw_message,
+        "cleaned_message": "",
+        "sentiment_label": "NEUTRAL",
+        "sentiment_score": 0.0,
+        "toxicity_label": "NOT_TOXIC",
+        "toxicity_score": 0.0,
+        "error": "Empty message"
+    }
+
+def _probabilities(model, logits) -> list:
+    """
+    The label scores a text-classification pipeline would give for these
+    logits: sigmoid for multi-label models (toxic-bert), softmax otherwise.
+    Returns one {label: score} dict per row.
+    """
+    config = model.config
+    if config.problem_type == "multi_label_classification" or config.num_labels == 1:
+        probabilities = logits.float().sigmoid()
+    else:
+        probabilities = logits.float().softmax(-1)
+    return [
+        {config.id2label[j]: score for j, score in enumerate(row)}
+        for row in probabilities.tolist()
+    ]
+
+def _forward(pipe, name: str, cleaned_texts: list, max_length=None, token_budget=None) -> list:
+    """
+    Runs one model over the texts, calling the model directly instead of
+    the pipeline: the texts are tokenized once, sorted by length and
+    batched by padded tokens, then put back in their original order.
+    Returns one {label: score} dict per text.
+    """
+    tokenizer_kwargs = {"truncation": True}
+    if max_length:
+        tokenizer_kwargs["max_length"] = max_length
+    encoded = pipe.tokenizer(cleaned_texts, **tokenizer_kwargs)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+
+    outputs = [None] * len(cleaned_texts)
+    for batch in token_budget_batches(lengths, token_budget or INFERENCE_TOKEN_BUDGET):
+        inputs = pipe.tokenizer.pad(
+            {key: [values[i] for i in batch] for key, values in encoded.items()},
+            return_tensors="pt",
+        )
+        logits = pipe.model(**inputs).logits
+        for i, probabilities in zip(batch, _probabilities(pipe.model, logits)):
+            outputs[i] = probabilities
+        padding_stats.add(name, [lengths[i] for i in batch])
+    return outputs
+
+def inference_stats() -> dict:
+    """
+    The batching settings and padding counts of the forward passes so far.
+    """
+    return {
+        "token_budget": INFERENCE_TOKEN_BUDGET,
+        # None: the model's own limit (512 tokens)
+        "max_length": MAX_SEQUENCE_LENGTH if optimised_mode else None,
+        "padding_efficiency": padding_stats.efficiency(),
+        "models": padding_stats.stats(),
+    }
+
+def _run_pipelines(cleaned_texts: list, pipelines=None, optimised=None):
+    """
+    Runs both models over a whole batch in one go.
+    Returns (sentiment, toxicity) outputs per text, shaped like the
+    pipelines' own: the top sentiment label, and every toxicity label.
+    """
+    sentiment, toxicity = pipelines or (sentiment_pipeline, toxicity_pipeline)
+    if optimised is None:
+        optimised = optimised_mode
+    max_length = MAX_SEQUENCE_LENGTH if optimised else None
+
+    import torch
+
+    with torch.inference_mode():
+        sentiments = _forward(sentiment, "sentiment", cleaned_texts, max_length)
+        toxicities = _forward(toxicity, "toxicity", cleaned_texts, max_length)
+
+    return [
+        (
+            dict(zip(("label", "score"), max(sentiment_scores.items(), key=lambda item: item[1]))),
+            [{"label": label, "score": score} for label, score in toxicity_scores.items()],
+        )
+        for sentiment_scores, toxicity_scores in zip(sentiments, toxicities)
+    ]
+
+def _score_texts(cleaned_texts: list) -> list:
+    """
+    Runs the models on cleaned texts.
+    Returns (sentiment_label, sentiment_score, toxicity_score) per text,
+    or the exception if that text could not be analysed.
+    """
     try:
-        sentiment = sentiment_pipeline(cleaned_text)[0]
+        outputs = _run_pipelines(cleaned_texts)
+    except Exception as e:
+        if len(cleaned_texts) == 1:
+            return [e]
 
-        # --- THIS IS THE FINAL, 100% FIX ---
-        # We add [0] to get the *inner list* of scores
-        tox_results_list = toxicity_pipeline(cleaned_text)[0]
-        # ---
-    
-        sentiment_label = sentiment['label']
-        sentiment_score = sentiment['score']
-
-        if sentiment_label == 'LABEL_0':
-            sentiment_label = "NEGATIVE"
-            sentiment_score = -sentiment_score
-        elif sentiment_label == 'LABEL_1':
-            sentiment_label = "NEUTRAL"
-            sentiment_score = 0.0
-        else:
-            sentiment_label = "POSITIVE"
-        
-        toxicity_score = 0.0
-        # Now, 'result' will be a dict {'label':...}, not a list
-        for result in tox_results_list:
-            if result['label'] == 'toxic': # type: ignore # This will work
-                toxicity_score = result['score'] # type: ignore
-                break
-        
-        if toxicity_score > 0.5: # type: ignore
-            toxicity_label = "TOXIC"
+        # One bad message should not fail the whole batch, so retry one by one
+        print(f"Error during batch analysis, retrying one by one: {e}")
+        return [_score_texts([cleaned])[0] for cleaned in cleaned_texts]
+
+    scores = []
+    for sentiment, tox_results_list in outputs:
+        sentiment_label, sentiment_score = _sentiment_from_output(sentiment)
+        scores.append((sentiment_label, sentiment_score, _toxicity_from_output(tox_results_list)))
+    return scores
+
+def analyse_messages(raw_messages: list, scorer=None, prepared=None) -> list:
+    """
+    Batched version of analyse_message.
+    Returns one dict per message, in the same order and with the same keys.
+
+    `scorer` replaces the local models, e.g. with a worker pool. It takes a
+    list of cleaned texts and returns what _score_texts would.
+    `prepared` has what prepare_messages gave for each message, or None
+    for the ones that still need cleaning.
+    """
+    if scorer is None and (not sentiment_pipeline or not toxicity_pipeline):
+        print("❌ ERROR: Models are not loaded. Please call load_models() first.")
+        return [
+            {"original_message": raw_message, "error": "Models are not loaded."}
+            for raw_message in raw_messages
+        ]
+
+    results = [None] * len(raw_messages)
+    pending = [] # (index, cleaned_text, negative_hits) that need model scores
+
+    started = time.perf_counter()
+    prepared = list(prepared or [None] * len(raw_messages))
+    missing = [i for i, entry in enumerate(prepared) if entry is None]
+    if missing:
+        for i, entry in zip(missing, prepare_messages([raw_messages[i] for i in missing])):
+            prepared[i] = entry
+
+    for i, (raw_message, (cleaned_text, negative_hits)) in enumerate(zip(raw_messages, prepared)):
+        if not cleaned_text:
+            results[i] = _empty_result(raw_message)
+            if negative_hits:
+                # Nothing for the models (e.g. non-Latin text), but the lexicon matched
+                results[i]["contains_negative_word"] = True
         else:
-            toxicity_label = "NOT_TOXIC"
-
-        
-
-        if negative_hits and toxicity_score < 0.8: # type: ignore
-            toxicity_score += 0.2 # type: ignore
-            toxicity_score = min(toxicity_score, 1.0)
-            toxicity_label = "toxic" if toxicity_score >= 0.5 else "non-toxic"
-
-        
-        
-        return {
-            "original_message": raw_message,
-            "cleaned_message": cleaned_text,
-            "sentiment_label": sentiment_label,
-            "sentiment_score": sentiment_score,
-            "toxicity_label": toxicity_label,
-            "toxicity_score": toxicity_score,
-            "contains_negative_word": len(negative_hits) > 0,
-            "error": None
-        }
+            pending.append((i, cleaned_text, negative_hits))
+    stage_seconds.observe(time.perf_counter() - started, stage="clean")
 
-    except Exception as e:
-        print(f"Error during analysis: {e}")
-        return {
-            "original_message": raw_message,
-            "cleaned_message": cleaned_text,
-            "error": str(e)
-        }
+    # Only texts we have not seen recently go through the models,
+    # and repeats inside one batch only go through once. A near-duplicate
+    # is scored as the first message of its cluster.
+    clusters = {} # index -> (cluster id, cluster size when it arrived)
+    lexical = {}  # index -> score from the lexical pre-screen
+    keys = {}     # index -> the text whose scores it gets
+    scores = {}   # text -> score from the cache or the models
+    to_score = []
+    near = 0      # scored as another message of their cluster
+    for i, cleaned_text, negative_hits in pending:
+        key = cleaned_text
+        if NEAR_DUP_ENABLED:
+            cluster = near_duplicates.assign(cleaned_text)
+            clusters[i] = (cluster.cluster_id, cluster.size)
+            key = cluster.representative
+
+        if CASCADE_ENABLED:
+            score = prescreen(raw_messages[i], cleaned_text, negative_hits)
+            if score is not None:
+                lexical[i] = score
+                continue
+
+        keys[i] = key
+        if key not in scores:
+            scores[key] = result_cache.get(key)
+            if scores[key] is None:
+                to_score.append(key)
+                continue
+        near += key != cleaned_text
+
+    if to_score:
+        with stage_seconds.time(stage="infer"):
+            model_scores = (scorer or _score_texts)(to_score)
+        for cleaned_text, score in zip(to_score, model_scores):
+            scores[cleaned_text] = score
+            if not isinstance(score, Exception):
+                result_cache.put(cleaned_text, score)
+
+    cascade_stats.add("lexical", len(lexical))
+    cascade_stats.add("transformer", len(to_score))
+    cascade_stats.add("cluster", near)
+    cascade_stats.add("cache", len(pending) - len(lexical) - len(to_score) - near)
+
+    for i, cleaned_text, negative_hits in pending:
+        score = lexical[i] if i in lexical else scores[keys[i]]
+        if isinstance(score, Exception):
+            print(f"Error during analysis: {score}")
+            errors_total.inc(stage="analyse")
+            results[i] = {
+                "original_message": raw_messages[i],
+                "cleaned_message": cleaned_text,
+                "error": str(score)
+            }
+            continue
+
+        # The negative word boost is not cached, it is applied on every message
+        sentiment_label, sentiment_score, toxicity_score = score
+        results[i] = _build_result(
+            raw_messages[i], cleaned_text,
+            sentiment_label, sentiment_score,
+            toxicity_score, negative_hits
+        )
+        if i in clusters:
+            results[i]["cluster_id"], results[i]["cluster_size"] = clusters[i]
+
+    return results # type: ignore
+
+# --- (Using your 'analyse' spelling) ---
+def analyse_message(raw_message:str) -> dict:
+    return analyse_messages([raw_message])[0]
 
 # --- Test (if you run this file directly) ---
 if __name__ == "__main__":
@@ -154,8 +500,7 @@ if __name__ == "__main__":
         "koi bat nahi aap kro live me betha hu"
     ]
     
-    for msg in test_msgs:
+    import json
+    for msg, analysis in zip(test_msgs, analyse_messages(test_msgs)):
         print(f"\n--- Original: {msg} ---")
-        analysis = analyse_message(msg)
-        import json
         print(json.dumps(analysis, indent=4))
\ No newline at end of file
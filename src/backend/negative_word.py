@@ -1,3 +1,10 @@
+import logging
+import os
+import re
+import unicodedata
+
+log = logging.getLogger(__name__)
+
 NEGATIVE_WORDS = {
     "idiot", "stupid", "dumb", "moron", "noob", "trash",
     "garbage", "worthless", "useless", "terrible", "awful", "horrible",
@@ -7,10 +14,129 @@ NEGATIVE_WORDS = {
     "liar", "cheater", "scammer", "retard", "sucks", "crazy", "insane"
 }
 
+# "word"   -> only whole words match ("die" does not match "audience")
+# "prefix" -> words starting with a term match too ("hate" matches "haters")
+MATCH_MODE = os.getenv("NEGATIVE_WORD_MODE", "word")
+
+# Optional extra lexicon, one term per line, '#' starts a comment
+LEXICON_FILE = os.getenv("NEGATIVE_WORDS_FILE")
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+
+
+def lexicon_text(message) -> str:
+    """
+    What the lexicon is matched against: the raw message lowercased,
+    without links and with single spaces. Unlike the model input
+    (clean_text) it keeps digits, accents and non-Latin letters, so terms
+    like "b1tch" or "жопа" can match.
+    """
+    if not isinstance(message, str):
+        return ""
+    if not message.isascii():
+        # "é" typed as one character or as "e" + accent match the same terms
+        message = unicodedata.normalize("NFC", message)
+    return " ".join(URL_PATTERN.sub(" ", message).lower().split())
+
+def _normalise_term(term: str) -> str:
+    return lexicon_text(term)
+
+def _trie_regex(node: dict) -> str:
+    """
+    Turns a character trie into a regex, so that all the terms
+    share their common prefixes instead of being tried one by one.
+    """
+    alternatives = []
+    is_optional = False
+    for char in sorted(node):
+        if char == "":
+            # A term ends here, but longer terms may continue
+            is_optional = True
+            continue
+        alternatives.append(re.escape(char) + _trie_regex(node[char]))
+
+    if not alternatives:
+        return ""
+
+    body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if is_optional:
+        body = "(?:" + body + ")?"
+    return body
+
+def _compile(words, mode: str):
+    if mode not in ("word", "prefix"):
+        raise ValueError(f"Unknown negative word match mode: {mode!r}")
+
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    if not trie:
+        return re.compile(r"(?!)") # Matches nothing
+
+    end = r"\b" if mode == "word" else ""
+    return re.compile(r"\b(" + _trie_regex(trie) + ")" + end)
+
+
+class NegativeWordMatcher:
+    """
+    Finds lexicon terms in a text with one compiled regex,
+    so the text is scanned once however big the lexicon is.
+    """
+
+    def __init__(self, words, mode: str = "word"):
+        self.words = frozenset(filter(None, (_normalise_term(w) for w in words)))
+        self.mode = mode
+        self.pattern = _compile(self.words, mode)
+
+    def find(self, text: str) -> list:
+        # dict.fromkeys drops repeats and keeps the order they appeared in
+        return list(dict.fromkeys(m.group(1) for m in self.pattern.finditer(text.lower())))
+
+
+def load_lexicon(path: str) -> set:
+    """
+    Reads a lexicon file: one term per line, blank lines and '#' comments are skipped.
+    """
+    words = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            term = line.split("#", 1)[0].strip()
+            if term:
+                words.add(term)
+    return words
+
+def _build_matcher(path=None, mode=None) -> NegativeWordMatcher:
+    words = set(NEGATIVE_WORDS)
+    if path:
+        words |= load_lexicon(path)
+    return NegativeWordMatcher(words, mode or MATCH_MODE)
+
+if LEXICON_FILE and not os.path.exists(LEXICON_FILE):
+    log.warning(f"⚠️ NEGATIVE_WORDS_FILE {LEXICON_FILE} not found, only the built-in negative words are used.")
+_matcher = _build_matcher(LEXICON_FILE if LEXICON_FILE and os.path.exists(LEXICON_FILE) else None)
+
+def reload_lexicon(path=None, mode=None) -> int:
+    """
+    Rebuilds the matcher from NEGATIVE_WORDS plus the lexicon file,
+    while the server keeps running. Returns the number of terms.
+    """
+    global _matcher, LEXICON_FILE, MATCH_MODE
+    path = path or LEXICON_FILE
+    mode = mode or MATCH_MODE
+
+    # Build first and swap after, so callers never see a half-built matcher
+    new_matcher = _build_matcher(path, mode)
+    _matcher = new_matcher
+    LEXICON_FILE, MATCH_MODE = path, mode
+    return len(new_matcher.words)
+
 def detect_negative_words(text: str):
     """
-    Returns a list of negative words found in the text (case-insensitive)
+    Returns a list of negative words found in the text (case-insensitive).
+    `text` is the raw message, see lexicon_text.
     """
-    text = text.lower()
-    matches = [w for w in NEGATIVE_WORDS if w in text]
-    return matches
\ No newline at end of file
+    return _matcher.find(lexicon_text(text))
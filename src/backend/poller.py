@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+log = logging.getLogger(__name__)
+
+# YouTube Data API quota units per call
+LIST_MESSAGES_COST = 5
+LIST_VIDEOS_COST = 1
+
+# Error reasons from the API (they appear in the text of an HttpError)
+QUOTA_ERRORS = ("quotaExceeded", "rateLimitExceeded", "dailyLimitExceeded")
+CHAT_ENDED_ERRORS = ("liveChatEnded", "liveChatNotFound", "liveChatDisabled")
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Exponential backoff with jitter: somewhere between half and all of
+    base * 2^attempt (at most `cap`), so channels that failed together
+    don't all retry at the same moment.
+    """
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_after_seconds(value, default: float) -> float:
+    """
+    The delay of a Retry-After header (in seconds). The HTTP-date form
+    and missing or broken values give `default`.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _has_reason(error: Exception, reasons) -> bool:
+    text = str(error)
+    return any(reason in text for reason in reasons)
+
+
+class QuotaLimiter:
+    """
+    Token bucket over API quota units, shared by every channel.
+
+    Units refill at `units_per_day` spread over the day, and at most
+    `burst` can be spent at once. Channels wait their turn in order.
+    After a quotaExceeded error every channel pauses, for longer each
+    time it happens again.
+    """
+
+    def __init__(self, units_per_day: float = 10000, burst: float = 100,
+                 backoff_base: float = 60.0, backoff_cap: float = 3600.0):
+        self.rate = units_per_day / 86400.0
+        self.capacity = burst
+        self.tokens = burst
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.units_used = 0
+        self.quota_errors = 0
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, cost: float):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    self.units_used += cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+    def quota_exceeded(self) -> float:
+        """
+        Pauses every channel. Returns the pause in seconds.
+        """
+        delay = backoff_delay(self.quota_errors, self.backoff_base, self.backoff_cap)
+        self.quota_errors += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def quota_ok(self):
+        self.quota_errors = 0
+
+    def stats(self) -> dict:
+        return {
+            "units_per_day": self.rate * 86400.0,
+            "units_used": self.units_used,
+            "quota_errors": self.quota_errors,
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+        }
+
+
+class PageTokenStore:
+    """
+    The live chat id and next page token of every channel, in a JSON file,
+    so a restarted poller carries on where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f"⚠️ Could not read {path}, starting without saved page tokens: {e}")
+
+    def get(self, video_id: str) -> dict:
+        return self.state.get(video_id, {})
+
+    def update(self, video_id: str, **fields):
+        self.state.setdefault(video_id, {}).update(fields, updated_at=time.time())
+        self._save()
+
+    def remove(self, video_id: str):
+        if self.state.pop(video_id, None) is not None:
+            self._save()
+
+    def _save(self):
+        # Write-then-rename, a crash mid-write can't leave half a file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+def to_payload(item: dict, stream_id: str):
+    """
+    One liveChatMessages item as a /fetch_chat_batch message,
+    or None if it has no text (sticker, membership event...).
+    Super Chats are always sent, with their amount, also without a
+    comment: moderators want to see every one of them.
+    """
+    snippet = item.get("snippet", {})
+    message_text = snippet.get("displayMessage")
+    super_chat = snippet.get("superChatDetails") if snippet.get("type") == "superChatEvent" else None
+    if super_chat is not None:
+        message_text = message_text or super_chat.get("userComment") or ""
+    elif not message_text:
+        return None
+
+    payload = {
+        "user": item.get("authorDetails", {}).get("displayName"),
+        "text": message_text,
+        "message_id": item.get("id"),
+        "published_at": snippet.get("publishedAt"),
+        "stream_id": stream_id,
+    }
+    if super_chat is not None:
+        payload["super_chat_amount"] = super_chat.get("amountDisplayString") or ""
+    return payload
+
+
+class ChannelPoller:
+    """
+    Polls the live chat of one video, at the pace the API asks for
+    (pollingIntervalMillis). The page token only moves on once a page
+    was handed to the server, so a failed send fetches the page again
+    instead of losing it.
+    """
+
+    def __init__(self, video_id: str, service, limiter: QuotaLimiter, tokens: PageTokenStore,
+                 forward, min_interval: float = 1.0, error_base: float = 10.0, error_cap: float = 300.0):
+        self.video_id = video_id
+        self.service = service
+        self.limiter = limiter
+        self.tokens = tokens
+        # forward(video_id, payload) -> awaitable: True once the server has
+        # the messages, False if sending failed, or the seconds the server
+        # asked us to wait (it is busy) before sending them again
+        self.forward = forward
+        self.min_interval = min_interval
+        self.error_base = error_base
+        self.error_cap = error_cap
+
+        saved = tokens.get(video_id)
+        self.live_chat_id = saved.get("live_chat_id")
+        self.page_token = saved.get("page_token")
+        self.errors = 0
+        self.polls = 0
+        self.messages = 0
+        self.deferred = 0
+        self.ended = False
+
+    def _error_delay(self) -> float:
+        delay = backoff_delay(self.errors, self.error_base, self.error_cap)
+        self.errors += 1
+        return delay
+
+    async def resolve_chat_id(self):
+        """
+        The live chat id of the video: True when found, False when the video
+        has no live chat, or a delay to retry after.
+        """
+        if self.live_chat_id:
+            return True
+
+        await self.limiter.acquire(LIST_VIDEOS_COST)
+        try:
+            request = self.service.videos().list(part="liveStreamingDetails", id=self.video_id)
+            response = await asyncio.to_thread(request.execute)
+        except Exception as e:
+            if _has_reason(e, QUOTA_ERRORS):
+                return self.limiter.quota_exceeded()
+            log.error(f"❌ [{self.video_id}] HTTP Error finding chat ID: {e}")
+            return False if "keyInvalid" in str(e) else self._error_delay()
+
+        items = response.get("items") or []
+        live_details = items[0].get("liveStreamingDetails") if items else None
+        live_chat_id = (live_details or {}).get("activeLiveChatId")
+        if not live_chat_id:
+            log.error(f"❌ [{self.video_id}] Not a live stream, or it is over.")
+            return False
+
+        self.live_chat_id = live_chat_id
+        self.tokens.update(self.video_id, live_chat_id=live_chat_id, page_token=self.page_token)
+        log.info(f"✅ [{self.video_id}] Live Chat ID found: {live_chat_id}")
+        return True
+
+    async def poll_once(self):
+        """
+        Fetches and forwards one page. Returns the seconds to wait before
+        the next poll, or None once the chat is over.
+        """
+        await self.limiter.acquire(LIST_MESSAGES_COST)
+        try:
+            request = self.service.liveChatMessages().list(
+                liveChatId=self.live_chat_id,
+                part="snippet,authorDetails",
+                pageToken=self.page_token,
+            )
+            response = await asyncio.to_thread(request.execute)
+        except Exception as e:
+            if _has_reason(e, CHAT_ENDED_ERRORS):
+                log.info(f"--- CHAT ENDED [{self.video_id}] ---")
+                self.ended = True
+                self.tokens.remove(self.video_id)
+                return None
+            if _has_reason(e, QUOTA_ERRORS):
+                delay = self.limiter.quota_exceeded()
+                log.warning(f"🔥 QUOTA EXCEEDED! Every channel waits {delay:.0f} seconds...")
+                return delay
+            delay = self._error_delay()
+            log.error(f"❌ [{self.video_id}] Error fetching chat, retrying in {delay:.0f}s: {e}")
+            return delay
+
+        self.errors = 0
+        self.limiter.quota_ok()
+        self.polls += 1
+        wait_seconds = max(self.min_interval, response.get("pollingIntervalMillis", 10000) / 1000.0)
+
+        payload = [message for message in (to_payload(item, self.video_id) for item in response.get("items", [])) if message]
+        if payload:
+            sent = await self.forward(self.video_id, payload)
+            if sent is False:
+                # Same page token next time, so these messages are fetched again
+                return max(wait_seconds, self._error_delay())
+            if sent is not True:
+                # The server is busy: same page again, once it is ready for it
+                self.deferred += 1
+                return max(wait_seconds, float(sent))
+            self.messages += len(payload)
+            log.debug(f"💬 [{self.video_id}] Forwarded {len(payload)} new messages.")
+
+        self.page_token = response.get("nextPageToken") or self.page_token
+        self.tokens.update(self.video_id, live_chat_id=self.live_chat_id, page_token=self.page_token)
+        return wait_seconds
+
+    async def run(self):
+        while True:
+            found = await self.resolve_chat_id()
+            if found is True:
+                break
+            if found is False:
+                self.ended = True
+                return
+            await asyncio.sleep(found)
+
+        while True:
+            delay = await self.poll_once()
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {"polls": self.polls, "messages": self.messages, "errors": self.errors, "deferred": self.deferred, "ended": self.ended}
+
+
+class ChatPoller:
+    """
+    Polls the live chats of many videos at once on one event loop.
+    Every channel keeps its own page token and schedule, and they all
+    share one quota budget.
+
+    `service_factory()` builds a YouTube API client. Each channel gets
+    its own, because the clients are not safe to share between threads.
+    `on_end(video_id)` (optional, awaitable) is called when a chat is over.
+    """
+
+    def __init__(self, service_factory, forward, state_file: str, units_per_day: float = 10000,
+                 burst: float = 100, on_end=None, min_interval: float = 1.0):
+        self.service_factory = service_factory
+        self.forward = forward
+        self.on_end = on_end
+        self.min_interval = min_interval
+        self.limiter = QuotaLimiter(units_per_day=units_per_day, burst=burst)
+        self.tokens = PageTokenStore(state_file)
+        self.channels = {}
+        self._tasks = {}
+
+    def add(self, video_id: str):
+        """
+        Starts polling a video (must be called inside the event loop).
+        """
+        if video_id in self._tasks:
+            return
+        channel = ChannelPoller(
+            video_id,
+            self.service_factory(),
+            self.limiter,
+            self.tokens,
+            self.forward,
+            min_interval=self.min_interval,
+        )
+        if channel.page_token:
+            log.info(f"↩️ [{video_id}] Resuming from the saved page token.")
+        self.channels[video_id] = channel
+        self._tasks[video_id] = asyncio.create_task(self._run_channel(channel))
+
+    async def _run_channel(self, channel: ChannelPoller):
+        try:
+            await channel.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"❌ [{channel.video_id}] Poller stopped: {e}")
+        if channel.ended and self.on_end is not None:
+            try:
+                await self.on_end(channel.video_id)
+            except Exception as e:
+                log.warning(f"⚠️ [{channel.video_id}] Could not report the end of the chat: {e}")
+
+    async def run(self, video_ids):
+        """
+        Polls until every chat is over (or the task is cancelled).
+        """
+        for video_id in video_ids:
+            self.add(video_id)
+        try:
+            while self._tasks:
+                await asyncio.wait(list(self._tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+                self._tasks = {video_id: task for video_id, task in self._tasks.items() if not task.done()}
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "quota": self.limiter.stats(),
+            "channels": {video_id: channel.stats() for video_id, channel in self.channels.items()},
+        }
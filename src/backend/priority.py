@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# Why a message goes to the high-priority lane
+PRIORITY_REASONS = ("super_chat", "lexicon", "toxic_author")
+LANES = ("high", "normal")
+
+
+class ToxicAuthors:
+    """
+    Authors who wrote a toxic message in the last `window_seconds`.
+    At most `capacity` are remembered, the ones flagged longest ago go first.
+    """
+
+    def __init__(self, window_seconds: float = 900.0, capacity: int = 10000, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self._clock = clock
+        self._flagged = OrderedDict() # author -> when they were last toxic
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._flagged)
+
+    def __contains__(self, author) -> bool:
+        flagged = self._flagged.get(author)
+        return flagged is not None and self._clock() - flagged <= self.window_seconds
+
+    def flag(self, author):
+        if author is None:
+            return
+        self._flagged[author] = self._clock()
+        self._flagged.move_to_end(author)
+        while len(self._flagged) > self.capacity:
+            self._flagged.popitem(last=False)
+
+    def _expire(self):
+        # Oldest first, so stop at the first one still inside the window
+        limit = self._clock() - self.window_seconds
+        while self._flagged:
+            author, flagged = next(iter(self._flagged.items()))
+            if flagged >= limit:
+                break
+            del self._flagged[author]
+
+
+class PriorityLanes:
+    """
+    Picks the messages a moderator should see first: Super Chats, lexicon
+    hits and messages of authors who were toxic recently. These skip
+    ahead of everything else in the batcher and are never sampled out.
+
+    observe() keeps the latest `window` latencies of each lane (from the
+    message reaching the server to its analysis being done) for the
+    percentiles, and counts how often the high lane missed `slo_seconds`.
+    """
+
+    def __init__(self, enabled: bool = True, slo_seconds: float = 2.0,
+                 toxic_window_seconds: float = 900.0, window: int = 1000):
+        self.enabled = enabled
+        self.slo_seconds = slo_seconds
+        self.toxic_authors = ToxicAuthors(toxic_window_seconds)
+
+        self.reason_counts = dict.fromkeys(PRIORITY_REASONS, 0)
+        self.slo_met = 0
+        self.slo_missed = 0
+        self._latencies = {lane: deque(maxlen=window) for lane in LANES}
+        self._counts = dict.fromkeys(LANES, 0)
+
+    def reasons(self, author, lexicon_hit: bool, super_chat: bool) -> list:
+        """
+        Why this message is high priority, [] if it isn't.
+        """
+        if not self.enabled:
+            return []
+        reasons = []
+        if super_chat:
+            reasons.append("super_chat")
+        if lexicon_hit:
+            reasons.append("lexicon")
+        if author in self.toxic_authors:
+            reasons.append("toxic_author")
+        for reason in reasons:
+            self.reason_counts[reason] += 1
+        return reasons
+
+    def observe(self, lane: str, seconds: float) -> bool:
+        """
+        Records one message's latency. False if it was a high-priority
+        message that missed the SLO.
+        """
+        self._latencies[lane].append(seconds)
+        self._counts[lane] += 1
+        if lane != "high":
+            return True
+        if seconds <= self.slo_seconds:
+            self.slo_met += 1
+            return True
+        self.slo_missed += 1
+        return False
+
+    def stats(self) -> dict:
+        lanes = {}
+        for lane, latencies in self._latencies.items():
+            percentiles = np.percentile(latencies, [50, 95, 99]).tolist() if latencies else [None] * 3
+            lanes[lane] = {
+                "messages": self._counts[lane],
+                **dict(zip(("latency_p50", "latency_p95", "latency_p99"), percentiles)),
+            }
+
+        observed = self.slo_met + self.slo_missed
+        return {
+            "enabled": self.enabled,
+            "slo_seconds": self.slo_seconds,
+            "slo_met": self.slo_met,
+            "slo_missed": self.slo_missed,
+            "slo_met_share": self.slo_met / observed if observed else 1.0,
+            "reasons": dict(self.reason_counts),
+            "toxic_authors": len(self.toxic_authors),
+            "lanes": lanes,
+        }
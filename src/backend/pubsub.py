@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+
+def format_sse(event: str, data) -> str:
+    """
+    One Server-Sent Events frame.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Broadcaster:
+    """
+    Fans events out to any number of subscribers.
+
+    Each subscriber has its own bounded buffer. A subscriber that can't
+    keep up loses its oldest events instead of slowing down everyone
+    else (or growing memory without limit).
+    """
+
+    def __init__(self, buffer_size: int = 100):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: str, data):
+        """
+        Must be called from the event loop thread.
+        """
+        self.published += 1
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait((event, data))
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count,
+            "buffer_size": self.buffer_size,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,93 @@
+"""
+Compares the optimised (int8) models against the normal fp32 ones.
+
+Run from the src/ folder:
+    python -m backend.quant_eval
+    python -m backend.quant_eval --corpus my_chat_log.txt --json report.json
+"""
+import argparse
+import json
+import time
+
+from backend.corpus import CHAT_CORPUS
+from backend.model import (
+    MAX_SEQUENCE_LENGTH, _run_pipelines, _sentiment_from_output,
+    _toxicity_from_output, build_pipelines, clean_texts,
+)
+
+
+def _score(pipelines, texts: list, optimised: bool, batch_size: int):
+    scores = []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        for sentiment, tox_results_list in _run_pipelines(texts[start:start + batch_size], pipelines, optimised):
+            sentiment_label, sentiment_score = _sentiment_from_output(sentiment)
+            scores.append((sentiment_label, sentiment_score, _toxicity_from_output(tox_results_list)))
+    return scores, time.perf_counter() - started
+
+def compare(corpus=None, batch_size: int = 32) -> dict:
+    """
+    Scores the corpus with both model sets and reports how much they agree.
+    """
+    texts = [t for t in clean_texts(corpus or CHAT_CORPUS) if t]
+
+    reference, fp32_seconds = _score(build_pipelines(optimised=False), texts, False, batch_size)
+    optimised, int8_seconds = _score(build_pipelines(optimised=True), texts, True, batch_size)
+
+    sentiment_agree = sum(r[0] == o[0] for r, o in zip(reference, optimised))
+    toxic_agree = sum((r[2] > 0.5) == (o[2] > 0.5) for r, o in zip(reference, optimised))
+    sentiment_drift = [abs(r[1] - o[1]) for r, o in zip(reference, optimised)]
+    toxicity_drift = [abs(r[2] - o[2]) for r, o in zip(reference, optimised)]
+
+    disagreements = [
+        {"text": text, "fp32": list(r), "int8": list(o)}
+        for text, r, o in zip(texts, reference, optimised)
+        if r[0] != o[0] or (r[2] > 0.5) != (o[2] > 0.5)
+    ]
+
+    n = len(texts)
+    return {
+        "messages": n,
+        "max_sequence_length": MAX_SEQUENCE_LENGTH,
+        "sentiment_label_agreement": sentiment_agree / n if n else 1.0,
+        "toxic_label_agreement": toxic_agree / n if n else 1.0,
+        "sentiment_score_drift": {
+            "mean": sum(sentiment_drift) / n if n else 0.0,
+            "max": max(sentiment_drift, default=0.0),
+        },
+        "toxicity_score_drift": {
+            "mean": sum(toxicity_drift) / n if n else 0.0,
+            "max": max(toxicity_drift, default=0.0),
+        },
+        "fp32_seconds": fp32_seconds,
+        "int8_seconds": int8_seconds,
+        "speedup": fp32_seconds / int8_seconds if int8_seconds else None,
+        "disagreements": disagreements,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare int8 and fp32 model scores.")
+    parser.add_argument("--corpus", help="Text file with one chat message per line (default: backend/corpus.py)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    corpus = None
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = [line.rstrip("\n") for line in f]
+
+    report = compare(corpus, args.batch_size)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    print(f"📏 Messages compared:        {report['messages']}")
+    print(f"✅ Sentiment label agreement: {report['sentiment_label_agreement']:.2%}")
+    print(f"✅ Toxic label agreement:     {report['toxic_label_agreement']:.2%}")
+    print(f"📉 Sentiment drift mean/max:  {report['sentiment_score_drift']['mean']:.4f} / {report['sentiment_score_drift']['max']:.4f}")
+    print(f"📉 Toxicity drift mean/max:   {report['toxicity_score_drift']['mean']:.4f} / {report['toxicity_score_drift']['max']:.4f}")
+    print(f"⏱️ fp32 {report['fp32_seconds']:.2f}s vs int8 {report['int8_seconds']:.2f}s")
+    for d in report["disagreements"]:
+        print(f"   ≠ {d['text']!r}: fp32={d['fp32']} int8={d['int8']}")
@@ -0,0 +1,99 @@
+import math
+import sys
+from array import array
+
+from backend.storage import COLUMNS, FLOAT_COLUMNS, INTEGER_COLUMNS
+
+# Few distinct values (or the same author over and over): one shared
+# string object each instead of a copy per row
+INTERNED_COLUMNS = ("author", "sentiment_label", "toxicity_label", "error")
+
+
+def _new_columns() -> dict:
+    # Scores are plain C doubles (NaN when missing), counts C longs (0 when missing)
+    return {
+        name: array("d") if name in FLOAT_COLUMNS else array("q") if name in INTEGER_COLUMNS else []
+        for name in COLUMNS
+    }
+
+
+class RecordBatch:
+    """
+    Rows drained from a RecordBuffer, one sequence per column of the
+    storage SCHEMA. What the stores write from, without a DataFrame.
+    """
+
+    __slots__ = ("columns", "size")
+
+    def __init__(self, columns: dict, size: int):
+        self.columns = columns
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def values(self, name: str) -> list:
+        """
+        The column as Python values, None where a row had none.
+        Columns a batch doesn't have (e.g. from an older file) are all None.
+        """
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * self.size
+        if name in FLOAT_COLUMNS:
+            return [None if math.isnan(value) else value for value in column]
+        if name in INTEGER_COLUMNS:
+            return [value or None for value in column]
+        return column
+
+    @classmethod
+    def from_rows(cls, rows: list) -> "RecordBatch":
+        buffer = RecordBuffer(capacity=len(rows))
+        for row in rows:
+            buffer.append(row)
+        return buffer.drain()
+
+
+class RecordBuffer:
+    """
+    Analysed rows waiting to be saved, kept column by column rather than
+    as one dict per message: the dict can be freed as soon as it is added,
+    and a flush hands the columns to the store as they are.
+
+    append() returns False when `capacity` rows are already waiting.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._columns = _new_columns()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, row: dict) -> bool:
+        if self._size >= self.capacity:
+            return False
+
+        get = row.get
+        for name, column in self._columns.items():
+            value = get(name)
+            if name in FLOAT_COLUMNS:
+                column.append(math.nan if value is None else value)
+            elif name in INTEGER_COLUMNS:
+                column.append(value or 0)
+            elif name in INTERNED_COLUMNS and isinstance(value, str):
+                column.append(sys.intern(value))
+            else:
+                column.append(value)
+        self._size += 1
+        return True
+
+    def drain(self) -> RecordBatch:
+        """
+        Takes every waiting row out, the buffer starts again empty.
+        """
+        batch = RecordBatch(self._columns, self._size)
+        self._columns = _new_columns()
+        self._size = 0
+        return batch
@@ -0,0 +1,525 @@
+"""
+Replays a recorded or synthetic live chat through the real pipeline
+(chat poller -> chat.py -> saved file) with a fake YouTube API, and
+reports throughput, queue depth, dropped messages and how long messages
+take to reach the disk. No API key or quota needed.
+
+Start the server first (or pass --start-server), then from the src/ folder:
+    python -m backend.replay --rate 50 --duration 120 --streams 3
+    python -m backend.replay --recording chat_log.jsonl --speed 10 --json report.json
+
+A recording is a JSONL file with one liveChatMessages item per line
+(what the API returns in 'items'), or simpler lines such as
+    {"published_at": "2025-01-01T20:00:03Z", "author": "someone", "text": "hi"}
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.corpus import CHAT_CORPUS
+from backend.poller import LIST_MESSAGES_COST, LIST_VIDEOS_COST, ChatPoller, retry_after_seconds
+from backend.storage import open_store
+
+SERVER_URL = "http://127.0.0.1:8080"
+DASHBOARD_CONFIG_FILE = "current_stream.txt"
+MAX_PAGE_SIZE = 2000 # The most liveChatMessages returns in one page
+
+# Spam waves: many viewers pasting the same thing within a few seconds
+COPYPASTA = [
+    "🔥🔥🔥 LETS GOOOO 🔥🔥🔥",
+    "W W W W W W",
+    "this stream is trash lmao 💀💀",
+    "FREE GIFT CARDS at http://spam-link.com",
+    "F in the chat",
+]
+
+
+def synthetic_chat(rate: float, duration: float, seed: int = 0, burst_every: float = 30.0,
+                   burst_size: int = 200, burst_seconds: float = 3.0, authors: int = 500) -> list:
+    """
+    (offset seconds, author, text, message id) at `rate` messages per
+    second on average, plus a spam wave every ~`burst_every` seconds.
+    A few viewers write most of the messages, like in a real chat.
+    """
+    rng = random.Random(seed)
+    names = [f"viewer{i}" for i in range(authors)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(authors)))
+
+    events = []
+    offset = rng.expovariate(rate) if rate > 0 else duration
+    while offset < duration:
+        events.append((offset, rng.choices(names, cum_weights=cum_weights)[0], rng.choice(CHAT_CORPUS)))
+        offset += rng.expovariate(rate)
+
+    start = burst_every
+    while burst_every > 0 and start < duration:
+        text = rng.choice(COPYPASTA)
+        for _ in range(burst_size):
+            events.append((start + rng.uniform(0, burst_seconds), rng.choice(names), text))
+        start += burst_every * rng.uniform(0.5, 1.5)
+
+    events.sort(key=lambda event: event[0])
+    return [(offset, author, text, f"s{seed}-{i}") for i, (offset, author, text) in enumerate(events)]
+
+
+def _parse_time(value) -> float:
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def load_recording(path: str) -> list:
+    """
+    A recorded chat as (offset seconds, author, text, message id),
+    offsets counted from the first message.
+    """
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "snippet" in item:
+                published = item["snippet"].get("publishedAt")
+                author = item.get("authorDetails", {}).get("displayName")
+                text = item["snippet"].get("displayMessage")
+                message_id = item.get("id")
+            else:
+                published = item.get("published_at")
+                author = item.get("author")
+                text = item.get("text")
+                message_id = item.get("message_id")
+            if not text:
+                continue
+            rows.append((_parse_time(published), author, text, message_id or f"r{line_number}"))
+
+    rows.sort(key=lambda row: row[0])
+    first = rows[0][0] if rows else 0.0
+    return [(published - first, author, text, message_id) for published, author, text, message_id in rows]
+
+
+def write_recording(chat: list, path: str, started_at: float = None): # type: ignore
+    # The same simple format load_recording reads
+    started_at = started_at or time.time()
+    with open(path, "w", encoding="utf-8") as f:
+        for offset, author, text, message_id in chat:
+            published = datetime.fromtimestamp(started_at + offset, tz=timezone.utc).isoformat()
+            f.write(json.dumps({"published_at": published, "author": author, "text": text, "message_id": message_id}) + "\n")
+
+
+class ReplayChat:
+    """
+    One video's chat on the replay clock: a message "arrives" at
+    started_at + offset / speed, wall-clock time.
+    """
+
+    def __init__(self, video_id: str, messages: list, started_at: float, speed: float = 1.0):
+        self.video_id = video_id
+        self.live_chat_id = f"replay-chat-{video_id}"
+        self.messages = messages
+        self.offsets = [message[0] for message in messages]
+        self.started_at = started_at
+        self.speed = speed
+
+    def published_at(self, index: int) -> float:
+        return self.started_at + self.offsets[index] / self.speed
+
+    def visible(self, now: float) -> int:
+        # How many messages have arrived by `now`
+        return bisect.bisect_right(self.offsets, (now - self.started_at) * self.speed)
+
+    def item(self, index: int) -> dict:
+        _, author, text, message_id = self.messages[index]
+        published = datetime.fromtimestamp(self.published_at(index), tz=timezone.utc)
+        return {
+            "id": message_id,
+            "snippet": {"displayMessage": text, "publishedAt": published.isoformat()},
+            "authorDetails": {"displayName": author},
+        }
+
+
+_usage_lock = threading.Lock()
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"<HttpError {status} \"{reason}\">")
+
+
+class _Request:
+    def __init__(self, call, **kwargs):
+        self.call = call
+        self.kwargs = kwargs
+
+    def execute(self):
+        return self.call(**self.kwargs)
+
+
+class _Resource:
+    def __init__(self, call):
+        self.call = call
+
+    def list(self, **kwargs):
+        return _Request(self.call, **kwargs)
+
+
+class FakeYouTube:
+    """
+    Stands in for the googleapiclient YouTube client: answers
+    videos().list and liveChatMessages().list from ReplayChat timelines.
+    When everything was delivered, the chat ends like a real one does.
+    """
+
+    def __init__(self, chats: dict, polling_interval_ms: int = 2000, page_size: int = MAX_PAGE_SIZE, usage: dict = None): # type: ignore
+        self.chats = chats
+        self.by_chat_id = {chat.live_chat_id: chat for chat in chats.values()}
+        self.polling_interval_ms = polling_interval_ms
+        self.page_size = min(page_size, MAX_PAGE_SIZE)
+        # Shared by all the clients of a replay: API calls and quota units
+        self.usage = usage if usage is not None else {"calls": 0, "units": 0}
+
+    def _count(self, units: int):
+        with _usage_lock:
+            self.usage["calls"] += 1
+            self.usage["units"] += units
+
+    def videos(self):
+        return _Resource(self._list_videos)
+
+    def liveChatMessages(self):
+        return _Resource(self._list_messages)
+
+    def _list_videos(self, id, part=None):
+        self._count(LIST_VIDEOS_COST)
+        chat = self.chats.get(id)
+        if chat is None:
+            return {"items": []}
+        return {"items": [{"id": id, "liveStreamingDetails": {"activeLiveChatId": chat.live_chat_id}}]}
+
+    def _list_messages(self, liveChatId, part=None, pageToken=None, maxResults=None):
+        self._count(LIST_MESSAGES_COST)
+        chat = self.by_chat_id.get(liveChatId)
+        if chat is None:
+            raise FakeHttpError(404, "liveChatNotFound")
+
+        start = int(pageToken or 0)
+        if start >= len(chat.messages):
+            raise FakeHttpError(403, "liveChatEnded")
+
+        visible = chat.visible(time.time())
+        end = min(visible, start + min(maxResults or self.page_size, self.page_size))
+        return {
+            "items": [chat.item(i) for i in range(start, end)],
+            "nextPageToken": str(end),
+            # More already waiting: come back right away
+            "pollingIntervalMillis": self.polling_interval_ms if end >= visible else 0,
+        }
+
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def at(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": values[-1],
+    }
+
+
+class DiskWatcher:
+    """
+    Tails the stream files in a background thread and notes when each
+    message id is first seen on disk, and when the server analysed it.
+    """
+
+    def __init__(self, paths, interval: float = 0.1):
+        self.stores = {path: open_store(path) for path in paths}
+        self.offsets = dict.fromkeys(paths, 0)
+        self.interval = interval
+        self.seen = {} # message id -> (seen on disk, analysed at)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="disk-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.poll() # Whatever was written last
+        for store in self.stores.values():
+            store.close()
+
+    def poll(self):
+        for path, store in self.stores.items():
+            rows, self.offsets[path] = store.read_since(self.offsets[path])
+            now = time.time()
+            for message_id, analysed_at in zip(rows["message_id"], rows["timestamp"]):
+                if isinstance(message_id, str) and message_id not in self.seen:
+                    self.seen[message_id] = (now, None if pd.isna(analysed_at) else analysed_at.timestamp())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                pass # The file may be mid-write, try again next time
+
+
+class ReplayHarness:
+    """
+    Registers the replay streams with the server, runs the real chat
+    poller against the fake API, and measures what reaches the disk.
+    """
+
+    def __init__(self, chats: dict, server_url: str = SERVER_URL, speed: float = 1.0,
+                 polling_interval_ms: int = 2000, page_size: int = MAX_PAGE_SIZE,
+                 quota_per_day: float = 1e9, data_root: str = ".", point_dashboard: bool = False):
+        self.chats = chats # video id -> [(offset, author, text, message id)]
+        self.server_url = server_url.rstrip("/")
+        self.speed = speed
+        self.polling_interval_ms = polling_interval_ms
+        self.page_size = page_size
+        self.quota_per_day = quota_per_day
+        self.data_root = data_root
+        self.point_dashboard = point_dashboard
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=max(4, len(chats))))
+
+        self.files = {}
+        self.sent = {} # message id -> sent at
+        self.rejected = 0
+        self.deferred = 0
+        self.send_failures = 0
+        self.depth_samples = []
+
+    def register_streams(self):
+        for video_id in self.chats:
+            res = self.session.post(f"{self.server_url}/set_stream", json={"url": f"https://www.youtube.com/watch?v={video_id}"}, timeout=10)
+            data = res.json()
+            if not data.get("file"):
+                raise RuntimeError(f"Server refused stream {video_id}: {data.get('error', res.text)}")
+            self.files[video_id] = data["file"]
+
+        if self.point_dashboard:
+            with open(DASHBOARD_CONFIG_FILE, "w") as f:
+                f.write(next(iter(self.files.values())))
+
+    def _send(self, payload):
+        try:
+            res = self.session.post(f"{self.server_url}/fetch_chat_batch", json=payload, timeout=30)
+        except requests.RequestException:
+            self.send_failures += 1
+            return False
+        if res.status_code in (429, 503):
+            # Busy: the poller sends the page again after Retry-After, like bot.py
+            self.deferred += 1
+            return retry_after_seconds(res.headers.get("Retry-After"), 1.0)
+        if not res.ok:
+            self.send_failures += 1
+            return False
+
+        now = time.time()
+        for message in payload:
+            self.sent.setdefault(message["message_id"], now)
+        self.rejected += res.json().get("rejected", 0)
+        return True
+
+    async def forward(self, video_id, payload):
+        return await asyncio.to_thread(self._send, payload)
+
+    async def end_stream(self, video_id):
+        # Makes the server save what is left of the stream right away
+        await asyncio.to_thread(self.session.post, f"{self.server_url}/end_stream", json={"stream_id": video_id}, timeout=30)
+
+    async def sample_queue_depth(self, interval: float = 0.5):
+        while True:
+            try:
+                res = await asyncio.to_thread(self.session.get, f"{self.server_url}/streams", timeout=5)
+                depth = sum(
+                    stream.get("queued", 0) + stream.get("awaiting_analysis", 0)
+                    for stream in res.json().get("streams", []) if stream["stream_id"] in self.chats
+                )
+                self.depth_samples.append(depth)
+            except Exception:
+                pass
+            await asyncio.sleep(interval)
+
+    async def run(self, drain_timeout: float = 60.0) -> dict:
+        self.register_streams()
+        watcher = DiskWatcher([os.path.join(self.data_root, path) for path in self.files.values()]).start()
+
+        started_at = time.time()
+        timelines = {video_id: ReplayChat(video_id, messages, started_at, self.speed) for video_id, messages in self.chats.items()}
+        usage = {"calls": 0, "units": 0}
+        state_dir = tempfile.mkdtemp(prefix="replay_")
+        poller = ChatPoller(
+            service_factory=lambda: FakeYouTube(timelines, self.polling_interval_ms, self.page_size, usage),
+            forward=self.forward,
+            state_file=os.path.join(state_dir, "poller_state.json"),
+            units_per_day=self.quota_per_day,
+            on_end=self.end_stream,
+        )
+
+        sampler = asyncio.create_task(self.sample_queue_depth())
+        try:
+            await poller.run(list(self.chats))
+            # Everything was sent, wait for the last rows to be saved
+            deadline = time.time() + drain_timeout
+            while time.time() < deadline and not all(message_id in watcher.seen for message_id in self.sent):
+                await asyncio.sleep(0.2)
+        finally:
+            sampler.cancel()
+            watcher.stop()
+
+        return self.report(timelines, watcher.seen, started_at, usage)
+
+    def report(self, timelines: dict, seen: dict, started_at: float, usage: dict) -> dict:
+        published = {}
+        for chat in timelines.values():
+            for i, message in enumerate(chat.messages):
+                published[message[3]] = chat.published_at(i)
+
+        saved = [message_id for message_id in self.sent if message_id in seen]
+        finished_at = max((seen[message_id][0] for message_id in saved), default=time.time())
+        wall_seconds = max(finished_at - started_at, 1e-9)
+
+        return {
+            "streams": len(timelines),
+            "speed": self.speed,
+            "chat_seconds": max((chat.offsets[-1] for chat in timelines.values() if chat.offsets), default=0.0),
+            "wall_seconds": wall_seconds,
+            "messages_in_chat": len(published),
+            "messages_sent": len(self.sent),
+            "messages_saved": len(saved),
+            "dropped": len(self.sent) - len(saved),
+            "rejected_by_server": self.rejected,
+            "deferred_by_server": self.deferred,
+            "send_failures": self.send_failures,
+            "throughput_msgs_per_second": len(saved) / wall_seconds,
+            "queue_depth": {
+                "max": max(self.depth_samples, default=0),
+                "mean": sum(self.depth_samples) / len(self.depth_samples) if self.depth_samples else 0.0,
+                "samples": len(self.depth_samples),
+            },
+            "latency_seconds": {
+                # Arrived at the (fake) API -> on disk: what a viewer of the dashboard waits
+                "publish_to_disk": percentiles(seen[m][0] - published[m] for m in saved if m in published),
+                # Handed to the server -> analysed, and -> on disk
+                "send_to_analysed": percentiles(seen[m][1] - self.sent[m] for m in saved if seen[m][1] is not None),
+                "send_to_disk": percentiles(seen[m][0] - self.sent[m] for m in saved),
+            },
+            "api": usage,
+            "files": self.files,
+        }
+
+
+def start_server(server_url: str, timeout: float = 600.0):
+    """
+    Runs chat.py in a child process and waits until its models are ready.
+    """
+    port = urlparse(server_url).port or 8080
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "chat:app", "--port", str(port), "--log-level", "warning"],
+        cwd=src_dir,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server exited during startup.")
+        try:
+            # The API answers right away, /readyz once the models are loaded
+            if requests.get(f"{server_url.rstrip('/')}/readyz", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"The server did not answer within {timeout:.0f}s.")
+
+
+def _print_latency(name: str, stats: dict):
+    if not stats.get("count"):
+        print(f"⏱️ {name:<17} no data")
+        return
+    print(f"⏱️ {name:<17} p50 {stats['p50']:.2f}s  p95 {stats['p95']:.2f}s  p99 {stats['p99']:.2f}s  max {stats['max']:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a live chat through the pipeline with a fake YouTube API.")
+    parser.add_argument("--recording", help="JSONL chat log to replay (default: a synthetic chat)")
+    parser.add_argument("--rate", type=float, default=20.0, help="Synthetic messages per second, per stream")
+    parser.add_argument("--duration", type=float, default=60.0, help="Synthetic chat length in seconds")
+    parser.add_argument("--burst-every", type=float, default=30.0, help="Seconds between spam waves (0 for none)")
+    parser.add_argument("--burst-size", type=int, default=200, help="Messages per spam wave")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--streams", type=int, default=1, help="How many streams to replay at once")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, e.g. 10 plays a minute of chat in 6 seconds")
+    parser.add_argument("--poll-ms", type=int, default=2000, help="pollingIntervalMillis the fake API asks for")
+    parser.add_argument("--quota-per-day", type=float, default=1e9, help="Quota units per day (10000 to act like a real key)")
+    parser.add_argument("--server", default=SERVER_URL)
+    parser.add_argument("--start-server", action="store_true", help="Run chat.py for the replay and stop it afterwards")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="How long to wait for the last rows to be saved")
+    parser.add_argument("--point-dashboard", action="store_true", help=f"Write the first stream's file to {DASHBOARD_CONFIG_FILE}")
+    parser.add_argument("--save-chat", help="Also write the replayed chat(s) as a recording (one file per stream, suffixed)")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    chats = {}
+    for n in range(args.streams):
+        video_id = f"replay{n}"
+        if args.recording:
+            # Every stream gets its own message ids, so they can be told apart on disk
+            chats[video_id] = [(o, a, t, f"{video_id}-{m}") for o, a, t, m in load_recording(args.recording)]
+        else:
+            chats[video_id] = synthetic_chat(args.rate, args.duration, args.seed + n, args.burst_every, args.burst_size)
+        if args.save_chat:
+            write_recording(chats[video_id], f"{args.save_chat}.{video_id}.jsonl")
+
+    server = start_server(args.server) if args.start_server else None
+    try:
+        harness = ReplayHarness(
+            chats, args.server, args.speed, args.poll_ms,
+            quota_per_day=args.quota_per_day, point_dashboard=args.point_dashboard,
+        )
+        report = asyncio.run(harness.run(args.drain_timeout))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    print(f"📺 Streams replayed:        {report['streams']} at {report['speed']}x ({report['chat_seconds']:.0f}s of chat in {report['wall_seconds']:.1f}s)")
+    print(f"📨 Sent / saved:            {report['messages_sent']} / {report['messages_saved']} (of {report['messages_in_chat']} in the chat)")
+    print(f"🗑️ Dropped:                 {report['dropped']} (rejected by server: {report['rejected_by_server']}, failed sends: {report['send_failures']})")
+    print(f"⏳ Pages deferred (busy):   {report['deferred_by_server']}")
+    print(f"🚀 Throughput:              {report['throughput_msgs_per_second']:.1f} msgs/s")
+    print(f"📦 Queue depth max/mean:    {report['queue_depth']['max']} / {report['queue_depth']['mean']:.1f}")
+    for name, stats in report["latency_seconds"].items():
+        _print_latency(name, stats)
+    print(f"🔑 API calls / quota units: {report['api']['calls']} / {report['api']['units']}")
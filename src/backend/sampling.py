@@ -0,0 +1,180 @@
+import math
+import random
+
+import numpy as np
+
+# Two-sided 95% confidence intervals
+Z_95 = 1.96
+
+
+class LoadShedder:
+    """
+    Under overload, only a sample of the messages goes to the models.
+
+    Below `start_load` (the share of the in-flight limit in use) every
+    message is analysed. Above it the sampling rate is start_load / load,
+    never below `min_rate`, which keeps the analysed part of the load at
+    about `start_load`. Messages with a lexicon hit (and empty ones, they
+    cost nothing) are always analysed.
+
+    weights() gives each message its sampling weight: 0 if it was left
+    out, otherwise how many messages it stands for (1 when not sampling,
+    1 / rate for a sampled one). With `mode` "uniform" every message is
+    kept with the same probability. With "author" each author's messages
+    in a page are sampled on their own, so the sample has the same share
+    of every author and one spammer can't crowd the others out of it.
+    """
+
+    MODES = ("uniform", "author")
+
+    def __init__(self, enabled: bool = False, start_load: float = 0.5,
+                 min_rate: float = 0.05, mode: str = "uniform", rng=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown sampling mode {mode!r}, expected one of {self.MODES}")
+        self.enabled = enabled
+        self.start_load = start_load
+        self.min_rate = min_rate
+        self.mode = mode
+        self._random = rng or random.Random()
+
+        self.current_rate = 1.0
+        self.analysed = 0
+        self.skipped = 0
+        self.protected = 0
+
+    def rate(self, load: float) -> float:
+        """
+        Share of the (unprotected) messages that get analysed at this load.
+        """
+        if not self.enabled or load <= self.start_load:
+            return 1.0
+        return max(self.min_rate, self.start_load / load)
+
+    def weights(self, authors: list, protected: list, rate: float) -> list:
+        """
+        Sampling weight per message; `protected` ones always get 1.
+        """
+        self.current_rate = rate
+        if rate >= 1.0:
+            self.analysed += len(authors)
+            return [1.0] * len(authors)
+
+        weights = [0.0] * len(authors)
+        if self.mode == "author":
+            strata = {}
+            for i, author in enumerate(authors):
+                if not protected[i]:
+                    strata.setdefault(author, []).append(i)
+            for indices in strata.values():
+                # floor(rate * n) messages, plus one more with the leftover
+                # probability: each message is kept with probability `rate`
+                expected = rate * len(indices)
+                keep = int(expected) + (self._random.random() < expected - int(expected))
+                for i in self._random.sample(indices, keep):
+                    weights[i] = 1.0 / rate
+        else:
+            for i in range(len(authors)):
+                if not protected[i] and self._random.random() < rate:
+                    weights[i] = 1.0 / rate
+
+        for i, is_protected in enumerate(protected):
+            if is_protected:
+                weights[i] = 1.0
+                self.protected += 1
+        kept = sum(1 for weight in weights if weight)
+        self.analysed += kept
+        self.skipped += len(authors) - kept
+        return weights
+
+    def stats(self) -> dict:
+        total = self.analysed + self.skipped
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "start_load": self.start_load,
+            "min_rate": self.min_rate,
+            "current_rate": self.current_rate,
+            "analysed": self.analysed,
+            "skipped": self.skipped,
+            "protected": self.protected,
+            "analysed_share": self.analysed / total if total else 1.0,
+        }
+
+
+class WeightedMean:
+    """
+    Running mean of values that carry sampling weights, with a 95%
+    confidence interval.
+
+    The interval uses Kish's effective sample size (sum(w)^2 / sum(w^2))
+    and a finite population correction: with every message of the
+    population analysed the mean is exact and the interval has no width.
+    """
+
+    __slots__ = ("n", "sum_w", "sum_w2", "sum_wx", "sum_wx2")
+
+    def __init__(self):
+        self.n = 0
+        self.sum_w = 0.0
+        self.sum_w2 = 0.0
+        self.sum_wx = 0.0
+        self.sum_wx2 = 0.0
+
+    def add(self, value: float, weight: float = 1.0):
+        self.n += 1
+        self.sum_w += weight
+        self.sum_w2 += weight * weight
+        self.sum_wx += weight * value
+        self.sum_wx2 += weight * value * value
+
+    def add_many(self, values, weights):
+        values = np.asarray(values, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        self.n += len(values)
+        self.sum_w += float(weights.sum())
+        self.sum_w2 += float((weights * weights).sum())
+        self.sum_wx += float((weights * values).sum())
+        self.sum_wx2 += float((weights * values * values).sum())
+
+    def mean(self, default: float = 0.0) -> float:
+        return self.sum_wx / self.sum_w if self.sum_w else default
+
+    def interval(self, population: int):
+        """
+        (low, high) around mean(), or None with fewer than 2 values.
+        `population` is how many messages the sample stands for.
+        """
+        if self.n < 2 or not self.sum_w:
+            return None
+
+        mean = self.mean()
+        variance = max(0.0, self.sum_wx2 / self.sum_w - mean * mean)
+        effective_n = self.sum_w * self.sum_w / self.sum_w2
+        correction = max(0.0, 1.0 - self.n / population) if population else 0.0
+        half_width = Z_95 * math.sqrt(variance / effective_n * correction)
+        return mean - half_width, mean + half_width
+
+
+def weighted_summary(sentiment: WeightedMean, toxicity: WeightedMean, skipped: int, total: int) -> dict:
+    """
+    The sentiment and toxicity numbers of /stats from the weighted means.
+    `toxicity` has a 1 for every toxic message and a 0 for every other
+    analysed one; `skipped` messages were left out of the sample, `total`
+    is every message, empty ones included.
+    Without sampling these are the plain counts and averages.
+    """
+    # Skipped messages are part of what the sample stands for
+    population = toxicity.n + skipped
+    toxic_share = toxicity.mean()
+    sentiment_interval = sentiment.interval(sentiment.n + skipped)
+    toxicity_interval = toxicity.interval(population)
+    return {
+        "avg_sentiment": sentiment.mean(),
+        "toxic_messages": round(toxic_share * population),
+        "toxicity_percent": toxic_share * population / total * 100 if total else 0.0,
+        "avg_sentiment_ci": list(sentiment_interval) if sentiment_interval else None,
+        "toxicity_percent_ci": [
+            min(1.0, max(0.0, bound)) * population / total * 100 for bound in toxicity_interval
+        ] if toxicity_interval else None,
+        "sampling": {"analysed": toxicity.n, "skipped": skipped, "weighted": skipped > 0},
+    }
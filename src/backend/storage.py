@@ -0,0 +1,337 @@
+import asyncio
+import csv
+import io
+import itertools
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import aiofiles
+
+# pandas is only imported where it's used: the server starts faster,
+# and it's already loaded in the dashboard anyway
+if TYPE_CHECKING:
+    import pandas as pd
+
+# "csv" (default) or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv").lower()
+
+# Every column we save, with its SQLite type
+SCHEMA = [
+    ("timestamp", "INTEGER"), # microseconds since the epoch, UTC
+    ("author", "TEXT"),
+    ("original_message", "TEXT"),
+    ("cleaned_message", "TEXT"),
+    ("sentiment_label", "TEXT"),
+    ("sentiment_score", "REAL"),
+    ("toxicity_label", "TEXT"),
+    ("toxicity_score", "REAL"),
+    ("error", "TEXT"),
+    ("message_id", "TEXT"),
+    ("published_at", "INTEGER"), # microseconds since the epoch, UTC
+    ("cluster_id", "TEXT"),      # near-duplicate cluster (backend/dedup.py)
+    ("cluster_size", "INTEGER"), # messages in the cluster so far, this one included
+    ("sample_weight", "REAL"),   # messages this row stands for, 0 if it wasn't analysed (backend/sampling.py)
+]
+COLUMNS = [name for name, _ in SCHEMA]
+TIMESTAMP_COLUMNS = ["timestamp", "published_at"]
+FLOAT_COLUMNS = [name for name, sql_type in SCHEMA if sql_type == "REAL"]
+INTEGER_COLUMNS = [name for name, sql_type in SCHEMA if sql_type == "INTEGER" and name not in TIMESTAMP_COLUMNS]
+# Rows serialised per write when a CSV batch is saved
+CSV_WRITE_ROWS = 1000
+
+
+def _to_micros(value):
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1_000_000)
+    except ValueError:
+        return None
+
+def empty_frame() -> "pd.DataFrame":
+    import pandas as pd
+    return pd.DataFrame(columns=COLUMNS)
+
+
+class ChatStore(ABC):
+    """
+    Where analysed messages end up. batch_saver appends to it (a
+    RecordBatch, see backend/records.py), the dashboard reads from it.
+
+    read_since(offset) returns (new rows, next offset). Start with offset 0
+    and pass the returned offset back in to only get the rows added since.
+    """
+
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @abstractmethod
+    async def append(self, batch):
+        ...
+
+    @abstractmethod
+    def read_since(self, offset: int = 0):
+        ...
+
+    @abstractmethod
+    def end_offset(self) -> int:
+        """
+        The offset right after the last saved row.
+        """
+
+    def close(self):
+        pass
+
+
+class CsvStore(ChatStore):
+    """
+    The original format: one CSV per stream, the header is written
+    with the first batch. Offsets are byte positions in the file.
+    """
+
+    extension = ".csv"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._columns = None
+
+    def _file_columns(self) -> list:
+        # A file written before a column was added keeps its own header,
+        # new rows are written in that layout
+        if self._columns is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    header = f.readline()
+            except FileNotFoundError:
+                return COLUMNS
+            if not header.endswith("\n"):
+                return COLUMNS
+            self._columns = header.strip().split(",")
+        return self._columns
+
+    async def append(self, batch):
+        file_exists = os.path.exists(self.path)
+        if not file_exists:
+            self._columns = None
+        columns = self._file_columns() if file_exists else COLUMNS
+
+        # Straight from the columns, the same text pandas' to_csv wrote.
+        # A few thousand rows at a time, so a big batch isn't one huge string.
+        rows = zip(*(batch.values(name) for name in columns))
+        async with aiofiles.open(self.path, mode='a', newline='', encoding='utf-8') as f:
+            for start in range(0, len(batch) or 1, CSV_WRITE_ROWS):
+                text = io.StringIO()
+                writer = csv.writer(text, lineterminator="\n")
+                if start == 0 and not file_exists:
+                    writer.writerow(columns)
+                writer.writerows(itertools.islice(rows, CSV_WRITE_ROWS))
+                await f.write(text.getvalue())
+
+    def read_since(self, offset: int = 0):
+        if not os.path.exists(self.path):
+            return empty_frame(), 0
+
+        with open(self.path, "rb") as f:
+            header = f.readline()
+            if not header.endswith(b"\n"):
+                # The first batch is still being written
+                return empty_frame(), 0
+
+            f.seek(max(offset, len(header)))
+            chunk = f.read()
+
+        # Only parse whole lines, a batch may be half written right now
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return empty_frame(), max(offset, len(header))
+
+        import pandas as pd
+        names = header.decode("utf-8").strip().split(",")
+        try:
+            df = pd.read_csv(io.BytesIO(chunk[:end]), header=None, names=names)
+        except pd.errors.ParserError:
+            # Most likely a quoted message with a newline cut in half, try again later
+            return empty_frame(), max(offset, len(header))
+
+        return self._convert(df), max(offset, len(header)) + end
+
+    def end_offset(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _convert(df: "pd.DataFrame") -> "pd.DataFrame":
+        import pandas as pd
+        # CSV has no types, so they are restored here for every reader
+        for column in TIMESTAMP_COLUMNS:
+            if column in df:
+                df[column] = pd.to_datetime(df[column], errors="coerce", utc=True, format="ISO8601")
+        for column in FLOAT_COLUMNS:
+            if column in df:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+        for column in INTEGER_COLUMNS:
+            if column in df:
+                df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+        return df
+
+
+class SqliteStore(ChatStore):
+    """
+    One SQLite file per stream, in WAL mode so the dashboard can read
+    while the server writes. Scores are REAL and timestamps INTEGER
+    microseconds, so nothing has to be parsed back from text.
+    Offsets are rowids.
+    """
+
+    extension = ".db"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn = None
+
+    def _writer(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            columns = ", ".join(f"{name} {sql_type}" for name, sql_type in SCHEMA)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, {columns})")
+            # Files from before a column was added get it now
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+            for name, sql_type in SCHEMA:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE messages ADD COLUMN {name} {sql_type}")
+            self._conn.commit()
+        return self._conn
+
+    def _append_rows(self, batch):
+        columns = [
+            [_to_micros(value) for value in batch.values(name)] if name in TIMESTAMP_COLUMNS else batch.values(name)
+            for name in COLUMNS
+        ]
+        conn = self._writer()
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        with conn:
+            conn.executemany(f"INSERT INTO messages ({', '.join(COLUMNS)}) VALUES ({placeholders})", zip(*columns))
+
+    async def append(self, batch):
+        await asyncio.to_thread(self._append_rows, batch)
+
+    def read_since(self, offset: int = 0):
+        if not os.path.exists(self.path):
+            return empty_frame(), offset
+
+        import pandas as pd
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            df = pd.read_sql_query(
+                f"SELECT id, {', '.join(COLUMNS)} FROM messages WHERE id > ? ORDER BY id",
+                conn, params=(offset,),
+            )
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            # The table is created with the first batch
+            return empty_frame(), offset
+        finally:
+            conn.close()
+
+        if df.empty:
+            return empty_frame(), offset
+
+        new_offset = int(df["id"].iloc[-1])
+        df = df.drop(columns="id")
+        for column in TIMESTAMP_COLUMNS:
+            df[column] = pd.to_datetime(df[column], unit="us", utc=True)
+        return df, new_offset
+
+    def end_offset(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class IncrementalReader:
+    """
+    Keeps the rows read so far and only reads what was appended since.
+
+    Starts over when the file is replaced or shrinks (e.g. deleted and
+    written again), since the old offset means nothing in a new file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.store = open_store(path)
+        self.offset = 0
+        self.frame = empty_frame()
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def _rotated(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._file_id is not None
+
+        file_id = (stat.st_dev, stat.st_ino)
+        rotated = self._file_id is not None and file_id != self._file_id
+        # An offset past the end means the file was truncated or written anew
+        # (a new file can get the old inode back)
+        if self.store.end_offset() < self.offset:
+            rotated = True
+        self._file_id = file_id
+        return rotated
+
+    def read(self) -> "pd.DataFrame":
+        """
+        Returns all rows so far. Treat the frame as read-only, it is shared.
+        """
+        import pandas as pd
+        with self._lock:
+            if self._rotated():
+                self.offset = 0
+                self.frame = empty_frame()
+
+            new_rows, self.offset = self.store.read_since(self.offset)
+            if not new_rows.empty:
+                if self.frame.empty:
+                    self.frame = new_rows.reset_index(drop=True)
+                else:
+                    self.frame = pd.concat([self.frame, new_rows], ignore_index=True)
+            return self.frame
+
+
+STORES = {"csv": CsvStore, "sqlite": SqliteStore}
+
+def store_extension() -> str:
+    """
+    File extension for new stream files, from STORAGE_BACKEND.
+    """
+    return STORES.get(STORAGE_BACKEND, CsvStore).extension
+
+def open_store(path: str) -> ChatStore:
+    """
+    Picks the store from the file name, so readers don't need to know
+    which backend the server was started with.
+    """
+    if path.endswith((".db", ".sqlite")):
+        return SqliteStore(path)
+    return CsvStore(path)
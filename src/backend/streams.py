@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from backend.aggregates import StreamAggregates
+from backend.metrics import REGISTRY, SIZE_BUCKETS, errors_total, stage_seconds
+from backend.pubsub import Broadcaster
+from backend.records import RecordBuffer
+from backend.storage import ChatStore, open_store, store_extension
+from backend.wordfreq import WordFrequency
+
+log = logging.getLogger(__name__)
+
+saved_batch_rows = REGISTRY.histogram("chat_saved_batch_rows", "Rows written per batch save.", buckets=SIZE_BUCKETS)
+
+DATA_DIR = "data"
+# Stream ids end up in file names, so only these characters are allowed
+STREAM_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def parse_video_id(url: str):
+    """
+    The video id of a youtube.com/watch?v=... or youtu.be/... link, or None.
+    """
+    video_id = None
+    if "v=" in url:
+        video_id = url.split("v=")[1].split("&")[0]
+    elif "youtu.be/" in url:
+        video_id = url.split("youtu.be/")[1].split("?")[0]
+    return video_id or None
+
+
+def is_valid_stream_id(stream_id) -> bool:
+    return isinstance(stream_id, str) and STREAM_ID_PATTERN.fullmatch(stream_id) is not None
+
+
+def new_save_file(video_id: str) -> str:
+    # Timestamped, so watching the same video again starts a new file
+    os.makedirs(DATA_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{DATA_DIR}/chat_{video_id}_{timestamp}{store_extension()}"
+
+
+class RecentIds:
+    """
+    The last `capacity` message ids of a stream, so a page the bot sends
+    again (e.g. after a timeout when the server already had it) isn't
+    analysed and saved twice.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, message_id) -> bool:
+        return message_id in self._ids
+
+    def add(self, message_id):
+        self._ids[message_id] = None
+        self._ids.move_to_end(message_id)
+        while len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+    def discard(self, message_id):
+        self._ids.pop(message_id, None)
+
+
+class StreamState:
+    """
+    Everything the server keeps for one live stream: its output file,
+    the buffer of analysed rows waiting to be saved, its running stats
+    and the viewers of its live updates. Nothing here is shared with
+    other streams, so a switch or a slow stream can't affect the rest.
+    """
+
+    def __init__(self, stream_id: str, save_file: str, max_queue_size: int = 10000,
+                 recent_messages: int = 50, live_buffer_size: int = 100,
+                 wordcloud_half_life: float = 0.0, seen_message_ids: int = 10000):
+        self.stream_id = stream_id
+        self.save_file = save_file
+        self.buffer = RecordBuffer(capacity=max_queue_size)
+        self.aggregates = StreamAggregates()
+        self.word_frequencies = WordFrequency(half_life_seconds=wordcloud_half_life)
+        self.broadcaster = Broadcaster(buffer_size=live_buffer_size)
+        self.recent_messages = deque(maxlen=recent_messages)
+        self.seen_message_ids = RecentIds(seen_message_ids)
+        self.live_pending = [] # analysed since the last push
+        self.saved = 0
+        self.closed = False
+        self._store = None
+        self._saver = None
+
+    @property
+    def store(self) -> ChatStore:
+        if self._store is None:
+            self._store = open_store(self.save_file)
+        return self._store
+
+    def snapshot(self, max_points: int = None) -> dict: # type: ignore
+        return {"stream_id": self.stream_id, "file": self.save_file, **self.aggregates.snapshot(max_points)}
+
+    def summary(self) -> dict:
+        # One line of the /streams listing
+        return {
+            "stream_id": self.stream_id,
+            "file": self.save_file,
+            "total_messages": self.aggregates.total_messages,
+            "saved": self.saved,
+            "queued": len(self.buffer),
+            "viewers": self.broadcaster.subscriber_count,
+            "started_at": datetime.fromtimestamp(self.aggregates.started_at, tz=timezone.utc).isoformat(),
+        }
+
+    async def flush(self):
+        """
+        Writes everything that is in the buffer right now to the store.
+        """
+        if not self.buffer:
+            return
+
+        batch = self.buffer.drain()
+        started = time.perf_counter()
+        try:
+            await self.store.append(batch)
+            self.saved += len(batch)
+            log.debug(f"💾 Saved {len(batch)} messages to {self.save_file}")
+        except Exception as e:
+            errors_total.inc(stage="flush")
+            log.error(f"❌ Error saving batch to {self.save_file}: {e}")
+        stage_seconds.observe(time.perf_counter() - started, stage="flush")
+        saved_batch_rows.observe(len(batch))
+
+    async def _save_every(self, seconds: float):
+        while True:
+            await asyncio.sleep(seconds)
+            if self.buffer:
+                await self.flush()
+
+    def start_saver(self, seconds: float):
+        if self._saver is None:
+            self._saver = asyncio.create_task(self._save_every(seconds))
+
+    async def close(self):
+        """
+        Stops the saver, saves what is left and closes the file.
+        Safe to call again (e.g. for rows that finished after the close).
+        """
+        self.closed = True
+        if self._saver is not None:
+            self._saver.cancel()
+            try:
+                await self._saver
+            except asyncio.CancelledError:
+                pass
+            self._saver = None
+
+        await self.flush()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
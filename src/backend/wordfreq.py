@@ -0,0 +1,80 @@
+import heapq
+import math
+import time
+
+# Common English words plus chat filler, left out of the word cloud
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been
+before being below between both but by can cannot could did do does doing down
+during each few for from further had has have having he her here hers herself
+him himself his how i if in into is it its itself just let me more most my
+myself no nor not of off on once only or other ought our ours ourselves out over
+own same she should so some such than that the their theirs them themselves then
+there these they this those through to too under until up very was we were what
+when where which while who whom why will with would you your yours yourself
+yourselves im ive id ill youre youve dont doesnt didnt cant wont isnt arent
+wasnt thats whats theres also get got u ur ya yeah oh ok okay like
+""".split())
+
+
+class WordFrequency:
+    """
+    Running word counts over cleaned messages, for the word cloud.
+
+    With a half-life, older words fade out: a word seen `half_life`
+    seconds ago counts half as much as one seen now. Counts are stored
+    scaled up by the time they were added, so adding stays O(words in
+    the message) and only reading applies the decay.
+    """
+
+    def __init__(self, half_life_seconds: float = 0.0, max_terms: int = 20000,
+                 stopwords=STOPWORDS, min_length: int = 2):
+        self.decay = math.log(2) / half_life_seconds if half_life_seconds > 0 else 0.0
+        self.max_terms = max_terms
+        self.stopwords = stopwords
+        self.min_length = min_length
+        self.counts = {}
+        self._origin = time.time()
+
+    def _weight(self, now: float) -> float:
+        return math.exp(self.decay * (now - self._origin))
+
+    def _rebase(self, now: float):
+        # Keeps the stored numbers from overflowing on long streams
+        factor = 1.0 / self._weight(now)
+        self.counts = {word: count * factor for word, count in self.counts.items() if count * factor >= 1e-3}
+        self._origin = now
+
+    def add(self, text, now: float = None): # type: ignore
+        if not isinstance(text, str) or not text:
+            return
+
+        now = now or time.time()
+        if self.decay and self.decay * (now - self._origin) > 50:
+            self._rebase(now)
+        weight = self._weight(now) if self.decay else 1.0
+
+        counts = self.counts
+        for word in text.split():
+            word = word.strip("?")
+            if len(word) >= self.min_length and word not in self.stopwords:
+                counts[word] = counts.get(word, 0.0) + weight
+
+        if len(counts) > 2 * self.max_terms:
+            self._prune()
+
+    def add_many(self, texts, now: float = None): # type: ignore
+        for text in texts:
+            self.add(text, now)
+
+    def _prune(self):
+        # Rare words are dropped once the vocabulary gets too big
+        self.counts = dict(heapq.nlargest(self.max_terms, self.counts.items(), key=lambda item: item[1]))
+
+    def top(self, n: int = 200, now: float = None) -> dict: # type: ignore
+        """
+        The n most frequent words, with their (decayed) counts.
+        """
+        scale = 1.0 / self._weight(now or time.time()) if self.decay else 1.0
+        best = heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+        return {word: count * scale for word, count in best}
@@ -0,0 +1,180 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from backend.model import padding_stats
+
+log = logging.getLogger(__name__)
+
+
+# --- These run inside the worker processes ---
+
+def _init_worker(threads_per_worker: int, optimised, warm_up: bool = True):
+    # load_models pins the intra-op threads before any model work happens,
+    # otherwise every worker grabs all the cores
+    from backend import model
+    model.load_models(optimised, num_threads=threads_per_worker)
+    if warm_up:
+        model.warm_up()
+
+def _score_in_worker(cleaned_texts: list):
+    from backend import model
+    # The padding counts go back with the scores, the server keeps the totals
+    return model._score_texts(cleaned_texts), model.padding_stats.drain()
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    A pool of processes that each hold their own copy of the models.
+
+    score_texts() has the same contract as model._score_texts, so it can
+    be passed as the `scorer` of analyse_messages. Cleaning, the cache and
+    the cascade stay in the server process; only the forward passes go to
+    the workers. A crashed or stuck pool is replaced with a fresh one.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int = 1, chunk_size: int = 32,
+                 optimised=None, task_timeout: float = 120.0, warm_up: bool = True):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.chunk_size = chunk_size
+        self.optimised = optimised
+        self.task_timeout = task_timeout
+        # Every worker (also after a restart) runs a few batches before its first task
+        self.warm_up = warm_up
+
+        self.restarts = 0
+        self.batches = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Blocking. Starts the workers and waits until they have loaded the models.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            executor = self._executor
+        self._wait_for_workers(executor)
+        log.info(f"🧠 Inference pool started ({self.workers} workers x {self.threads_per_worker} threads).")
+
+    def _wait_for_workers(self, executor):
+        # Workers load the models before their first task. That can take a long
+        # time, so it must not count against the task timeout. A worker that is
+        # ready can answer every ping of a round, so keep pinging until each
+        # worker has answered with its own pid.
+        pids = set()
+        while True:
+            for future in [executor.submit(_ping) for _ in range(self.workers)]:
+                pids.add(future.result())
+            if len(pids) >= self.workers:
+                return
+            time.sleep(0.1)
+
+    def _new_executor(self):
+        # 'spawn' so workers don't inherit the server's event loop or torch state
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, self.optimised, self.warm_up),
+        )
+
+    def restart(self, broken_executor=None):
+        """
+        Throws away the current workers and starts new ones.
+        """
+        with self._lock:
+            # Someone else already restarted it
+            if broken_executor is not None and self._executor is not broken_executor:
+                return
+
+            old = self._executor
+            self._executor = new = self._new_executor()
+            self.restarts += 1
+
+        if old is not None:
+            # A stuck worker would block shutdown(), so kill them first
+            for process in list((getattr(old, "_processes", None) or {}).values()):
+                process.kill()
+            old.shutdown(wait=False, cancel_futures=True)
+        log.warning(f"🔁 Inference pool restarted ({self.restarts} restarts so far).")
+        self._wait_for_workers(new)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def score_texts(self, cleaned_texts: list) -> list:
+        """
+        Blocking. Splits the texts into chunks, one per worker task,
+        and retries once on a fresh pool if a worker died.
+        Texts of about the same length go in one chunk, so the worker's
+        batches need little padding.
+        """
+        order = sorted(range(len(cleaned_texts)), key=lambda i: len(cleaned_texts[i]))
+        for attempt in (1, 2):
+            executor = self._executor
+            if executor is None:
+                raise RuntimeError("Inference pool is not running.")
+
+            try:
+                chunks = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+                futures = [
+                    executor.submit(_score_in_worker, [cleaned_texts[i] for i in chunk])
+                    for chunk in chunks
+                ]
+                scores = [None] * len(cleaned_texts)
+                for chunk, future in zip(chunks, futures):
+                    chunk_scores, padding = future.result(timeout=self.task_timeout)
+                    for i, score in zip(chunk, chunk_scores):
+                        scores[i] = score
+                    padding_stats.merge(padding)
+                self.batches += len(futures)
+                return scores
+            except (BrokenProcessPool, FutureTimeout) as e:
+                log.error(f"❌ Inference worker failed ({type(e).__name__}), attempt {attempt}.")
+                self.restart(executor)
+                if attempt == 2:
+                    raise
+        return []
+
+    def health_check(self, timeout=None) -> bool:
+        """
+        Pings every worker slot. A broken or unresponsive pool is restarted.
+        Pings wait behind running batches, so the timeout defaults to the task timeout.
+        """
+        timeout = timeout or self.task_timeout
+        executor = self._executor
+        if executor is None:
+            return False
+
+        try:
+            futures = [executor.submit(_ping) for _ in range(self.workers)]
+            for future in futures:
+                future.result(timeout=timeout)
+            return True
+        except (BrokenProcessPool, FutureTimeout, RuntimeError) as e:
+            log.error(f"❌ Inference pool health check failed ({type(e).__name__}).")
+            self.restart(executor)
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "chunk_size": self.chunk_size,
+            "batches": self.batches,
+            "restarts": self.restarts,
+            "running": self._executor is not None,
+        }
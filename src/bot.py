@@ -1,34 +1,74 @@
 import os
-import time
+import sys
+import asyncio
+import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from backend.model import analyse_message, load_models
+
+from backend.poller import ChatPoller, retry_after_seconds
+from backend.streams import parse_video_id
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 YOUTUBE_API = os.getenv("YOUTUBE_API_KEY")
-API_URL = "http://127.0.0.1:8080/fetch_chat"
+BATCH_API_URL = "http://127.0.0.1:8080/fetch_chat_batch"
 send_URL = "http://127.0.0.1:8080/set_stream"
+END_STREAM_URL = "http://127.0.0.1:8080/end_stream"
 
-SAVE_FILE = 'chat_data.csv'
-POLL_INTERVAL_SECONDS = 10
+API_TIMEOUT_SECONDS = 10
+# When the server is busy and doesn't say how long to wait
+DEFAULT_RETRY_AFTER_SECONDS = 5.0
 
 # This is the file we write to, so the dashboard knows which CSV to read
 CONFIG_FILE = "current_stream.txt"
-
-youtube_service = None
-live_chat_id = None
-next_page_token = None
-
-
+# Page tokens of every chat, so a restarted bot resumes where it stopped
+POLLER_STATE_FILE = os.getenv("POLLER_STATE_FILE", "poller_state.json")
+# The API key's daily quota, shared by all the chats polled at once
+YOUTUBE_QUOTA_PER_DAY = float(os.getenv("YOUTUBE_QUOTA_PER_DAY", 10000))
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+
+def make_api_session(pool_size=16):
+    """
+    One keep-alive session for every call to chat.py.
+    Failed calls are retried with exponential backoff (0.5s, 1s, 2s...).
+    POSTs are only retried when they could not connect. After a read
+    timeout or a 5xx the poller sends the page again itself, and the
+    server drops the messages it already has (by message_id).
+    429/503 ("busy") are not retried here: the poller waits for the
+    Retry-After without blocking the other chats.
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 504),
+        # Idempotent methods only, not POST
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+    )
+    # Many chats may send at the same time
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+api_session = make_api_session()
+
+
+def build_youtube():
+    # One client per chat, they can't be shared between threads
+    return build('youtube', 'v3', developerKey=YOUTUBE_API)
 
 
 def initialize_youtube():
-    global youtube_service
     try:
-        youtube_service = build('youtube', 'v3', developerKey=YOUTUBE_API)
+        build_youtube()
         print("✅ YouTube API initialized.")
         return True
     except Exception as e:
@@ -37,155 +77,101 @@ def initialize_youtube():
         return False
 
 
-def get_live_chat_id(video_id):
-    global live_chat_id
+def register_stream(video_url):
+    """
+    Tells the server about a stream. Returns (video id, file) or None.
+    """
+    video_id = parse_video_id(video_url)
+    if not video_id:
+        print(f"❌ Invalid YouTube URL format: {video_url}")
+        return None
+
     try:
-        request = youtube_service.videos().list( # type: ignore
-            part="liveStreamingDetails",
-            id=video_id
-        )
-        response = request.execute()
-
-        if not response.get('items'):
-            print(f"❌ Error: Video with ID '{video_id}' not found.")
-            return False
-
-        live_details = response['items'][0].get('liveStreamingDetails')
-        if not live_details:
-            print(f"❌ Error: This video ('{video_id}') is not a live stream or is over.")
-            return False
-
-        live_chat_id = live_details.get('activeLiveChatId')
-        if not live_chat_id:
-            print(f"❌ Error: Could not find active live chat ID. Is the stream live right now?")
-            return False
-
-        print(f"✅ Live Chat ID found: {live_chat_id}")
-        return live_chat_id
-
-    except HttpError as e:
-        print(f"❌ HTTP Error finding chat ID: {e}")
-        if "keyInvalid" in str(e):
-            print("❌ Your YOUTUBE_API_KEY is invalid or restricted.")
-        return False
+        print(f"➡️  Telling server about new stream: {video_id}...")
+        res = api_session.post(send_URL, json={"url": video_url}, timeout=API_TIMEOUT_SECONDS)
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        return False
+        print(f"⚠️ Failed to connect to backend API: {e}")
+        print(" Is your 'chat.py' running in Terminal 1?")
+        return None
+
+    if res.status_code != 200:
+        print(f"⚠️ Could not set new stream in backend: {res.text}")
+        return None
+
+    data = res.json()
+    new_filename = data.get("file") # Get the new CSV name from the server
+    if not new_filename:
+        print(f"❌ Server error: {data.get('error', 'Unknown error')}")
+        return None
 
+    print(f"✅ Backend set to save {video_id} to: {new_filename}")
+    return data.get("stream_id", video_id), new_filename
 
-def get_chat_poll(live_chat_id):
-    global next_page_token
+
+def send_messages(video_id, payload):
+    """
+    True once the server has the page, False if sending failed, or the
+    seconds to wait when the server is busy (429/503).
+    """
     try:
-        request = youtube_service.liveChatMessages().list( # type: ignore
-            liveChatId=live_chat_id,
-            part="snippet,authorDetails",
-            pageToken=next_page_token
-        )
-        response = request.execute()
-
-        new_messages = response.get('items', [])
-        next_page_token = response.get('nextPageToken', None)
-        wait_time_ms = response.get('pollingIntervalMillis', 10000)
-        last_poll_time = wait_time_ms / 1000.0 # Convert to seconds
-        # ---
-
-        if not new_messages:
-            print("ℹ️ No new messages yet.")
-            return wait_time_ms / 1000.0 # <--- THE FIX! (Returns a number)
-
-        print(f"💬 Found {len(new_messages)} new messages...")
-        for msg in new_messages:
-            
-            message_text = msg['snippet'].get('displayMessage')
-            if not message_text:
-                continue # Skip superchats/stickers
-                
-            author = msg['authorDetails']['displayName']
-            
-            # --- FIX 2: Added the missing 'timestamp' variable ---
-            timestamp = msg['snippet']['publishedAt']
-            
-            print(f"[{timestamp}] {author}: {message_text}")
-
-            try:
-                # Use the correct variable names
-                requests.post(API_URL, json={"user": author, "text": message_text})
-            except Exception as e:
-                print(f"⚠️ Failed to send message to API: {e}")
-
-        return wait_time_ms / 1000.0 # Return the wait time
-
-    except HttpError as e:
-        print(f"❌ Error fetching chat: {e}")
-        if "liveChatNotFound" in str(e):
-            print("--- CHAT ENDED ---")
-            raise SystemExit() # Stop the script
-        if "quotaExceeded" in str(e):
-            print("🔥 QUOTA EXCEEDED! Waiting for 60 seconds...")
-            return 60.0
-        return 10.0 # Default wait on error
-    
+        # The whole page goes to the server in one request
+        res = api_session.post(BATCH_API_URL, json=payload, timeout=API_TIMEOUT_SECONDS)
     except Exception as e:
-        print(f"❌ Unexpected Error in chat poll: {e}")
-        return 10.0
+        print(f"⚠️ Failed to send {len(payload)} messages of {video_id} to API: {e}")
+        return False
+
+    if res.status_code in (429, 503):
+        delay = retry_after_seconds(res.headers.get("Retry-After"), DEFAULT_RETRY_AFTER_SECONDS)
+        print(f"⏳ Server is busy, sending {len(payload)} messages of {video_id} again in {delay:.0f}s.")
+        return delay
+    return res.ok
+
 
+def end_stream(video_id):
+    api_session.post(END_STREAM_URL, json={"stream_id": video_id}, timeout=API_TIMEOUT_SECONDS)
+
+
+async def forward_messages(video_id, payload):
+    return await asyncio.to_thread(send_messages, video_id, payload)
+
+
+async def report_chat_end(video_id):
+    await asyncio.to_thread(end_stream, video_id)
+
+
+def read_video_urls():
+    # URLs on the command line, or asked for like before
+    if len(sys.argv) > 1:
+        return sys.argv[1:]
+    return input("Enter YouTube live URL(s), separated by spaces: ").split()
 
 
 def main():
-    video_url = input("Enter YouTube live URL: ")
-
-    if "v=" in video_url:
-        video_id = video_url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in video_url:
-        video_id = video_url.split("youtu.be/")[1].split("?")[0]
-    else:
-        print("❌ Invalid YouTube URL format.")
+    streams = [stream for stream in map(register_stream, read_video_urls()) if stream]
+    if not streams:
         return
-    
 
-    try:
-        print(f"➡️  Telling server about new stream: {video_id}...")
-        res = requests.post(send_URL, json={"url": video_url})
-        
-        if res.status_code == 200:
-            data = res.json()
-            new_filename = data.get("file") # Get the new CSV name from the server
-            
-            if not new_filename:
-                print(f"❌ Server error: {data.get('error', 'Unknown error')}")
-                return
-                
-            print(f"✅ Backend set to save data to: {new_filename}")
-
-
-            # This is the "pointer" file for the dashboard
-            with open(CONFIG_FILE, "w") as f:
-                f.write(new_filename)
-            print(f"✅ Wrote filename to {CONFIG_FILE} for dashboard.")
-            
-        else:
-            print(f"⚠️ Could not set new stream in backend: {res.text}")
-            return
-    except Exception as e:
-        print(f"⚠️ Failed to connect to backend API: {e}")
-        print(" Is your 'chat.py' running in Terminal 1?")
-        return
-    
+    # This is the "pointer" file for the dashboard (the first stream)
+    with open(CONFIG_FILE, "w") as f:
+        f.write(streams[0][1])
+    print(f"✅ Wrote filename to {CONFIG_FILE} for dashboard.")
+
     if not initialize_youtube():
         return
 
-    live_chat_id = get_live_chat_id(video_id)
-    if not live_chat_id:
-        return
+    poller = ChatPoller(
+        service_factory=build_youtube,
+        forward=forward_messages,
+        state_file=POLLER_STATE_FILE,
+        units_per_day=YOUTUBE_QUOTA_PER_DAY,
+        on_end=report_chat_end,
+    )
 
-    print("🔄 Fetching messages every 10 seconds... Press Ctrl+C to stop.")
-    while True:
-        # get_chat_poll will get messages AND return the new wait time
-        wait_time = get_chat_poll(live_chat_id)
-        
-        # --- FIX 3: Removed the "double sleep" ---
-        print(f"   (Waiting for {wait_time:.1f} seconds before next poll...)")
-        time.sleep(wait_time) # type: ignore
+    print(f"🔄 Polling {len(streams)} live chat(s)... Press Ctrl+C to stop.")
+    try:
+        asyncio.run(poller.run([video_id for video_id, _ in streams]))
+    except KeyboardInterrupt:
+        print("👋 Stopped. Page tokens are saved, the next run resumes from here.")
 
 if __name__ == "__main__":
     main()
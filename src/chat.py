@@ -1,103 +1,493 @@
-from fastapi import FastAPI, BackgroundTasks # <-- FIX: Added BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Request # <-- FIX: Added BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import pandas as pd
 import uvicorn
 import os
 import asyncio
+import importlib
 import logging
-import aiofiles
+import math
+import time
+from collections import deque
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import List, Optional
 
 # --- Importing our main model ---
 # <-- FIX 1: 'analyze_message' (with a 'z')
-from backend.model import load_models, analyse_message
+from backend.model import (
+    load_models, analyse_messages, inference_stats, near_duplicates, padding_stats, prepare_messages,
+    result_cache, skipped_result, warm_up,
+)
+from backend.worker_pool import InferencePool
+from backend.streams import StreamState, is_valid_stream_id, new_save_file, parse_video_id
+from backend.pubsub import Broadcaster, format_sse
+from backend.batcher import InferenceBatcher
+from backend.negative_word import reload_lexicon
+from backend.cascade import cascade_stats
+from backend.metrics import REGISTRY, SIZE_BUCKETS, errors_total, stage_seconds
+from backend.admission import AdmissionController, SpillQueue
+from backend.sampling import LoadShedder
+from backend.priority import PriorityLanes
 
 # <-- FIX 2: 'SAVE_FILE' (no 'S')
-SAVE_FILE = "chat_data.csv" # The dashboard will read this file
+SAVE_FILE = "chat_data.csv" # Messages sent before any /set_stream end up here
 BATCH_SAVE_SECONDS = 5.0    # Save data every 5 seconds
-MAX_QUEUE_SIZE = 10000
+MAX_QUEUE_SIZE = 10000      # Per stream
+# Past this share of MAX_QUEUE_SIZE, new messages for the stream get a 503
+SAVE_QUEUE_HIGH_WATER = 0.9
+
+# Every stream gets its own queue, saver and file. Messages without a
+# stream_id go to the stream set last with /set_stream.
+DEFAULT_STREAM_ID = "default"
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", 100))
+# Message ids remembered per stream: a message sent again with one of
+# them is dropped instead of being analysed and saved twice
+SEEN_MESSAGE_IDS = 10000
+
+# Messages are analysed in micro-batches: up to this many messages,
+# or whatever arrived within this many milliseconds
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 50))
+
+# Admission control: at most this many messages are being analysed at
+# once. Past that, new messages go to the spill file (if SPILL_FILE is
+# set, e.g. "data/spill.db") to be analysed later, or the client gets a
+# 429 with a Retry-After.
+MAX_IN_FLIGHT_MESSAGES = int(os.getenv("MAX_IN_FLIGHT_MESSAGES", 2000))
+RETRY_AFTER_SECONDS = float(os.getenv("RETRY_AFTER_SECONDS", 2))
+SPILL_FILE = os.getenv("SPILL_FILE", "")
+SPILL_MAX_MESSAGES = int(os.getenv("SPILL_MAX_MESSAGES", 1000000))
+SPILL_DRAIN_BATCH = 256
+SPILL_DRAIN_SECONDS = 0.2
+
+# Load shedding (off by default): past SAMPLING_START_LOAD of
+# MAX_IN_FLIGHT_MESSAGES only a sample of the messages goes to the
+# models, the rest are saved unscored with a sample_weight of 0.
+# Messages with a lexicon hit are always analysed. SAMPLING_MODE is
+# "uniform" or "author" (the same share of every author's messages).
+SAMPLING_ENABLED = os.getenv("SAMPLING_ENABLED", "0").lower() in ("1", "true", "yes")
+SAMPLING_START_LOAD = float(os.getenv("SAMPLING_START_LOAD", 0.5))
+SAMPLING_MIN_RATE = float(os.getenv("SAMPLING_MIN_RATE", 0.05))
+SAMPLING_MODE = os.getenv("SAMPLING_MODE", "uniform").lower()
+
+# Priority lane: Super Chats, lexicon hits and messages of authors who
+# were toxic in the last TOXIC_AUTHOR_WINDOW_SECONDS skip the queue, are
+# never sampled out and go to moderators on /alerts as soon as they are
+# analysed. PRIORITY_SLO_SECONDS is the target from a message reaching
+# the server to its alert; a batch holding one of them waits at most
+# PRIORITY_MAX_WAIT_MS for more messages.
+PRIORITY_ENABLED = os.getenv("PRIORITY_ENABLED", "1").lower() in ("1", "true", "yes")
+PRIORITY_SLO_SECONDS = float(os.getenv("PRIORITY_SLO_SECONDS", 2))
+PRIORITY_MAX_WAIT_MS = float(os.getenv("PRIORITY_MAX_WAIT_MS", 5))
+TOXIC_AUTHOR_WINDOW_SECONDS = float(os.getenv("TOXIC_AUTHOR_WINDOW_SECONDS", 900))
+ALERTS_RECENT = 50
+
+# 0 runs the models inside this process. Otherwise each worker process
+# loads its own copy of the models and uses this many torch threads, by
+# default an equal share of the cores so the workers don't oversubscribe them.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))
+INFERENCE_THREADS_PER_WORKER = (
+    int(os.getenv("INFERENCE_THREADS_PER_WORKER", 0))
+    or max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS))
+)
+POOL_HEALTH_CHECK_SECONDS = 30.0
+# The models load in the background after startup, so the API and the
+# savers are up right away. Messages wait for them in the batcher.
+# With warm-up on, a few batches run first so the first real ones
+# don't pay for it.
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() in ("1", "true", "yes")
+
+# Live updates on /events: how often they are pushed, how many events a
+# slow viewer may fall behind before it loses the oldest, and how many
+# recent messages a new viewer gets
+LIVE_PUBLISH_SECONDS = 1.0
+LIVE_BUFFER_SIZE = 100
+LIVE_RECENT_MESSAGES = 50
+LIVE_KEEPALIVE_SECONDS = 15.0
+# Word cloud counts: 0 keeps the whole stream, otherwise words fade
+# out with this half-life (in seconds)
+WORDCLOUD_HALF_LIFE_SECONDS = float(os.getenv("WORDCLOUD_HALF_LIFE_SECONDS", 0))
+
+# Only these fields of a message are pushed to viewers
+LIVE_MESSAGE_FIELDS = (
+    "timestamp", "author", "original_message", "sentiment_label",
+    "sentiment_score", "toxicity_label", "toxicity_score",
+    "cluster_id", "cluster_size",
+)
 
 # --- Setup (All your code here is perfect) ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 log = logging.getLogger(__name__)
 
-message_queue = asyncio.Queue(maxsize=MAX_QUEUE_SIZE)
+streams = {} # stream_id -> StreamState
+current_stream_id = DEFAULT_STREAM_ID
+
+def make_stream(stream_id: str, save_file: str) -> StreamState:
+    stream = StreamState(
+        stream_id,
+        save_file,
+        max_queue_size=MAX_QUEUE_SIZE,
+        recent_messages=LIVE_RECENT_MESSAGES,
+        live_buffer_size=LIVE_BUFFER_SIZE,
+        wordcloud_half_life=WORDCLOUD_HALF_LIFE_SECONDS,
+        seen_message_ids=SEEN_MESSAGE_IDS,
+    )
+    streams[stream_id] = stream
+    return stream
+
+make_stream(DEFAULT_STREAM_ID, SAVE_FILE)
+
+inference_pool = InferencePool(
+    workers=INFERENCE_WORKERS,
+    threads_per_worker=INFERENCE_THREADS_PER_WORKER,
+    chunk_size=INFERENCE_MAX_BATCH,
+    warm_up=MODEL_WARMUP,
+) if INFERENCE_WORKERS > 0 else None
+
+# "loading" until the models are loaded and warmed up, then "ready" (or "failed")
+model_status = {"status": "loading", "error": None, "load_seconds": None, "warmup_seconds": None}
+models_ready = asyncio.Event()
+
+async def analyse_batch(texts: list, prepared=None) -> list:
+    if not models_ready.is_set():
+        # Messages that came in during startup wait here until the models are ready
+        await models_ready.wait()
+    if model_status["status"] != "ready":
+        raise RuntimeError(f"NLP models are not loaded: {model_status['error']}")
+
+    # Cleaning and the cache run here, the forward passes in the pool (if any)
+    scorer = inference_pool.score_texts if inference_pool else None
+    inference_batch_size.observe(len(texts))
+    with stage_seconds.time(stage="analyse"):
+        return await asyncio.to_thread(analyse_messages, texts, scorer, prepared)
+
+admission = AdmissionController(MAX_IN_FLIGHT_MESSAGES)
+spill = SpillQueue(SPILL_FILE, SPILL_MAX_MESSAGES) if SPILL_FILE else None
+load_shedder = LoadShedder(
+    enabled=SAMPLING_ENABLED,
+    start_load=SAMPLING_START_LOAD,
+    min_rate=SAMPLING_MIN_RATE,
+    mode=SAMPLING_MODE,
+)
+priority_lanes = PriorityLanes(
+    enabled=PRIORITY_ENABLED,
+    slo_seconds=PRIORITY_SLO_SECONDS,
+    toxic_window_seconds=TOXIC_AUTHOR_WINDOW_SECONDS,
+)
+# Alerts of every stream, /alerts filters them per viewer
+alerts = Broadcaster(LIVE_BUFFER_SIZE)
+recent_alerts = deque(maxlen=ALERTS_RECENT)
+
+batcher = InferenceBatcher(
+    max_batch_size=INFERENCE_MAX_BATCH,
+    max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    runner=analyse_batch,
+    # One batch in flight per worker process, shared fairly between streams
+    concurrency=max(1, INFERENCE_WORKERS),
+    priority_max_wait_ms=PRIORITY_MAX_WAIT_MS,
+)
+
+# --- Metrics, served on /metrics ---
+http_requests = REGISTRY.counter("chat_http_requests_total", "HTTP requests handled.", ["method", "path", "status"])
+http_seconds = REGISTRY.histogram("chat_http_request_seconds", "Time to answer an HTTP request.", ["method", "path"])
+messages_analysed = REGISTRY.counter("chat_messages_analysed_total", "Messages analysed and queued for saving.", ["stream"])
+messages_dropped = REGISTRY.counter("chat_messages_dropped_total", "Messages dropped because their save queue was full.", ["stream"])
+messages_rejected = REGISTRY.counter("chat_messages_rejected_total", "Messages turned away with a 429/503 or for an unknown stream.", ["reason"])
+messages_duplicate = REGISTRY.counter("chat_messages_duplicate_total", "Messages dropped because their message_id was already received.", ["stream"])
+messages_spilled = REGISTRY.counter("chat_messages_spilled_total", "Messages kept in the spill file because the server was busy.")
+messages_sampled_out = REGISTRY.counter("chat_messages_sampled_out_total", "Messages saved without model scores because of load shedding.", ["stream"])
+priority_slo_misses = REGISTRY.counter("chat_priority_slo_misses_total", "Priority messages analysed later than PRIORITY_SLO_SECONDS.")
+lane_latency = REGISTRY.histogram("chat_lane_latency_seconds", "Time from a message reaching the server to its analysis being done.", ["lane"])
+inference_batch_size = REGISTRY.histogram("chat_inference_batch_size", "Messages per analysed micro-batch.", buckets=SIZE_BUCKETS)
+REGISTRY.gauge(
+    "chat_save_queue_depth", "Analysed messages waiting to be saved.", ["stream"],
+    collect=lambda: {(stream_id,): len(stream.buffer) for stream_id, stream in streams.items()},
+)
+REGISTRY.gauge(
+    "chat_inference_queue_depth", "Messages waiting for a micro-batch.", ["stream"],
+    collect=lambda: {(str(stream_id),): n for stream_id, n in batcher.pending().items()},
+)
+REGISTRY.gauge(
+    "chat_priority_messages_total", "Messages sent to the priority lane, by reason.", ["reason"],
+    collect=lambda: {(reason,): n for reason, n in priority_lanes.reason_counts.items()}, kind="counter",
+)
+REGISTRY.gauge("chat_priority_queue_depth", "Priority messages waiting for a micro-batch.", collect=batcher.pending_priority)
+REGISTRY.gauge("chat_streams", "Streams being tracked.", collect=lambda: len(streams))
+REGISTRY.gauge("chat_models_ready", "1 once the models are loaded and warmed up.", collect=lambda: int(model_status["status"] == "ready"))
+REGISTRY.gauge("chat_in_flight_messages", "Admitted messages not analysed yet.", collect=lambda: admission.in_flight)
+REGISTRY.gauge("chat_sampling_rate", "Share of the messages analysed under load shedding (1 when not shedding).", collect=lambda: load_shedder.current_rate)
+REGISTRY.gauge("chat_spill_depth", "Messages waiting in the spill file.", collect=lambda: len(spill) if spill is not None else 0)
+for _field in ("hits", "misses", "evictions", "expirations"):
+    REGISTRY.gauge(
+        f"chat_result_cache_{_field}_total", f"Model result cache {_field}.",
+        collect=lambda field=_field: result_cache.stats()[field], kind="counter",
+    )
+REGISTRY.gauge("chat_result_cache_hit_ratio", "Share of cache lookups that were hits.", collect=lambda: result_cache.stats()["hit_rate"])
+REGISTRY.gauge(
+    "chat_cascade_messages_total", "Messages answered by each tier (lexical, cache, cluster, transformer).", ["tier"],
+    collect=lambda: {(tier,): n for tier, n in cascade_stats.stats()["counts"].items()}, kind="counter",
+)
+REGISTRY.gauge(
+    "chat_inference_tokens_total", "Tokens through the models: real ones, and real plus padding.", ["model", "kind"],
+    collect=lambda: {
+        (name, kind): stats[f"{kind}_tokens"]
+        for name, stats in padding_stats.stats().items() for kind in ("real", "padded")
+    },
+    kind="counter",
+)
+REGISTRY.gauge("chat_inference_padding_efficiency", "Share of the tokens in forward passes that were not padding.", collect=padding_stats.efficiency)
+REGISTRY.gauge("chat_near_duplicate_clusters", "Near-duplicate clusters being tracked.", collect=lambda: len(near_duplicates.clusters))
+REGISTRY.gauge(
+    "chat_live_events_dropped_total", "Live events slow /events viewers lost.",
+    collect=lambda: sum(stream.broadcaster.dropped for stream in streams.values()), kind="counter",
+)
+REGISTRY.gauge("chat_alerts_dropped_total", "Alerts slow /alerts viewers lost.", collect=lambda: alerts.dropped, kind="counter")
+if inference_pool:
+    REGISTRY.gauge(
+        "chat_pool_restarts_total", "Times the inference process pool was restarted.",
+        collect=lambda: inference_pool.restarts, kind="counter", # type: ignore
+    )
+
+async def load_models_in_background():
+    """
+    Loads (and warms up) the models without holding up startup.
+    """
+    started = time.perf_counter()
+    try:
+        # The first save needs pandas, import it here rather than on the event loop
+        await asyncio.to_thread(importlib.import_module, "pandas")
+        if inference_pool:
+            # The workers warm themselves up
+            await asyncio.to_thread(inference_pool.start)
+            model_status["load_seconds"] = time.perf_counter() - started
+        else:
+            await asyncio.to_thread(load_models)
+            model_status["load_seconds"] = time.perf_counter() - started
+            if MODEL_WARMUP:
+                model_status["warmup_seconds"] = await asyncio.to_thread(warm_up)
+    except Exception as e:
+        model_status.update(status="failed", error=str(e))
+        log.critical(f"❌ FATAL: Could not load NLP models. {e}")
+    else:
+        model_status["status"] = "ready"
+        log.info(f"🧠 NLP models loaded successfully in {time.perf_counter() - started:.1f}s.")
+    # Also when it failed, so waiting messages fail instead of hanging
+    models_ready.set()
+
+async def pool_health_checker():
+    # Pings would queue behind the workers' model loading
+    await models_ready.wait()
+    while True:
+        await asyncio.sleep(POOL_HEALTH_CHECK_SECONDS)
+        healthy = await asyncio.to_thread(inference_pool.health_check) # type: ignore
+        if not healthy:
+            log.warning("⚠️ Inference pool was unhealthy and has been restarted.")
 
-async def batch_saver(queue: asyncio.Queue):
+def find_stream(stream_id: Optional[str] = None) -> Optional[StreamState]:
     """
-    (Your batch_saver code is perfect, just uses SAVE_FILE)
+    The stream with this id, or the current one if no id is given.
     """
-    global SAVE_FILE
-    log.info("💾 Batch saver task started.")
-    
-    # Create 'data' folder if it doesn't exist
-    os.makedirs("data", exist_ok=True)
+    return streams.get(stream_id or current_stream_id)
 
+async def open_stream(stream_id: str) -> StreamState:
+    """
+    Starts a new file for `stream_id`. If the stream was already being
+    watched, its old file is finished first and its viewers move over.
+    """
+    old = streams.pop(stream_id, None)
+    stream = make_stream(stream_id, new_save_file(stream_id))
+    stream.start_saver(BATCH_SAVE_SECONDS)
+
+    if old is not None:
+        stream.broadcaster = old.broadcaster
+        # The bot may still send pages the old file already has
+        stream.seen_message_ids = old.seen_message_ids
+        await old.close()
+    # Viewers start over with the new file
+    stream.broadcaster.publish("snapshot", live_snapshot(stream))
+    log.info(f"📁 Now saving chats of {stream_id} to → {stream.save_file}")
+    return stream
+
+async def stream_for_message(stream_id: Optional[str]) -> Optional[StreamState]:
+    """
+    Where a message of `stream_id` goes. Unknown streams are opened on
+    first use, up to MAX_STREAMS. None if the id can't be used.
+    """
+    stream = find_stream(stream_id)
+    if stream is not None:
+        return stream
+    if not is_valid_stream_id(stream_id) or len(streams) >= MAX_STREAMS:
+        return None
+    return await open_stream(stream_id) # type: ignore
+
+def saving_behind(items: list) -> list:
+    # Streams whose save queue is nearly full: the disk can't keep up
+    limit = MAX_QUEUE_SIZE * SAVE_QUEUE_HIGH_WATER
+    return sorted({stream.stream_id for _, stream in items if len(stream.buffer) >= limit})
+
+def drop_duplicates(items: list) -> tuple:
+    """
+    [(msg, stream)] without the messages whose message_id the stream
+    already received, and how many were dropped. The ids of the ones
+    kept are remembered from now on (see forget_message_ids).
+    """
+    kept = []
+    for msg, stream in items:
+        if msg.message_id is None:
+            kept.append((msg, stream))
+        elif msg.message_id in stream.seen_message_ids:
+            messages_duplicate.inc(stream=stream.stream_id)
+        else:
+            stream.seen_message_ids.add(msg.message_id)
+            kept.append((msg, stream))
+    return kept, len(items) - len(kept)
+
+def forget_message_ids(items: list):
+    # They were turned away, so the client may send them again
+    for msg, stream in items:
+        if msg.message_id is not None:
+            stream.seen_message_ids.discard(msg.message_id)
+
+async def admit_new(items: list, background_tasks: BackgroundTasks) -> tuple:
+    """
+    admit() for the messages that weren't received before.
+    Returns (messages admitted, duplicates dropped, whether they were spilled).
+    """
+    items, duplicates = drop_duplicates(items)
+    if not items:
+        return items, duplicates, False
+    try:
+        spilled = await admit(items, background_tasks)
+    except HTTPException:
+        forget_message_ids(items)
+        raise
+    return items, duplicates, spilled
+
+def busy(status_code: int, retry_after: float, reason: str, count: int, detail: str):
+    messages_rejected.inc(count, reason=reason)
+    log.warning(f"🚦 {detail} Turned away {count} messages ({status_code}).")
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(math.ceil(retry_after))})
+
+async def admit(items: list, background_tasks: BackgroundTasks) -> bool:
+    """
+    Starts the analysis of [(msg, stream)] after the response is sent, or
+    keeps the messages in the spill file for later. Returns True if they
+    were spilled. Raises a 503 when saving is behind, or a 429 when the
+    server is busy and they can't be spilled.
+    """
+    if model_status["status"] == "failed":
+        raise busy(503, RETRY_AFTER_SECONDS, "models_failed", len(items), "NLP models could not be loaded.")
+
+    behind = saving_behind(items)
+    if behind:
+        raise busy(503, BATCH_SAVE_SECONDS, "saving_behind", len(items), f"Saving of {', '.join(behind)} is behind.")
+
+    # Once messages are spilled, new ones wait behind them to keep the order
+    if (spill is None or not len(spill)) and admission.try_acquire(len(items)):
+        # Lane latencies count from here, not from when the task starts
+        background_tasks.add_task(run_batch_analysis, items, time.monotonic())
+        return False
+
+    if spill is not None:
+        spilled = [(stream.stream_id, msg.model_dump()) for msg, stream in items]
+        if await asyncio.to_thread(spill.push, spilled):
+            messages_spilled.inc(len(items))
+            return True
+    raise busy(429, RETRY_AFTER_SECONDS, "busy", len(items), "Too many messages are being analysed.")
+
+async def spill_drainer():
+    """
+    Feeds spilled messages back in, oldest first, whenever there is room.
+    They are only removed from the file once they were analysed.
+    """
+    batch_size = min(SPILL_DRAIN_BATCH, MAX_IN_FLIGHT_MESSAGES)
     while True:
-        await asyncio.sleep(BATCH_SAVE_SECONDS)
+        if not len(spill) or not admission.has_room(batch_size): # type: ignore
+            await asyncio.sleep(SPILL_DRAIN_SECONDS)
+            continue
 
-        if queue.empty():
+        rows = await asyncio.to_thread(spill.peek, batch_size) # type: ignore
+        if not rows:
+            await asyncio.sleep(SPILL_DRAIN_SECONDS)
+            continue
+        items = []
+        for _, stream_id, message in rows:
+            # Streams that were ended (or a restart) are opened again
+            stream = await stream_for_message(stream_id)
+            if stream is None:
+                messages_rejected.inc(reason="unknown_stream")
+                continue
+            items.append((ChatMessage(**message), stream))
+
+        # Live requests may have taken the room while the rows were read.
+        # Then they stay in the file and are read again next time.
+        if items and not admission.try_acquire(len(items)):
+            await asyncio.sleep(SPILL_DRAIN_SECONDS)
             continue
+        if items:
+            await run_batch_analysis(items)
+        await asyncio.to_thread(spill.ack, rows[-1][0]) # type: ignore
 
-        messages_to_save = []
-        while not queue.empty():
-            try:
-                messages_to_save.append(queue.get_nowait())
-            except asyncio.QueueEmpty:
-                break
+def live_snapshot(stream: StreamState) -> dict:
+    # Everything a viewer needs to draw the dashboard from scratch
+    return {**stream.snapshot(), "recent_messages": list(stream.recent_messages)}
 
-        if not messages_to_save:
-            continue
+async def live_publisher():
+    """
+    Pushes new messages and the changed stats to /events viewers, in one
+    go every LIVE_PUBLISH_SECONDS. Nothing is sent while nothing happens.
+    """
+    while True:
+        await asyncio.sleep(LIVE_PUBLISH_SECONDS)
+        for stream in list(streams.values()):
+            if not stream.live_pending:
+                continue
 
-        try:
-            df = pd.DataFrame(messages_to_save)
-            # Use SAVE_FILE (no 'S')
-            file_exists = os.path.exists(SAVE_FILE)
-
-            async with aiofiles.open(SAVE_FILE, mode='a', newline='', encoding='utf-8') as f:
-                # Add all columns for robustness
-                all_cols = [
-                    "timestamp", "author", "original_message",
-                    "cleaned_message", "sentiment_label", "sentiment_score",
-                    "toxicity_label", "toxicity_score", "error"
-                ]
-                df_to_save = df.reindex(columns=all_cols)
-                
-                await f.write(df_to_save.to_csv(
-                    header=not file_exists,
-                    index=False
-                ))
-
-            log.info(f"💾 Saved {len(messages_to_save)} messages to {SAVE_FILE}")
-
-        except Exception as e:
-            log.error(f"❌ Error saving batch to CSV: {e}")
+            messages, stream.live_pending = stream.live_pending, []
+            if not stream.broadcaster.subscriber_count:
+                continue
+
+            stream.broadcaster.publish("messages", messages)
+            # Only the newest buckets, the viewer already has the older ones
+            stream.broadcaster.publish("stats", stream.snapshot(max_points=2))
 
 # --- Lifespan (Your code here is perfect) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     log.info("Server is starting up")
-    try:
-        load_models()
-        log.info("🧠 NLP models loaded successfully.")
-    except Exception as e:
-        log.critical(f"❌ FATAL: Could not load NLP models. {e}")
-        return # Stop startup if models fail
-    
-    global saver_task
-    saver_task = asyncio.create_task(batch_saver(message_queue))
+    # Messages are taken in (and wait in the batcher) while the models load
+    loader_task = asyncio.create_task(load_models_in_background())
+
+    batcher.start()
+    log.info("💾 Batch savers started.")
+    for stream in streams.values():
+        stream.start_saver(BATCH_SAVE_SECONDS)
+    publisher_task = asyncio.create_task(live_publisher())
+    health_task = asyncio.create_task(pool_health_checker()) if inference_pool else None
+    drain_task = None
+    if spill is not None:
+        if len(spill):
+            log.info(f"📦 {len(spill)} spilled messages from the last run will be analysed.")
+        drain_task = asyncio.create_task(spill_drainer())
     yield
     log.info("Server shutting down...")
-    if not message_queue.empty():
-        log.info("Saving remaining messages in queue...")
-        await batch_saver(message_queue)
-    saver_task.cancel()
-    try:
-        await saver_task
-    except asyncio.CancelledError:
-        log.info("Batch saver task cancelled.")
+    loader_task.cancel()
+    publisher_task.cancel()
+    if health_task:
+        health_task.cancel()
+    if drain_task:
+        # Whatever wasn't drained stays in the file for the next run
+        drain_task.cancel()
+    await batcher.stop()
+    if inference_pool:
+        await asyncio.to_thread(inference_pool.shutdown)
+    log.info("Saving remaining messages in queues...")
+    for stream in list(streams.values()):
+        await stream.close()
+    if spill is not None:
+        spill.close()
 
 # --- App Setup (Your code here is perfect) ---
 app = FastAPI(lifespan=lifespan)
@@ -111,78 +501,483 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # The route template (not the raw URL), so ids don't make new series
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    http_requests.inc(method=request.method, path=path, status=response.status_code)
+    http_seconds.observe(time.perf_counter() - started, method=request.method, path=path)
+    return response
+
 class ChatMessage(BaseModel):
     user: str
     text: str
+    # YouTube's own message id and 'publishedAt', when the bot has them
+    message_id: Optional[str] = None
+    published_at: Optional[str] = None
+    # The video id from /set_stream. Without it, the current stream.
+    stream_id: Optional[str] = None
+    # Set (e.g. "$5.00") only for Super Chats
+    super_chat_amount: Optional[str] = None
 
 class StreamInfo(BaseModel):
     url: str
 
+class StreamId(BaseModel):
+    stream_id: str
+
 @app.get("/")
 def read_root():
     return {"Message": "Sentiment Analysis API is running."}
 
+@app.get("/healthz")
+def healthz():
+    """
+    Liveness: the server is up and answering, whether the models are loaded or not.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 once the models are loaded and warmed up, 503 until then
+    (or if they failed to load).
+    """
+    if model_status["status"] != "ready":
+        return JSONResponse(status_code=503, content=model_status)
+    return model_status
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Counters, gauges and histograms in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/streams")
+def list_streams():
+    """
+    Every stream being watched, with its file and message counts.
+    """
+    pending = batcher.pending()
+    return {
+        "current": current_stream_id,
+        "streams": [
+            {**stream.summary(), "awaiting_analysis": pending.get(stream.stream_id, 0)}
+            for stream in streams.values()
+        ],
+    }
+
+@app.get("/stats")
+async def stream_stats(stream_id: Optional[str] = None):
+    """
+    Pre-aggregated numbers for the dashboard: totals, time series
+    (10s / 1m / 5m buckets) and the top toxic authors.
+    """
+    stream = find_stream(stream_id)
+    if stream is None:
+        return {"error": "Unknown stream."}
+    return stream.snapshot()
+
+
+@app.get("/events")
+async def live_events(request: Request, stream_id: Optional[str] = None):
+    """
+    Server-Sent Events for the dashboard. A 'snapshot' comes first, then
+    'messages' (newly analysed messages) and 'stats' (updated totals and
+    newest time buckets) whenever something changed.
+    """
+    stream = find_stream(stream_id)
+    if stream is None:
+        return {"error": "Unknown stream."}
+    broadcaster = stream.broadcaster
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            yield format_sse("snapshot", live_snapshot(stream))
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # A comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/alerts")
+async def moderator_alerts(request: Request, stream_id: Optional[str] = None):
+    """
+    Server-Sent Events for moderators: every priority message ('alert')
+    as soon as it is analysed, of one stream or of all of them. The most
+    recent ones come first, as 'recent'.
+    """
+    queue = alerts.subscribe()
+
+    def wanted(alert: dict) -> bool:
+        return stream_id is None or alert["stream_id"] == stream_id
+
+    async def event_stream():
+        try:
+            yield format_sse("recent", [alert for alert in recent_alerts if wanted(alert)])
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if wanted(data):
+                    yield format_sse(event, data)
+        finally:
+            alerts.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/stats/words")
+async def word_stats(limit: int = 200, stream_id: Optional[str] = None):
+    """
+    The most frequent words of a stream, for the word cloud.
+    """
+    stream = find_stream(stream_id)
+    if stream is None:
+        return {"error": "Unknown stream."}
+    return {"stream_id": stream.stream_id, "file": stream.save_file, "words": stream.word_frequencies.top(limit)}
+
+
+@app.get("/stats/live")
+def live_stats():
+    """
+    Viewers connected to /events and how many events slow ones lost.
+    """
+    totals = {"subscribers": 0, "buffer_size": LIVE_BUFFER_SIZE, "published": 0, "dropped": 0}
+    for stream in streams.values():
+        stats = stream.broadcaster.stats()
+        for key in ("subscribers", "published", "dropped"):
+            totals[key] += stats[key]
+    return totals
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    """
+    Hit/miss/eviction counters of the model result cache.
+    """
+    return result_cache.stats()
+
+
+@app.get("/stats/cascade")
+def cascade_tier_stats():
+    """
+    How many messages the lexical pre-screen, the cache and the models answered.
+    """
+    return cascade_stats.stats()
+
+
+@app.get("/stats/inference")
+def inference_batching_stats():
+    """
+    How the forward passes were batched, and how much of them was padding.
+    """
+    return inference_stats()
+
+
+@app.get("/stats/clusters")
+def cluster_stats():
+    """
+    Near-duplicate clusters: how many messages matched exactly or nearly.
+    """
+    return near_duplicates.stats()
+
+
+@app.get("/stats/pool")
+def pool_stats():
+    """
+    Worker count, batches and restarts of the inference process pool.
+    """
+    if not inference_pool:
+        return {"workers": 0, "running": False}
+    return inference_pool.stats()
+
+
+@app.get("/stats/sampling")
+def sampling_stats():
+    """
+    Load shedding: the current sampling rate and how many messages were left out.
+    """
+    return load_shedder.stats()
+
+
+@app.get("/stats/priority")
+def priority_stats():
+    """
+    Priority lane: latency percentiles per lane, the SLO and why messages got priority.
+    """
+    return {**priority_lanes.stats(), "queued": batcher.pending_priority(), "alert_viewers": alerts.subscriber_count}
+
+
+@app.get("/stats/admission")
+def admission_stats():
+    """
+    Messages being analysed, the limit, and the spill file (if any).
+    """
+    return {**admission.stats(), "spill": spill.stats() if spill is not None else None}
+
+
+@app.post("/reload_lexicon")
+def reload_negative_words():
+    """
+    Re-reads NEGATIVE_WORDS_FILE without restarting the server.
+    """
+    try:
+        term_count = reload_lexicon()
+    except Exception as e:
+        log.error(f"❌ Could not reload negative word lexicon: {e}")
+        return {"error": str(e)}
+
+    log.info(f"📖 Negative word lexicon reloaded ({term_count} terms).")
+    return {"status": "ok", "terms": term_count}
+
 
 @app.post("/set_stream")
 async def set_stream(stream: StreamInfo):
     """
     Called from bot.py when a new YouTube video link is entered.
     Creates a new timestamped CSV filename for saving chat data.
+    Other streams keep going, this one becomes the default for
+    messages that don't name their stream.
     """
-    global SAVE_FILE
+    global current_stream_id
 
     # Extract YouTube video ID
-    video_id = None
-    if "v=" in stream.url:
-        video_id = stream.url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in stream.url:
-        video_id = stream.url.split("youtu.be/")[1].split("?")[0]
-
-    if not video_id:
+    video_id = parse_video_id(stream.url)
+    if not is_valid_stream_id(video_id):
         return {"error": "Invalid YouTube URL."}
 
-    # Create data directory
-    os.makedirs("data", exist_ok=True)
+    if video_id not in streams and len(streams) >= MAX_STREAMS:
+        return {"error": f"Already watching {MAX_STREAMS} streams."}
+
+    state = await open_stream(video_id) # type: ignore
+    current_stream_id = video_id
+    return {"status": "ok", "file": state.save_file, "stream_id": video_id}
+
+@app.post("/end_stream")
+async def end_stream(stream: StreamId):
+    """
+    Saves what is left of a stream and stops tracking it.
+    """
+    global current_stream_id
+
+    if stream.stream_id == DEFAULT_STREAM_ID:
+        return {"error": "The default stream can't be ended."}
+    state = streams.pop(stream.stream_id, None)
+    if state is None:
+        return {"error": "Unknown stream."}
 
-    # Generate timestamped filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    SAVE_FILE = f"data/chat_{video_id}_{timestamp}.csv"
+    await state.close()
+    if current_stream_id == stream.stream_id:
+        current_stream_id = DEFAULT_STREAM_ID
+    log.info(f"🏁 Stopped tracking {stream.stream_id} ({state.saved} messages saved).")
+    return {"status": "ok", "file": state.save_file, "saved": state.saved}
 
-    log.info(f"📁 Now saving chats to → {SAVE_FILE}")
-    return {"status": "ok", "file": SAVE_FILE}
+async def priority_reasons(items: list) -> tuple:
+    """
+    (priority reasons, prepared message) of each [(msg, stream)]: why it
+    goes to the high-priority lane ([] if it doesn't), and its cleaned
+    text and lexicon hits, which the analysis then uses as they are.
+    """
+    if not priority_lanes.enabled:
+        return [[] for _ in items], [None] * len(items)
+
+    # Cleaning a whole page is CPU work, keep it off the event loop
+    prepared = await asyncio.to_thread(prepare_messages, [msg.text for msg, _ in items])
+    reasons = [
+        priority_lanes.reasons(msg.user, bool(negative_hits), msg.super_chat_amount is not None)
+        for (msg, _), (_, negative_hits) in zip(items, prepared)
+    ]
+    return reasons, prepared
+
+async def sampling_weights(items: list, reasons: list, prepared: list) -> tuple:
+    """
+    (sample weight, prepared message) of each [(msg, stream)] at the current load.
+    While shedding every message is cleaned and checked against the
+    lexicon here (if it wasn't yet), hits and priority messages are always analysed.
+    """
+    rate = load_shedder.rate(admission.in_flight / admission.max_in_flight)
+    if rate >= 1.0:
+        return load_shedder.weights([msg.user for msg, _ in items], [], rate), prepared
+
+    if not priority_lanes.enabled:
+        prepared = await asyncio.to_thread(prepare_messages, [msg.text for msg, _ in items])
+    protected = [
+        bool(message_reasons) or not cleaned or bool(negative_hits)
+        for message_reasons, (cleaned, negative_hits) in zip(reasons, prepared)
+    ]
+    return load_shedder.weights([msg.user for msg, _ in items], protected, rate), prepared
+
+def publish_alert(msg: ChatMessage, analysis: dict, stream: StreamState, reasons: list, latency: float):
+    alert = {
+        "stream_id": stream.stream_id,
+        "reasons": reasons,
+        "super_chat_amount": msg.super_chat_amount,
+        "latency_ms": round(latency * 1000, 1),
+        "contains_negative_word": analysis.get("contains_negative_word"),
+        **{field: analysis.get(field) for field in LIVE_MESSAGE_FIELDS},
+    }
+    recent_alerts.append(alert)
+    alerts.publish("alert", alert)
+
+async def analyse_message(msg: ChatMessage, stream: StreamState, weight: float, reasons: list,
+                          prepared, received_at: float):
+    lane = "high" if reasons else "normal"
+    analysis = await batcher.submit(msg.text, stream.stream_id, priority=bool(reasons), prepared=prepared)
+    analysis["sample_weight"] = weight
+    await queue_analysis(msg, analysis, stream)
+
+    latency = time.monotonic() - received_at
+    lane_latency.observe(latency, lane=lane)
+    if not priority_lanes.observe(lane, latency):
+        priority_slo_misses.inc()
+        log.warning(f"🐢 Priority message of {stream.stream_id} took {latency:.2f}s (SLO {PRIORITY_SLO_SECONDS:.1f}s).")
+    if reasons:
+        publish_alert(msg, analysis, stream, reasons, latency)
+
+async def run_batch_analysis(items: list, received_at: Optional[float] = None):
+    received_at = received_at or time.monotonic()
+    released = 0
+    try:
+        reasons, prepared = await priority_reasons(items)
+        weights, prepared = await sampling_weights(items, reasons, prepared)
+        sampled = []
+        for (msg, stream), weight, message_reasons, prepared_message in zip(items, weights, reasons, prepared):
+            if weight:
+                sampled.append((msg, stream, weight, message_reasons, prepared_message))
+                continue
+            # Left out under load: saved and counted, but not analysed
+            messages_sampled_out.inc(stream=stream.stream_id)
+            await queue_analysis(msg, skipped_result(msg.text, prepared_message[0]), stream)
+        # They are done, their room can go to new messages right away
+        released = len(items) - len(sampled)
+        admission.release(released)
+
+        # All messages go to the batcher at once, so a poll page
+        # usually becomes one or a few forward passes. Each one is saved
+        # (and alerted) as soon as its own batch is done, priority
+        # messages don't wait for the rest of the page.
+        results = await asyncio.gather(
+            *(analyse_message(msg, stream, weight, message_reasons, prepared_message, received_at)
+              for msg, stream, weight, message_reasons, prepared_message in sampled),
+            return_exceptions=True,
+        )
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed:
+            raise failed[0]
+    except Exception as e:
+        errors_total.inc(stage="analysis_task")
+        log.error(f"❌ Error during batch analysis task: {e}")
+    finally:
+        admission.release(len(items) - released)
+
+async def queue_analysis(msg: ChatMessage, analysis: dict, stream: StreamState):
+    started = time.perf_counter()
+    # Add other info
+    analysis["timestamp"] = datetime.now(timezone.utc).isoformat()
+    analysis["author"] = msg.user
+    analysis["original_message"] = msg.text
+    analysis["message_id"] = msg.message_id
+    analysis["published_at"] = msg.published_at
+    stream.aggregates.add(analysis)
+    if analysis.get("toxicity_label") == "TOXIC":
+        # Their next messages go to the priority lane for a while
+        priority_lanes.toxic_authors.flag(msg.user)
+    stream.word_frequencies.add(analysis.get("cleaned_message"))
+
+    live_message = {field: analysis.get(field) for field in LIVE_MESSAGE_FIELDS}
+    stream.recent_messages.append(live_message)
+    stream.live_pending.append(live_message)
+
+    # Add to the stream's in-memory save buffer. When it is full the
+    # message is dropped (and counted) instead of piling up in memory.
+    if stream.buffer.append(analysis):
+        messages_analysed.inc(stream=stream.stream_id)
+        # Per message, so only when debugging
+        log.debug(f"📩 Queued message from {msg.user} ({stream.stream_id}). Queue size: {len(stream.buffer)}")
+    else:
+        messages_dropped.inc(stream=stream.stream_id)
+        log.warning(f"🔥 Message queue of {stream.stream_id} is full! A message was dropped.")
+    stage_seconds.observe(time.perf_counter() - started, stage="enqueue")
+
+    if stream.closed:
+        # Finished after its stream was switched or ended, still belongs in its file
+        await stream.close()
 
 # --- FIX 3: Changed to @app.post("/fetch_chat") ---
 @app.post("/fetch_chat")
 async def fetch_chat(msg: ChatMessage, background_tasks: BackgroundTasks):
-    
-    # --- FIX 4: Added the missing 'run_analysis' function ---
-    # This is the non-blocking logic from my previous example
-    async def run_analysis(msg: ChatMessage):
-        try:
-            # Run the "slow" NLP in a separate thread
-            analysis = await asyncio.to_thread(analyse_message, msg.text)
-
-            # Add other info
-            analysis["timestamp"] = pd.Timestamp.utcnow().isoformat()
-            analysis["author"] = msg.user
-            analysis["original_message"] = msg.text
-
-            # Add to our fast in-memory queue
-            try:
-                await message_queue.put(analysis)
-                log.info(f"📩 Queued message from {msg.user}. Queue size: {message_queue.qsize()}")
-            except asyncio.QueueFull:
-                log.warning("🔥 Message queue is full! A message was dropped.")
-
-        except Exception as e:
-            log.error(f"❌ Error during analysis task: {e}")
-
-    # Tell FastAPI to run this *after* we return "ok"
-    background_tasks.add_task(run_analysis, msg)
-    
+
+    # The stream is picked now, so a switch during the analysis can't
+    # send the row to another stream's file
+    stream = await stream_for_message(msg.stream_id)
+    if stream is None:
+        messages_rejected.inc(reason="unknown_stream")
+        return {"error": f"Unknown stream: {msg.stream_id}"}
+
+    # The analysis runs *after* we return "ok" (or later, if it was spilled)
+    _, duplicates, spilled = await admit_new([(msg, stream)], background_tasks)
+    if duplicates:
+        return {"status": "ok", "message": "Message was already received.", "duplicates": 1}
+    if spilled:
+        return {"status": "ok", "message": "Server is busy, message saved for later processing.", "spilled": 1}
+
     # Return an immediate "OK" to the client
     return {"status": "ok", "message": "Message queued for processing."}
 
+@app.post("/fetch_chat_batch")
+async def fetch_chat_batch(msgs: List[ChatMessage], background_tasks: BackgroundTasks):
+    """
+    Same as /fetch_chat, but for a whole poll page in one request.
+    Messages may belong to different streams. The page is accepted
+    or turned away (429/503) as a whole.
+    """
+    items = []
+    rejected = 0
+    for msg in msgs:
+        stream = await stream_for_message(msg.stream_id)
+        if stream is None:
+            rejected += 1
+            continue
+        items.append((msg, stream))
+    if rejected:
+        messages_rejected.inc(rejected, reason="unknown_stream")
+
+    # A page sent again (the bot timed out, but we had it) is only analysed once
+    items, duplicates, spilled = await admit_new(items, background_tasks)
+    if spilled:
+        response = {"status": "ok", "message": f"Server is busy, {len(items)} messages saved for later processing.", "spilled": len(items)}
+    else:
+        response = {"status": "ok", "message": f"{len(items)} messages queued for processing."}
+    if rejected:
+        response["rejected"] = rejected
+    if duplicates:
+        response["duplicates"] = duplicates
+    return response
+
 # --- Main (Your code here is perfect) ---
 if __name__ == "__main__":
     # Use reload=True for development, it auto-restarts when you save
@@ -1,11 +1,19 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from wordcloud import WordCloud, STOPWORDS
+from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 import os
 import time
-from streamlit_autorefresh import st_autorefresh
+from glob import glob
+import requests
+import threading
+
+from backend.aggregates import SPAM_WAVE_MIN_SIZE, TOP_SPAM_WAVES
+from backend.live_feed import LiveFeed
+from backend.sampling import WeightedMean, weighted_summary
+from backend.storage import IncrementalReader, empty_frame
+from backend.wordfreq import WordFrequency
 
 st.set_page_config(
     page_title="YouTube Livechat Sentiment Dashboard",
@@ -16,10 +24,35 @@ st.set_page_config(
 # --- Filepath ---
 # This is the "pointer" file that bot.py creates
 CONFIG_FILE = "current_stream.txt"
-
-# --- Run the auto-refresher ---
-# This will re-run the *entire* script every 5 seconds. This is perfect.
-st_autorefresh(interval=5000, key="datarefresh")
+# Pre-aggregated stats and live updates from the server (chat.py)
+STATS_URL = "http://127.0.0.1:8080/stats"
+EVENTS_URL = "http://127.0.0.1:8080/events"
+WORDS_URL = "http://127.0.0.1:8080/stats/words"
+STREAMS_URL = "http://127.0.0.1:8080/streams"
+# Where the server writes one file per stream
+DATA_DIR = "data"
+STORE_EXTENSIONS = (".csv", ".db", ".sqlite")
+
+# --- Refresh rates (seconds) ---
+# The live parts check the in-memory feed this often, which costs
+# next to nothing when the server pushed nothing new
+LIVE_CHECK_SECONDS = 1
+WORDCLOUD_REFRESH_SECONDS = 60
+WORDCLOUD_MAX_WORDS = 200
+COMPARE_REFRESH_SECONDS = 5
+
+LATEST_COLUMNS = [
+    "timestamp", "author", "original_message", "sentiment_label", "toxicity_label",
+    "cluster_id", "cluster_size",
+]
+# Latest messages looked at when collapsing near-duplicates into one row
+LATEST_WINDOW = 200
+
+@st.cache_resource
+def get_live_feed(stream_id=None):
+    # One connection per stream, shared by every viewer of this dashboard
+    url = f"{EVENTS_URL}?stream_id={stream_id}" if stream_id else EVENTS_URL
+    return LiveFeed(url).start()
 
 def get_csv_name():
 
@@ -34,7 +67,43 @@ def get_csv_name():
         return None
     
 
+def stream_id_from_file(path):
+    # data/chat_<video id>_<date>_<time>.csv -> <video id>
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not name.startswith("chat_"):
+        return None
+    return name[len("chat_"):].rsplit("_", 2)[0]
+
 @st.cache_data(ttl=5)
+def list_streams():
+    """
+    {file: stream id} of every stream to pick from: the ones the
+    server is watching first, then older files found in data/.
+    """
+    streams = {}
+    try:
+        response = requests.get(STREAMS_URL, timeout=1)
+        response.raise_for_status()
+        for stream in response.json().get("streams", []):
+            if stream.get("total_messages") or os.path.exists(stream["file"]):
+                streams[stream["file"]] = stream["stream_id"]
+    except Exception:
+        pass
+
+    files = [path for path in glob(os.path.join(DATA_DIR, "chat_*")) if path.endswith(STORE_EXTENSIONS)]
+    for path in sorted(files, key=os.path.getmtime, reverse=True):
+        streams.setdefault(path, stream_id_from_file(path))
+    return streams
+
+def stream_label(streams, data_file):
+    return f"{streams.get(data_file) or '?'} — {os.path.basename(data_file)}"
+
+@st.cache_resource(max_entries=8)
+def get_reader(csv_filename):
+    # One reader per file, shared by every viewer, so each refresh
+    # only parses the rows that were appended since the last one
+    return IncrementalReader(csv_filename)
+
 def load_data(csv_filename):
 
     if not csv_filename:
@@ -44,107 +113,213 @@ def load_data(csv_filename):
 
     if not os.path.exists(csv_filename):
         st.warning(f"⚠️ Waiting for data... (File not found: {csv_filename})")
-        return pd.DataFrame(columns=[
-            "timestamp", "author", "original_message", "cleaned_message",
-            "sentiment_label", "sentiment_score", "toxicity_label", "toxicity_score"
-        ])
+        return empty_frame()
     
     try:
-        df = pd.read_csv(csv_filename)
-        if df.empty:
-            return df
-        
-        # Convert types
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['sentiment_score'] = pd.to_numeric(df['sentiment_score'], errors='coerce')
-        df['toxicity_score'] = pd.to_numeric(df['toxicity_score'], errors='coerce')
-        return df
-    except pd.errors.EmptyDataError:
-        return pd.DataFrame() # File is empty, just wait
+        # The store restores the column types (timestamps, float scores)
+        return get_reader(csv_filename).read()
     except Exception as e:
         st.error(f"Error loading data from {csv_filename}: {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
-def generate_wordcloud(text_series):
-    """Generates a word cloud from a pandas series of text."""
-    if text_series.empty or text_series.isnull().all():
+def stream_params(stream_id):
+    return {"stream_id": stream_id} if stream_id else {}
+
+def fetch_stats(csv_filename, rows_on_disk, stream_id=None):
+    """
+    Running stats from chat.py's /stats endpoint.
+    Returns None if the server is down, is watching another stream,
+    or was restarted mid-stream (then its totals are incomplete).
+    """
+    try:
+        response = requests.get(STATS_URL, params=stream_params(stream_id), timeout=1)
+        response.raise_for_status()
+        stats = response.json()
+    except Exception:
         return None
-        
-    # Join all messages into one big string
-    text = " ".join(str(msg) for msg in text_series.dropna())
-    
-    if not text:
+
+    if stats.get("file") != csv_filename or stats.get("total_messages", 0) < rows_on_disk:
+        return None
+    return stats
+
+def stats_from_rows(data):
+    """
+    The same numbers as /stats, computed from the saved rows.
+    """
+    total_messages = len(data)
+    # Rows saved under load shedding stand for sample_weight messages,
+    # 0 if they weren't analysed. Older files have no weights.
+    if 'sample_weight' in data:
+        weights = data['sample_weight'].fillna(1.0)
+    else:
+        weights = pd.Series(1.0, index=data.index)
+    scored = data['sentiment_score'].notna() & (weights > 0)
+    labelled = data['toxicity_label'].notna() & (weights > 0)
+
+    sentiment = WeightedMean()
+    sentiment.add_many(data.loc[scored, 'sentiment_score'], weights[scored])
+    toxicity = WeightedMean()
+    toxicity.add_many(data.loc[labelled, 'toxicity_label'] == 'TOXIC', weights[labelled])
+
+    # Resample to 10-second intervals for smoother line
+    sentiment_weights = weights.where(scored, 0.0)
+    sentiment_over_time = (
+        pd.DataFrame({
+            'timestamp': data['timestamp'],
+            'weighted_sum': data['sentiment_score'].fillna(0.0) * sentiment_weights,
+            'weight': sentiment_weights,
+        })
+        .set_index('timestamp')
+        .resample('10s')
+        .sum()
+    )
+    sentiment_over_time['sentiment_score'] = sentiment_over_time['weighted_sum'] / sentiment_over_time['weight']
+    sentiment_over_time = sentiment_over_time[['sentiment_score']].reset_index()
+    top_toxic_users = (
+        data.loc[data['toxicity_label'] == 'TOXIC', 'author']
+        .value_counts()
+        .nlargest(10)
+    )
+
+    return {
+        "total_messages": total_messages,
+        **weighted_summary(sentiment, toxicity, int((weights == 0).sum()), total_messages),
+        "series": {"10s": sentiment_over_time.to_dict("records")},
+        "top_toxic_authors": list(top_toxic_users.items()),
+        "spam_waves": spam_waves_from_rows(data),
+    }
+
+def spam_waves_from_rows(data):
+    """
+    The same as the "spam_waves" part of /stats, from the cluster_id of each row.
+    Files saved before messages were clustered have no waves.
+    """
+    waves = {"min_size": SPAM_WAVE_MIN_SIZE, "waves": 0, "messages": 0, "top": []}
+    if 'cluster_id' not in data or data['cluster_id'].isna().all():
+        return waves
+
+    clusters = (
+        data.dropna(subset=['cluster_id'])
+        .assign(toxic=lambda df: df['toxicity_label'] == 'TOXIC')
+        .groupby('cluster_id')
+        .agg(
+            message=('original_message', 'first'),
+            size=('original_message', 'size'),
+            toxic=('toxic', 'sum'),
+            first_seen=('timestamp', 'min'),
+            last_seen=('timestamp', 'max'),
+        )
+    )
+    clusters = clusters[clusters['size'] >= SPAM_WAVE_MIN_SIZE]
+    waves["waves"] = len(clusters)
+    waves["messages"] = int(clusters['size'].sum())
+    waves["top"] = clusters.nlargest(TOP_SPAM_WAVES, 'size').reset_index().to_dict("records")
+    return waves
+
+def collapse_near_duplicates(latest):
+    """
+    Only the newest message of each near-duplicate cluster, so one spam wave
+    doesn't fill the whole table. Rows without a cluster are kept as they are.
+    """
+    if latest['cluster_id'].isna().all():
+        return latest
+    keys = latest['cluster_id'].fillna(pd.Series(latest.index.astype(str), index=latest.index))
+    return latest[~keys.duplicated(keep='last')]
+
+
+def fetch_word_frequencies(csv_filename, stream_id=None):
+    """
+    The server's running word counts, or None if it is not watching this file.
+    """
+    try:
+        params = {"limit": WORDCLOUD_MAX_WORDS, **stream_params(stream_id)}
+        response = requests.get(WORDS_URL, params=params, timeout=2)
+        response.raise_for_status()
+        body = response.json()
+    except Exception:
+        return None
+
+    if body.get("file") != csv_filename:
+        return None
+    return body.get("words")
+
+class RowWordCounter:
+    """
+    Fallback word counts, built from the rows as the reader appends them,
+    so each message is only counted once.
+    """
+
+    def __init__(self):
+        self.rows_counted = 0
+        self.counter = WordFrequency()
+        self._lock = threading.Lock()
+
+    def update(self, data):
+        with self._lock:
+            if len(data) < self.rows_counted:
+                # The reader started over (new or rewritten file)
+                self.rows_counted = 0
+                self.counter = WordFrequency()
+
+            self.counter.add_many(data['cleaned_message'].iloc[self.rows_counted:])
+            self.rows_counted = len(data)
+            return self.counter.top(WORDCLOUD_MAX_WORDS)
+
+@st.cache_resource(max_entries=8)
+def get_row_word_counter(csv_filename):
+    return RowWordCounter()
+
+@st.cache_data(ttl=60)
+def generate_wordcloud(frequencies):
+    """Generates a word cloud from a {word: count} dict."""
+    if not frequencies:
         return None
 
+    # Cost depends on the vocabulary size, not on how many messages there were
     wordcloud = WordCloud(
         width=800,
         height=400,
         background_color="black",
         colormap="coolwarm",
-        max_words=200,
+        max_words=WORDCLOUD_MAX_WORDS,
         collocations=False
-    ).generate(text)
+    ).generate_from_frequencies(frequencies)
     
     return wordcloud
 
 
-#----MAIN DashBoard----
-
-st.title("🎮 Live YouTube Chat Sentiment Dashboard")
-
-DATA_FILE_NAME = get_csv_name()
-st.info(f"Watching file: {DATA_FILE_NAME}")
-
-#Load the Data
-data = load_data(DATA_FILE_NAME)
-
-if data.empty:
-    st.warning("No chat data found yet. Is the `bot.py` client running and sending messages to the server?")
-    st.stop() # Tell streamlit to stop here and wait for the refresh
-
-
-
-# --- Top Row: Key Metrics ---
-st.header("📊 Key Metrics")
-
-if data is not None and not data.empty:
-    # Calculate main stats safely
-    total_messages = len(data)
-    avg_sentiment = data['sentiment_score'].mean() if 'sentiment_score' in data else 0
-    total_toxic_msgs = len(data[data['toxicity_label'] == 'TOXIC']) if 'toxicity_label' in data else 0
-    toxicity_percent = (total_toxic_msgs / total_messages) * 100 if total_messages > 0 else 0
-
-    # Display 4 metrics side by side
-    col1, col2, col3, col4 = st.columns(4)
-
-    col1.metric("💬 Total Messages", f"{total_messages}")
-    col2.metric("😊 Avg. Sentiment", f"{avg_sentiment:.2f}")
-    col3.metric("☠️ Toxic Messages", f"{total_toxic_msgs}")
-    col4.metric("⚠️ Toxicity %", f"{toxicity_percent:.2f}%")
-
-else:
-    st.warning("⚠️ No chat data available yet. Please start the bot or load a CSV file.")
-
-
-#----MIDDLE ROW : Charts----
-
-st.header("📈 Live Charts")
-
-col_left, col_right = st.columns(2)
-
-with col_left:
-    # Chart 1: Sentiment Over Time
-    st.subheader("Sentiment Over Time")
-    if not data.empty:
-        # Resample to 10-second intervals for smoother line
-        sentiment_over_time = (
-            data.set_index('timestamp')
-            .resample('10s')
-            .agg({'sentiment_score': 'mean'})
-            .reset_index()
-        )
+def with_interval(text, interval, weighted, fmt):
+    """
+    "0.42 ± 0.03" for an estimate from a sample, just the value otherwise.
+    """
+    if not weighted or not interval:
+        return text
+    return f"{text} ± {fmt.format((interval[1] - interval[0]) / 2)}"
+
+def current_state(data_file, stream_id=None):
+    """
+    (version, stats, latest messages) for the watched file.
+    Comes from the live feed when the server pushes for this file,
+    otherwise from the saved rows.
+    """
+    feed = get_live_feed(stream_id)
+    version, stats, messages = feed.view()
+    if feed.connected and stats and stats.get("file") == data_file:
+        return ("live", version), stats, pd.DataFrame(messages, columns=LATEST_COLUMNS)
+
+    data = load_data(data_file)
+    if data.empty:
+        return ("rows", 0), None, data
+    # Prefer the server's running totals, the raw rows are only a fallback
+    stats = fetch_stats(data_file, len(data), stream_id) or stats_from_rows(data)
+    return ("rows", len(data)), stats, data.reindex(columns=LATEST_COLUMNS)
+
+def build_charts(stats):
+    sentiment_over_time = pd.DataFrame(stats["series"]["10s"])
+    fig_sentiment = None
+    if not sentiment_over_time.empty:
+        sentiment_over_time['timestamp'] = pd.to_datetime(sentiment_over_time['timestamp'])
 
         fig_sentiment = px.line(
             sentiment_over_time,
@@ -157,23 +332,10 @@ with col_left:
             yaxis_title="Sentiment Score (-1 to 1)",
             title_x=0.2
         )
-        st.plotly_chart(fig_sentiment, width='stretch')
-    else:
-        st.write("No data yet to plot sentiment trend.")
-
-with col_right:
-    st.subheader("Top Toxic Users")
-    toxic_data = data[data['toxicity_label'] == 'TOXIC']
-
-    if not toxic_data.empty:
-        top_toxic_users = (
-            toxic_data['author']
-            .value_counts()
-            .nlargest(10)
-            .reset_index()
-        )
-        top_toxic_users.columns = ['User', 'Toxic Message Count']
 
+    top_toxic_users = pd.DataFrame(stats["top_toxic_authors"], columns=['User', 'Toxic Message Count'])
+    fig_toxic_users = None
+    if not top_toxic_users.empty:
         fig_toxic_users = px.bar(
             data_frame=top_toxic_users,
             x='Toxic Message Count',
@@ -189,19 +351,117 @@ with col_right:
             title_x=0.2
         )
 
-        st.plotly_chart(fig_toxic_users, width='stretch')
-    else:
-        st.write("No toxic messages detected yet.")
+    return fig_sentiment, fig_toxic_users
+
 
+# --- Live sections ---
+# Each fragment reruns on its own, without rerunning the whole script.
+# They only read in-memory state, and rebuild nothing if it didn't change.
 
-# --- Bottom Row: Word Cloud & Raw Data ---
-st.header("💬 Message Analysis")
-col_cloud, col_raw = st.columns(2)
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def metrics_section(data_file, stream_id=None):
+    version, stats, latest = current_state(data_file, stream_id)
+    if stats is None:
+        st.warning("No chat data found yet. Is the `bot.py` client running and sending messages to the server?")
+        return
+
+    # --- Top Row: Key Metrics ---
+    st.header("📊 Key Metrics")
+
+    # Display 4 metrics side by side
+    col1, col2, col3, col4 = st.columns(4)
+
+    # Under load shedding these are estimates from a sample, shown with
+    # the half-width of their 95% confidence interval
+    sampling = stats.get("sampling") or {}
+    weighted = sampling.get("weighted", False)
+
+    col1.metric("💬 Total Messages", f"{stats['total_messages']}")
+    col2.metric("😊 Avg. Sentiment", with_interval(f"{stats['avg_sentiment']:.2f}", stats.get("avg_sentiment_ci"), weighted, "{:.2f}"))
+    col3.metric("☠️ Toxic Messages", f"{'~' if weighted else ''}{stats['toxic_messages']}")
+    col4.metric("⚠️ Toxicity %", with_interval(f"{stats['toxicity_percent']:.2f}%", stats.get("toxicity_percent_ci"), weighted, "{:.2f}%"))
+    if weighted:
+        analysed = sampling["analysed"] / (sampling["analysed"] + sampling["skipped"])
+        st.caption(
+            f"⚖️ The server was overloaded and analysed {analysed:.0%} of the messages: "
+            "sentiment and toxicity are weighted estimates (± 95% confidence interval)."
+        )
+
+    # Raw Data Table
+    st.subheader("Latest Messages")
+    # Show the *last* 10 messages, in reverse order (newest on top),
+    # with repeats of the same message folded into one row
+    latest = collapse_near_duplicates(latest.tail(LATEST_WINDOW)).tail(10).iloc[::-1]
+    st.dataframe(
+        latest[["timestamp", "author", "original_message", "sentiment_label", "toxicity_label", "cluster_size"]]
+        .rename(columns={"cluster_size": "repeats"})
+    )
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def charts_section(data_file, stream_id=None):
+    version, stats, _ = current_state(data_file, stream_id)
+    if stats is None:
+        return
+
+    #----MIDDLE ROW : Charts----
+    st.header("📈 Live Charts")
+
+    # Figures are only rebuilt when new data arrived
+    cached = st.session_state.get("charts")
+    if cached is None or cached[0] != (data_file, version):
+        cached = ((data_file, version), *build_charts(stats))
+        st.session_state["charts"] = cached
+    _, fig_sentiment, fig_toxic_users = cached
+
+    col_left, col_right = st.columns(2)
+
+    with col_left:
+        # Chart 1: Sentiment Over Time
+        st.subheader("Sentiment Over Time")
+        if fig_sentiment is not None:
+            st.plotly_chart(fig_sentiment, width='stretch')
+        else:
+            st.write("No data yet to plot sentiment trend.")
+
+    with col_right:
+        st.subheader("Top Toxic Users")
+        if fig_toxic_users is not None:
+            st.plotly_chart(fig_toxic_users, width='stretch')
+        else:
+            st.write("No toxic messages detected yet.")
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def spam_waves_section(data_file, stream_id=None):
+    version, stats, _ = current_state(data_file, stream_id)
+    if stats is None or not stats.get("spam_waves"):
+        return
+
+    waves = stats["spam_waves"]
+    st.header("🌊 Spam Waves")
+    st.caption(f"The same message (give or take a few characters) posted {waves['min_size']} times or more.")
+
+    col1, col2 = st.columns(2)
+    col1.metric("🌊 Waves", f"{waves['waves']}")
+    col2.metric("📨 Messages in Waves", f"{waves['messages']}")
+
+    if waves["top"]:
+        top = pd.DataFrame(waves["top"])[["message", "size", "toxic", "first_seen", "last_seen"]]
+        st.dataframe(top, hide_index=True)
+    else:
+        st.write("No spam waves yet.")
 
-with col_cloud:
+@st.fragment(run_every=WORDCLOUD_REFRESH_SECONDS)
+def wordcloud_section(data_file, stream_id=None):
+    data = load_data(data_file)
+    if data.empty:
+        return
+
+    # --- Bottom Row: Word Cloud ---
+    st.header("💬 Message Analysis")
     # Word Cloud of common (cleaned) words
     st.subheader("Common Words")
-    wordcloud_fig = generate_wordcloud(data['cleaned_message'])
+    frequencies = fetch_word_frequencies(data_file, stream_id) or get_row_word_counter(data_file).update(data)
+    wordcloud_fig = generate_wordcloud(frequencies)
     if wordcloud_fig:
         fig, ax = plt.subplots()
         ax.imshow(wordcloud_fig, interpolation='bilinear')
@@ -210,9 +470,88 @@ with col_cloud:
     else:
         st.write("Not enough data for a word cloud.")
 
-with col_raw:
-    # Raw Data Table
-    st.subheader("Latest Messages")
-    # Show the *last* 10 messages, in reverse order (newest on top)
-    st.dataframe(data.tail(10).iloc[::-1][["timestamp", "author", "original_message", "sentiment_label", "toxicity_label"]])
 
+@st.fragment(run_every=COMPARE_REFRESH_SECONDS)
+def compare_section(data_files, streams):
+    st.header("🆚 Stream Comparison")
+
+    rows, series = [], []
+    for data_file in data_files:
+        stream_id = streams.get(data_file)
+        data = load_data(data_file)
+        if data.empty:
+            continue
+        stats = fetch_stats(data_file, len(data), stream_id) or stats_from_rows(data)
+
+        label = stream_label(streams, data_file)
+        rows.append({
+            "Stream": label,
+            "💬 Messages": stats["total_messages"],
+            "😊 Avg. Sentiment": round(stats["avg_sentiment"], 2),
+            "☠️ Toxic": stats["toxic_messages"],
+            "⚠️ Toxicity %": round(stats["toxicity_percent"], 2),
+        })
+        points = pd.DataFrame(stats["series"]["10s"])
+        if not points.empty:
+            series.append(points.assign(stream=label))
+
+    if not rows:
+        st.write("No data yet for the selected streams.")
+        return
+
+    st.dataframe(pd.DataFrame(rows).set_index("Stream"))
+
+    if series:
+        sentiment_over_time = pd.concat(series, ignore_index=True)
+        sentiment_over_time['timestamp'] = pd.to_datetime(sentiment_over_time['timestamp'], utc=True)
+        fig = px.line(
+            sentiment_over_time,
+            x='timestamp',
+            y='sentiment_score',
+            color='stream',
+            title="Average Sentiment per Stream (10-second intervals)"
+        )
+        fig.update_layout(xaxis_title="Time", yaxis_title="Sentiment Score (-1 to 1)", title_x=0.2)
+        st.plotly_chart(fig, width='stretch')
+
+
+#----MAIN DashBoard----
+
+st.title("🎮 Live YouTube Chat Sentiment Dashboard")
+
+# The stream bot.py started last is picked by default
+POINTER_FILE_NAME = get_csv_name()
+STREAMS = dict(list_streams())
+if POINTER_FILE_NAME and POINTER_FILE_NAME not in STREAMS:
+    STREAMS = {POINTER_FILE_NAME: stream_id_from_file(POINTER_FILE_NAME), **STREAMS}
+
+DATA_FILE_NAME = POINTER_FILE_NAME
+if STREAMS:
+    options = list(STREAMS)
+    DATA_FILE_NAME = st.sidebar.selectbox(
+        "Stream",
+        options,
+        index=options.index(POINTER_FILE_NAME) if POINTER_FILE_NAME in STREAMS else 0,
+        format_func=lambda data_file: stream_label(STREAMS, data_file),
+    )
+    COMPARE_FILES = st.sidebar.multiselect(
+        "Compare streams",
+        options,
+        format_func=lambda data_file: stream_label(STREAMS, data_file),
+    )
+else:
+    COMPARE_FILES = []
+STREAM_ID = STREAMS.get(DATA_FILE_NAME)
+
+st.info(f"Watching file: {DATA_FILE_NAME}")
+
+if not get_live_feed(STREAM_ID).connected:
+    st.caption("🔌 Not connected to the server's live feed, reading the saved file instead.")
+
+if len(COMPARE_FILES) > 1:
+    compare_section(COMPARE_FILES, STREAMS)
+
+metrics_section(DATA_FILE_NAME, STREAM_ID)
+charts_section(DATA_FILE_NAME, STREAM_ID)
+spam_waves_section(DATA_FILE_NAME, STREAM_ID)
+wordcloud_section(DATA_FILE_NAME, STREAM_ID)